@@ -0,0 +1,181 @@
+# standard
+import argparse
+import datetime
+import importlib
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+# local
+from synthetic_corpus import generate_title_sets
+
+# Matchers are imported from the scripts directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+
+##########
+# Inputs #
+##########
+
+BENCHMARK_RESULTS_DIRECTORY_PATH = "./data/benchmarks/"
+REFERENCE_MATCHER = "title_matching:match_titles"
+
+
+#########################
+# Classes and functions #
+#########################
+
+def get_timestamp_string() -> str:
+    """
+    Gives a standard current timestamp string to use in filenames.
+    """
+    timestamp_format = "%Y%m%d%H%M%S%Z"
+
+    timestamp = datetime.datetime.now(datetime.timezone.utc)
+    timestamp_string = datetime.datetime.strftime(timestamp, timestamp_format)
+    return timestamp_string
+
+
+def load_matcher(matcher_path: str):
+    """
+    Imports a matcher function given as module:function.
+    The function has to take ETIS projects and OpenAIRE graph projects like title_matching.match_titles
+    and give exact matches, approximate matches and fails.
+    """
+    module_name, function_name = matcher_path.split(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def get_decisions(exact_title_matches: list[dict], approximate_title_matches: list[dict]) -> dict[str, tuple]:
+    """
+    Gives the matching decision for each matched ETIS project: (match type, Horizon ID).
+    """
+    decisions = {match["GUID"]: ("EXACT", match["HORIZON_ID"]) for match in exact_title_matches}
+    decisions.update({match["GUID"]: ("APPROXIMATE", match["HORIZON_ID"]) for match in approximate_title_matches})
+    return decisions
+
+
+def run_matcher(matcher, title_sets: dict) -> dict:
+    """
+    Runs a matcher on the title sets. Measures time in one run and peak memory in another, because tracemalloc slows down the run.
+    """
+    start = time.perf_counter()
+    exact_title_matches, approximate_title_matches, _ = matcher(title_sets["ETIS_PROJECTS"], title_sets["OPENAIRE_GRAPH_PROJECTS"])
+    wall_seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    _ = matcher(title_sets["ETIS_PROJECTS"], title_sets["OPENAIRE_GRAPH_PROJECTS"])
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    run = {
+        "WALL_SECONDS": wall_seconds,
+        "PEAK_MEMORY_BYTES": peak_memory,
+        "DECISIONS": get_decisions(exact_title_matches, approximate_title_matches),
+    }
+    return run
+
+
+def get_precision_recall(decisions: dict[str, tuple], true_horizon_IDs: dict[str, str], match_type: str = None) -> tuple[float, float]:
+    """
+    Gives precision (share of matches that are correct) and recall (share of projects that are matched correctly).
+    Counts only matches of match_type if it's given.
+    """
+    matches = {GUID: horizon_ID for GUID, (decision_match_type, horizon_ID) in decisions.items() if match_type in (None, decision_match_type)}
+    n_correct = sum(true_horizon_IDs.get(GUID) == horizon_ID for GUID, horizon_ID in matches.items())
+    precision = n_correct / len(matches) if matches else None
+    recall = n_correct / len(true_horizon_IDs) if true_horizon_IDs else None
+    return precision, recall
+
+
+def format_results_table(results: list[dict]) -> str:
+    """
+    Gives benchmark results as a text table.
+    """
+    def format_value(value, scale: float = 1, decimals: int = 3) -> str:
+        return "-" if value is None else f'{value * scale:.{decimals}f}'
+
+    lines = [f'{"projects":>9} {"candidates":>10} {"matcher":<36} {"wall s":>9} {"peak MiB":>9} {"precision":>9} {"recall":>7} {"exact p":>8} {"exact r":>8} {"differs":>8}']
+    for result in results:
+        lines += [
+            f'{result["N_PROJECTS"]:>9} {result["N_CANDIDATES"]:>10} {result["MATCHER"][:36]:<36} '
+            f'{format_value(result["WALL_SECONDS"], decimals=2):>9} {format_value(result["PEAK_MEMORY_BYTES"], 1 / 2**20, 1):>9} '
+            f'{format_value(result["PRECISION"]):>9} {format_value(result["RECALL"]):>7} '
+            f'{format_value(result["EXACT_PRECISION"]):>8} {format_value(result["EXACT_RECALL"]):>8} {result["N_DECISION_DIFFERENCES"]:>8}']
+    return "\n".join(lines)
+
+
+#####################
+# Environment setup #
+#####################
+
+# Logger
+logger = logging.getLogger()
+logger.setLevel("INFO")
+logger.addHandler(logging.StreamHandler(sys.stdout))
+
+argument_parser = argparse.ArgumentParser(
+    description="Benchmark title matching on synthetic ETIS and OpenAIRE titles. "
+                "Compares the decisions of candidate matchers to the reference matcher.")
+_ = argument_parser.add_argument("--sizes", type=int, nargs="+", default=[100, 300, 1000], help="Numbers of ETIS projects to match.")
+_ = argument_parser.add_argument("--matchers", nargs="*", default=[], metavar="MODULE:FUNCTION", help=f'Candidate matchers to compare to {REFERENCE_MATCHER}.')
+_ = argument_parser.add_argument("--noise-rate", type=float, default=0.8, help="Share of OpenAIRE titles with an acronym, parenthesized word or hyphen tag around the title.")
+_ = argument_parser.add_argument("--near-duplicate-rate", type=float, default=0.1, help="Share of ETIS titles that have an OpenAIRE near duplicate with one word changed.")
+_ = argument_parser.add_argument("--seed", type=int, default=1913, help="Random seed of the title sets.")
+arguments = argument_parser.parse_args()
+
+
+##################
+# Run benchmarks #
+##################
+
+matchers = {matcher_path: load_matcher(matcher_path) for matcher_path in [REFERENCE_MATCHER] + arguments.matchers}
+
+benchmark_results = []
+for n_projects in arguments.sizes:
+    title_sets = generate_title_sets(n_projects, arguments.noise_rate, arguments.near_duplicate_rate, arguments.seed)
+
+    reference_decisions = None
+    for matcher_path, matcher in matchers.items():
+        info_string = f'Running {matcher_path} on {n_projects} projects'
+        logger.info(info_string)
+        run = run_matcher(matcher, title_sets)
+        if reference_decisions is None:
+            reference_decisions = run["DECISIONS"]
+
+        precision, recall = get_precision_recall(run["DECISIONS"], title_sets["TRUE_HORIZON_IDS"])
+        exact_precision, exact_recall = get_precision_recall(run["DECISIONS"], title_sets["TRUE_HORIZON_IDS"], "EXACT")
+        differing_GUIDs = sorted(GUID for GUID in run["DECISIONS"].keys() | reference_decisions.keys() if run["DECISIONS"].get(GUID) != reference_decisions.get(GUID))
+        benchmark_result = {
+            "N_PROJECTS": n_projects,
+            "N_CANDIDATES": len(title_sets["OPENAIRE_GRAPH_PROJECTS"]),
+            "MATCHER": matcher_path,
+            "WALL_SECONDS": run["WALL_SECONDS"],
+            "PEAK_MEMORY_BYTES": run["PEAK_MEMORY_BYTES"],
+            "PRECISION": precision,
+            "RECALL": recall,
+            "EXACT_PRECISION": exact_precision,
+            "EXACT_RECALL": exact_recall,
+            "N_DECISION_DIFFERENCES": len(differing_GUIDs),
+            "DIFFERING_DECISIONS": [{"GUID": GUID, "REFERENCE": reference_decisions.get(GUID), "CANDIDATE": run["DECISIONS"].get(GUID)} for GUID in differing_GUIDs],
+        }
+        benchmark_results += [benchmark_result]
+
+if not os.path.exists(BENCHMARK_RESULTS_DIRECTORY_PATH):
+    os.makedirs(BENCHMARK_RESULTS_DIRECTORY_PATH)
+
+benchmark_results_save_path = f'{BENCHMARK_RESULTS_DIRECTORY_PATH.strip("/")}/title_matching_benchmark_{get_timestamp_string()}.json'
+with open(benchmark_results_save_path, "w", encoding="utf8") as save_file:
+    save_file.write(json.dumps(benchmark_results, indent=2, ensure_ascii=False))
+
+logger.info(format_results_table(benchmark_results))
+info_string = f'Saved benchmark results to {benchmark_results_save_path}'
+logger.info(info_string)
+
+# A candidate matcher that changes any exact (100/85) or approximate (85/70) decision of the reference matcher fails the benchmark
+if any(result["N_DECISION_DIFFERENCES"] for result in benchmark_results):
+    info_string = "Candidate matchers made different decisions than the reference matcher"
+    logger.info(info_string)
+    sys.exit(1)
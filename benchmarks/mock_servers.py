@@ -0,0 +1,287 @@
+# standard
+import contextlib
+import http.server
+import json
+import random
+import threading
+import time
+import urllib.parse
+
+
+#############
+# Constants #
+#############
+
+# Paths that the API URL environment variables of the scripts are pointed to
+ETIS_PATH = "/etis/api"
+OPENAIRE_SEARCH_PATH = "/openaire/search"
+OPENAIRE_GRAPH_PATH = "/openaire/graph/v1"
+OPEN_ACCESS_BUTTON_PATH = "/oabutton"
+OPENALEX_PATH = "/openalex"
+FILES_PATH = "/files"
+MISSING_FILES_PATH = "/files/missing"      # Files under this path respond with 404
+SLOW_FILES_PATH = "/files/slow"            # Files under this path respond after SLOW_FILE_DELAY seconds
+SLOW_FILE_DELAY = 2                         # Seconds
+
+PDF_CONTENT = b"%PDF-1.4\n" + b"0" * 4096
+
+
+#########################
+# Classes and functions #
+#########################
+
+class MockApiServer:
+    """
+    Local stand-in for the ETIS, OpenAIRE search and graph, Open Access Button and OpenAlex APIs.
+    Serves a synthetic corpus with configurable latency, error rate and rate limit.
+    """
+    def __init__(self, corpus: dict, latency: float = 0, latency_jitter: float = 0, error_rate: float = 0,
+                 rate_limit: int = 10**9, rate_limit_window: float = 3600, seed: int = 1913) -> None:
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.rate_limit_window = rate_limit_window
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.window_start = time.monotonic()
+        self.n_window_requests = 0
+        self.n_requests = {}
+        self.n_active_file_requests = 0
+        self.max_active_file_requests = 0       # Highest number of simultaneous file requests, to check concurrency limits
+        self.http_server = None
+        self.base_URL = None
+
+        # Indexes for the filters that the scripts use
+        self.ETIS_projects_by_programme = {}
+        for project in corpus["ETIS_PROJECTS"]:
+            for programme in project["Programmes"]:
+                self.ETIS_projects_by_programme.setdefault(programme["ProgrammeCode"], []).append(project)
+        self.ETIS_publications_by_GUID = {publication["Guid"]: publication for publication in corpus["ETIS_PUBLICATIONS"]}
+        self.ETIS_publications_by_class_year = {}
+        for publication in corpus["ETIS_PUBLICATIONS"]:
+            key = (publication["ClassificationCode"], str(publication["PublishingYear"]))
+            self.ETIS_publications_by_class_year.setdefault(key, []).append(publication)
+
+        self.openaire_projects = corpus["OPENAIRE_PROJECTS"]
+        self.openaire_projects_by_field = {"grantID": {}, "acronym": {}, "name": {}}
+        for project in self.openaire_projects:
+            self.openaire_projects_by_field["grantID"].setdefault(project["code"], []).append(project)
+            self.openaire_projects_by_field["acronym"].setdefault(project["acronym"].lower(), []).append(project)
+            self.openaire_projects_by_field["name"].setdefault(project["title"].lower(), []).append(project)
+
+        self.open_access_button_records = corpus["OPEN_ACCESS_BUTTON_RECORDS"]
+        self.citation_counts = corpus["CITATION_COUNTS"]
+
+    def start(self) -> str:
+        """
+        Starts serving on a free local port in a background thread. Gives the base URL of the server.
+        """
+        handler_class = type("BoundMockApiHandler", (MockApiHandler,), {"api": self})
+        self.http_server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+        self.http_server.daemon_threads = True
+        self.base_URL = f'http://127.0.0.1:{self.http_server.server_address[1]}'
+        threading.Thread(target=self.http_server.serve_forever, daemon=True).start()
+        return self.base_URL
+
+    def stop(self) -> None:
+        """
+        Stops the server.
+        """
+        self.http_server.shutdown()
+        self.http_server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.stop()
+
+    def get_environment(self) -> dict:
+        """
+        Gives the environment variables that point the scripts to this server.
+        """
+        environment = {
+            "ETIS_API_URL": f'{self.base_URL}{ETIS_PATH}',
+            "OPENAIRE_SEARCH_API_URL": f'{self.base_URL}{OPENAIRE_SEARCH_PATH}',
+            "OPENAIRE_GRAPH_API_URL": f'{self.base_URL}{OPENAIRE_GRAPH_PATH}',
+            "OPEN_ACCESS_BUTTON_API_URL": f'{self.base_URL}{OPEN_ACCESS_BUTTON_PATH}',
+            "OPENALEX_API_URL": f'{self.base_URL}{OPENALEX_PATH}',
+        }
+        return environment
+
+    def admit_request(self, route: str) -> tuple[int, dict]:
+        """
+        Applies latency, rate limit and random errors to a request.
+        Gives the status code to respond with (None to serve the request normally) and rate limit headers.
+        """
+        with self.lock:
+            self.n_requests[route] = self.n_requests.get(route, 0) + 1
+            if time.monotonic() - self.window_start > self.rate_limit_window:
+                self.window_start = time.monotonic()
+                self.n_window_requests = 0
+            self.n_window_requests += 1
+            n_window_requests = self.n_window_requests
+            delay = self.latency + self.rng.uniform(0, self.latency_jitter)
+            is_error = self.rng.random() < self.error_rate
+
+        time.sleep(delay)
+        headers = {
+            "X-RateLimit-Limit": str(self.rate_limit),
+            "X-RateLimit-Used": str(n_window_requests),
+            "X-RateLimit-Remaining": str(max(self.rate_limit - n_window_requests, 0)),
+        }
+        if n_window_requests > self.rate_limit:
+            headers["Retry-After"] = str(round(self.rate_limit_window - (time.monotonic() - self.window_start)))
+            return 429, headers
+        if is_error:
+            return 503, headers
+        return None, headers
+
+    @contextlib.contextmanager
+    def track_file_request(self):
+        """
+        Counts the file requests that are being served at the same time.
+        """
+        with self.lock:
+            self.n_active_file_requests += 1
+            self.max_active_file_requests = max(self.max_active_file_requests, self.n_active_file_requests)
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.n_active_file_requests -= 1
+
+    def get_ETIS_items(self, service: str, parameters: dict) -> list[dict]:
+        """
+        Gives a page of ETIS items filtered like the getitems endpoint.
+        """
+        if service == "project":
+            items = self.ETIS_projects_by_programme.get(parameters.get("ProgrammeCode"), [])
+            items = [item for item in items if str(item["ProjectStatus"]) == parameters.get("ProjectStatus", str(item["ProjectStatus"]))]
+        elif "Guid" in parameters:
+            item = self.ETIS_publications_by_GUID.get(parameters["Guid"])
+            items = [item] if item else []
+        else:
+            items = self.ETIS_publications_by_class_year.get((parameters.get("ClassificationCode"), parameters.get("PublishingYear")), [])
+
+        i_start = int(parameters.get("Skip", 0))
+        n = int(parameters.get("Take", 1))
+        return items[i_start:i_start + n]
+
+    def get_openaire_search_results(self, parameters: dict) -> dict:
+        """
+        Gives OpenAIRE search API projects response in its JSON format.
+        """
+        projects = []
+        for field, projects_index in self.openaire_projects_by_field.items():
+            if field in parameters:
+                value = parameters[field] if field == "grantID" else parameters[field].lower()
+                projects = projects_index.get(value, [])
+
+        results = [{"metadata": {"oaf:entity": {"oaf:project": {"code": {"$": project["code"]}}}}} for project in projects]
+        response = {
+            "response": {
+                "header": {"total": {"$": len(results)}},
+                "results": {"result": results} if results else None
+            }
+        }
+        return response
+
+    def get_openaire_graph_page(self, parameters: dict) -> dict:
+        """
+        Gives a page of OpenAIRE graph API projects.
+        """
+        i_page = int(parameters.get("page", 1))
+        n_per_page = int(parameters.get("pageSize", 10))
+        projects = self.openaire_projects[(i_page - 1) * n_per_page:i_page * n_per_page]
+        response = {
+            "header": {"numFound": len(self.openaire_projects), "page": i_page, "pageSize": n_per_page},
+            "results": projects
+        }
+        return response
+
+    def find_open_access(self, ID: str) -> dict:
+        """
+        Gives Open Access Button find response for a DOI, URL or title.
+        """
+        record = self.open_access_button_records.get(ID.strip().lower())
+        if not record:
+            return {}
+        return {**record, "url": f'{self.base_URL}{record["url"]}'}
+
+    def get_openalex_works(self, parameters: dict) -> dict:
+        """
+        Gives OpenAlex works response for a doi:<DOI>|<DOI>|... filter.
+        """
+        DOIs = parameters.get("filter", "").removeprefix("doi:").split("|")
+        results = [{"doi": f'https://doi.org/{DOI}', "cited_by_count": self.citation_counts[DOI]} for DOI in DOIs if DOI in self.citation_counts]
+        return {"meta": {"count": len(results)}, "results": results}
+
+
+class MockApiHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Routes requests to the mock APIs.
+    """
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately. Without this, delayed ACKs add ~40 ms to every keep-alive request.
+    disable_nagle_algorithm = True
+    api: MockApiServer = None
+
+    def log_message(self, *_) -> None:
+        pass
+
+    def send_body(self, status_code: int, body: bytes, content_type: str, headers: dict = None, include_body: bool = True) -> None:
+        self.send_response(status_code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if include_body:
+            self.wfile.write(body)
+
+    def send_JSON(self, data, headers: dict) -> None:
+        self.send_body(200, json.dumps(data).encode(), "application/json", headers)
+
+    def do_HEAD(self) -> None:
+        self.do_GET(include_body=False)
+
+    def do_GET(self, include_body: bool = True) -> None:
+        URL = urllib.parse.urlsplit(self.path)
+        parameters = {key: values[-1] for key, values in urllib.parse.parse_qs(URL.query).items()}
+
+        if URL.path.startswith(FILES_PATH):
+            with self.api.track_file_request():
+                self.api.admit_request("files")
+                if URL.path.startswith(SLOW_FILES_PATH):
+                    time.sleep(SLOW_FILE_DELAY)
+            if URL.path.startswith(MISSING_FILES_PATH):
+                self.send_body(404, b"Not found", "text/plain", include_body=include_body)
+            else:
+                self.send_body(200, PDF_CONTENT, "application/pdf", include_body=include_body)
+            return
+
+        route = next((path for path in [ETIS_PATH, OPENAIRE_SEARCH_PATH, OPENAIRE_GRAPH_PATH, OPEN_ACCESS_BUTTON_PATH, OPENALEX_PATH] if URL.path.startswith(path)), None)
+        if not route:
+            self.send_body(404, b"Not found", "text/plain", include_body=include_body)
+            return
+
+        status_code, headers = self.api.admit_request(route)
+        if status_code:
+            self.send_body(status_code, b"{}", "application/json", headers, include_body)
+            return
+
+        if route == ETIS_PATH:
+            # /etis/api/<service>/getitems
+            service = URL.path[len(ETIS_PATH):].strip("/").split("/")[0]
+            self.send_JSON(self.api.get_ETIS_items(service, parameters), headers)
+        elif route == OPENAIRE_SEARCH_PATH:
+            self.send_JSON(self.api.get_openaire_search_results(parameters), headers)
+        elif route == OPENAIRE_GRAPH_PATH:
+            self.send_JSON(self.api.get_openaire_graph_page(parameters), headers)
+        elif route == OPENALEX_PATH:
+            self.send_JSON(self.api.get_openalex_works(parameters), headers)
+        else:
+            self.send_JSON(self.api.find_open_access(parameters.get("id", "")), headers)
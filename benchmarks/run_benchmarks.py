@@ -0,0 +1,244 @@
+# standard
+import argparse
+import datetime
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+# local
+from mock_servers import MockApiServer
+from synthetic_corpus import generate_corpus
+
+
+##########
+# Inputs #
+##########
+
+BENCHMARK_RESULTS_DIRECTORY_PATH = "./data/benchmarks/"
+SCRIPTS_DIRECTORY_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+# Scripts in the order they depend on each other's outputs
+BENCHMARK_SCRIPTS = [
+    "get_data",                                 # Harvest ETIS and Open Access Button, verify URLs, summarise
+    "get_openaire_graph_projects",              # Harvest OpenAIRE graph
+    "get_openaire_search_project_results",      # Harvest OpenAIRE search
+    "get_etis_project_horizon_ids",             # Match ETIS projects to Horizon IDs
+    "get_citation_counts",                      # Look up citation counts of the DOIs in open access data
+    "analyse_data",                             # Analyse open access data
+]
+
+# Histograms that give the per-item latency of a stage
+LATENCY_HISTOGRAMS = ["http_request_duration_seconds", "title_match_duration_seconds"]
+
+
+#########################
+# Classes and functions #
+#########################
+
+def get_timestamp_string() -> str:
+    """
+    Gives a standard current timestamp string to use in filenames.
+    """
+    timestamp_format = "%Y%m%d%H%M%S%Z"
+
+    timestamp = datetime.datetime.now(datetime.timezone.utc)
+    timestamp_string = datetime.datetime.strftime(timestamp, timestamp_format)
+    return timestamp_string
+
+
+def get_histogram_quantile(histograms: list[dict], quantile: float) -> float:
+    """
+    Estimates a quantile from histograms with the same buckets, the way Prometheus histogram_quantile does.
+    Interpolates linearly within the bucket that the quantile falls into.
+    Gives None if the histograms are empty.
+    """
+    if not histograms:
+        return None
+    buckets = histograms[0]["BUCKETS"]
+    bucket_counts = [sum(counts) for counts in zip(*(histogram["BUCKET_COUNTS"] for histogram in histograms))]
+    n_total = sum(bucket_counts)
+    if not n_total:
+        return None
+
+    rank = quantile * n_total
+    cumulative_count = 0
+    for i, bucket_count in enumerate(bucket_counts):
+        if cumulative_count + bucket_count >= rank:
+            # Values above the largest bucket are reported as the largest bucket bound
+            if i == len(buckets):
+                return buckets[-1]
+            lower_bound = buckets[i - 1] if i > 0 else 0
+            return lower_bound + (buckets[i] - lower_bound) * (rank - cumulative_count) / bucket_count
+        cumulative_count += bucket_count
+    return buckets[-1]
+
+
+def read_latest_metrics(work_dir_path: str, script: str) -> dict:
+    """
+    Reads the latest metrics file that the script saved in the benchmark working directory.
+    Gives None if there is no such file.
+    """
+    metrics_dir_path = os.path.join(work_dir_path, "data", "metrics")
+    if not os.path.exists(metrics_dir_path):
+        return None
+    name_pattern = script + r'_metrics_(\d+)\w*\.json$'
+    files = sorted(file for file in os.listdir(metrics_dir_path) if re.match(name_pattern, file))
+    if not files:
+        return None
+    with open(os.path.join(metrics_dir_path, files[-1]), encoding="utf8") as read_file:
+        return json.loads(read_file.read())
+
+
+def get_stage_results(run_metrics: dict, n_projects: int) -> list[dict]:
+    """
+    Gives throughput, p50/p99 latency and peak memory of each stage in the metrics of a script run.
+    Throughput is given in corpus projects per second, so that stages of different scripts can be compared.
+    """
+    stage_results = []
+    for stage in run_metrics["STAGES"]:
+        histograms = [histogram for histogram in run_metrics["HISTOGRAMS"] if histogram["NAME"] in LATENCY_HISTOGRAMS and histogram["LABELS"].get("stage") == stage["NAME"]]
+        n_requests = sum(counter["VALUE"] for counter in run_metrics["COUNTERS"] if counter["NAME"] == "http_requests_total" and counter["LABELS"].get("stage") == stage["NAME"])
+        stage_result = {
+            "STAGE": stage["NAME"],
+            "WALL_SECONDS": stage["WALL_SECONDS"],
+            "CPU_SECONDS": stage["CPU_SECONDS"],
+            "PROJECTS_PER_SECOND": n_projects / stage["WALL_SECONDS"] if stage["WALL_SECONDS"] else None,
+            "N_REQUESTS": n_requests,
+            "P50_LATENCY_SECONDS": get_histogram_quantile(histograms, 0.5),
+            "P99_LATENCY_SECONDS": get_histogram_quantile(histograms, 0.99),
+            "PEAK_MEMORY_BYTES": stage.get("PEAK_MEMORY_BYTES"),
+        }
+        stage_results += [stage_result]
+    return stage_results
+
+
+def run_benchmark(n_projects: int, arguments: argparse.Namespace) -> list[dict]:
+    """
+    Runs the scripts against a mock server that serves a synthetic corpus of n_projects projects.
+    Scripts run in a temporary working directory, so that they don't touch the real data.
+    """
+    corpus = generate_corpus(n_projects, arguments.seed)
+    info_string = f'Generated corpus of {n_projects} projects, {len(corpus["ETIS_PUBLICATIONS"])} publications and {len(corpus["OPENAIRE_PROJECTS"])} OpenAIRE projects'
+    logger.info(info_string)
+
+    work_dir_path = tempfile.mkdtemp(prefix=f'horizon_analyzer_benchmark_{n_projects}_')
+    raw_data_dir_path = os.path.join(work_dir_path, "data", "raw")
+    os.makedirs(raw_data_dir_path)
+
+    mock_server = MockApiServer(
+        corpus,
+        latency=arguments.latency,
+        latency_jitter=arguments.latency_jitter,
+        error_rate=arguments.error_rate,
+        rate_limit=arguments.rate_limit,
+        seed=arguments.seed)
+
+    results = []
+    with mock_server:
+        environment = {
+            **os.environ,
+            **mock_server.get_environment(),
+            "OPEN_ACCESS_BUTTON_REQUESTS_PER_SECOND_LIMIT": str(arguments.requests_per_second),
+            "VERIFY_OPEN_ACCESS_BUTTON_URLS": "1",
+            "HORIZON_ANALYZER_PROFILE": "memory",
+        }
+        for script in arguments.scripts:
+            info_string = f'Running {script} on {n_projects} projects'
+            logger.info(info_string)
+            log_path = os.path.join(work_dir_path, f'{script}.log')
+            start = time.perf_counter()
+            try:
+                with open(log_path, "w", encoding="utf8") as log_file:
+                    completed_process = subprocess.run(
+                        [sys.executable, os.path.join(SCRIPTS_DIRECTORY_PATH, f'{script}.py')],
+                        cwd=work_dir_path, env=environment, stdout=log_file, stderr=subprocess.STDOUT, timeout=arguments.timeout)
+                exit_code = completed_process.returncode
+            except subprocess.TimeoutExpired:
+                exit_code = "timeout"
+            wall_seconds = time.perf_counter() - start
+
+            run_metrics = read_latest_metrics(work_dir_path, script)
+            if exit_code != 0 or not run_metrics:
+                info_string = f'{script} failed ({exit_code}) after {wall_seconds:.1f} s. See {log_path}'
+                logger.info(info_string)
+                results += [{"N_PROJECTS": n_projects, "SCRIPT": script, "STAGE": None, "ERROR": f'exit code {exit_code}', "WALL_SECONDS": wall_seconds}]
+                continue
+
+            for stage_result in get_stage_results(run_metrics, n_projects):
+                results += [{"N_PROJECTS": n_projects, "SCRIPT": script, **stage_result}]
+
+    if arguments.keep:
+        info_string = f'Kept benchmark working directory {work_dir_path}'
+        logger.info(info_string)
+    else:
+        shutil.rmtree(work_dir_path)
+    return results
+
+
+def format_results_table(results: list[dict]) -> str:
+    """
+    Gives benchmark results as a text table.
+    """
+    def format_value(value, scale: float = 1, decimals: int = 1) -> str:
+        return "-" if value is None else f'{value * scale:.{decimals}f}'
+
+    lines = [f'{"projects":>9} {"stage":<36} {"wall s":>9} {"cpu s":>9} {"projects/s":>11} {"requests":>9} {"p50 ms":>8} {"p99 ms":>8} {"peak MiB":>9}']
+    for result in results:
+        if result.get("ERROR"):
+            lines += [f'{result["N_PROJECTS"]:>9} {result["SCRIPT"]:<36} {result["ERROR"]}']
+            continue
+        lines += [
+            f'{result["N_PROJECTS"]:>9} {result["STAGE"][:36]:<36} '
+            f'{format_value(result["WALL_SECONDS"], decimals=2):>9} {format_value(result["CPU_SECONDS"], decimals=2):>9} '
+            f'{format_value(result["PROJECTS_PER_SECOND"]):>11} {result["N_REQUESTS"]:>9} '
+            f'{format_value(result["P50_LATENCY_SECONDS"], 1000, 2):>8} {format_value(result["P99_LATENCY_SECONDS"], 1000, 2):>8} '
+            f'{format_value(result["PEAK_MEMORY_BYTES"], 1 / 2**20):>9}']
+    return "\n".join(lines)
+
+
+#####################
+# Environment setup #
+#####################
+
+# Logger
+logger = logging.getLogger()
+logger.setLevel("INFO")
+logger.addHandler(logging.StreamHandler(sys.stdout))
+
+argument_parser = argparse.ArgumentParser(description="Benchmark the pipeline scripts against local mock APIs with synthetic data.")
+_ = argument_parser.add_argument("--sizes", type=int, nargs="+", default=[1000], help="Numbers of projects in the synthetic corpora, e.g. 1000 10000 100000.")
+_ = argument_parser.add_argument("--scripts", nargs="+", default=BENCHMARK_SCRIPTS, choices=BENCHMARK_SCRIPTS, help="Scripts to benchmark.")
+_ = argument_parser.add_argument("--latency", type=float, default=0.002, help="Mock API response latency in seconds.")
+_ = argument_parser.add_argument("--latency-jitter", type=float, default=0.002, help="Random extra latency in seconds, up to this value.")
+_ = argument_parser.add_argument("--error-rate", type=float, default=0, help="Share of mock API requests that fail with 503.")
+_ = argument_parser.add_argument("--rate-limit", type=int, default=10**9, help="Mock API requests per hour before responding 429.")
+_ = argument_parser.add_argument("--requests-per-second", type=float, default=1000, help="Open Access Button request rate limit of get_data.py.")
+_ = argument_parser.add_argument("--timeout", type=float, default=3600, help="Seconds after which a script is stopped.")
+_ = argument_parser.add_argument("--seed", type=int, default=1913, help="Random seed of the synthetic corpus.")
+_ = argument_parser.add_argument("--keep", action="store_true", help="Keep the working directories with script outputs and logs.")
+arguments = argument_parser.parse_args()
+
+
+##################
+# Run benchmarks #
+##################
+
+benchmark_results = []
+for n_projects in arguments.sizes:
+    benchmark_results += run_benchmark(n_projects, arguments)
+
+if not os.path.exists(BENCHMARK_RESULTS_DIRECTORY_PATH):
+    os.makedirs(BENCHMARK_RESULTS_DIRECTORY_PATH)
+
+benchmark_results_save_path = f'{BENCHMARK_RESULTS_DIRECTORY_PATH.strip("/")}/benchmark_results_{get_timestamp_string()}.json'
+with open(benchmark_results_save_path, "w", encoding="utf8") as save_file:
+    save_file.write(json.dumps(benchmark_results, indent=2, ensure_ascii=False))
+
+logger.info(format_results_table(benchmark_results))
+info_string = f'Saved benchmark results to {benchmark_results_save_path}'
+logger.info(info_string)
@@ -0,0 +1,224 @@
+# standard
+import random
+import uuid
+
+
+#############
+# Constants #
+#############
+
+ETIS_HORIZON_PROGRAM_CODES = ["136", "137", "442", "443", "450", "451"]
+CLASSIFICATION_CODE_WEIGHTS = {
+    "1.1.": 60,     # Web of Science & Scopus scientific articles
+    "1.2.": 15,     # Other international scientific articles
+    "1.3.": 5,      # Scientific articles in Estonian journals
+    "3.1.": 20,     # Not a scientific article (conference proceedings)
+}
+PUBLISHING_YEARS = range(2015, 2025)
+TITLE_WORDS = [
+    "adaptive", "analysis", "arctic", "baltic", "battery", "biodiversity", "biomarkers", "carbon", "cells", "circular",
+    "climate", "cognitive", "coastal", "computing", "data", "deep", "design", "detection", "digital", "diseases",
+    "distributed", "ecosystems", "education", "efficient", "energy", "environmental", "europe", "evolution", "food", "forest",
+    "functional", "genomic", "governance", "green", "health", "hydrogen", "immune", "industrial", "infrastructure", "innovation",
+    "integrated", "intelligent", "learning", "materials", "medicine", "methods", "microbial", "mobility", "models", "molecular",
+    "networks", "novel", "ocean", "optical", "personalised", "plant", "policy", "precision", "quantum", "renewable",
+    "resilient", "robotics", "rural", "security", "sensors", "smart", "social", "soil", "storage", "sustainable",
+    "systems", "technologies", "therapies", "transition", "urban", "water", "wireless", "youth",
+]
+PERIODICALS = [
+    "Nature Communications", "Scientific Reports", "PLOS ONE", "Physical Review B", "Journal of Cleaner Production",
+    "Energies", "Sustainability", "Proceedings of the Estonian Academy of Sciences", "Baltic Forestry", "Trames",
+]
+HYPHEN_TAGS = ["H2020", "HORIZON", "ERC", "MSCA", "COST", "EIT"]
+NOISE_TYPES = ["none", "acronym_prefix", "parenthesized_prefix", "parenthesized_suffix", "hyphen_tag", "typo"]
+
+
+#########################
+# Classes and functions #
+#########################
+
+def get_GUID(rng: random.Random) -> str:
+    """
+    Gives a random but reproducible GUID.
+    """
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def get_title(rng: random.Random, min_words: int = 4, max_words: int = 10) -> str:
+    """
+    Gives a random research title.
+    """
+    words = rng.sample(TITLE_WORDS, rng.randint(min_words, max_words))
+    return " ".join(words).capitalize()
+
+
+def get_acronym(rng: random.Random) -> str:
+    """
+    Gives a random project acronym.
+    """
+    return "".join(rng.choice("ABCDEFGHIJKLMNOPRSTUVWXYZ") for _ in range(rng.randint(3, 7)))
+
+
+def get_noisy_title(title: str, acronym: str, rng: random.Random, noise_weights: dict = None) -> str:
+    """
+    Gives the title the way another database could report it:
+    with an acronym prefix, a parenthesized prefix or suffix, a hyphen tag, a typo or unchanged.
+    Noise types are picked by noise_weights (noise type: weight), with equal weights by default.
+    """
+    noise_weights = noise_weights or {noise_type: 1 for noise_type in NOISE_TYPES}
+    noise_type = rng.choices(list(noise_weights), weights=list(noise_weights.values()))[0]
+    if noise_type == "acronym_prefix":
+        return f'{acronym}{rng.choice([" - ", ": ", " – "])}{title}'
+    if noise_type == "parenthesized_prefix":
+        return f'({acronym}) {title}'
+    if noise_type == "parenthesized_suffix":
+        return f'{title} ({acronym})'
+    if noise_type == "hyphen_tag":
+        return f'{title} - {rng.choice(HYPHEN_TAGS)}'
+    if noise_type == "typo":
+        # Swap two neighbouring letters of a word. Typos are not removed by title cleaning, so they lower the match score.
+        words = title.split()
+        i_word = rng.randrange(len(words))
+        if len(words[i_word]) >= 4:
+            i_letter = rng.randrange(len(words[i_word]) - 1)
+            word = words[i_word]
+            words[i_word] = word[:i_letter] + word[i_letter + 1] + word[i_letter] + word[i_letter + 2:]
+        return " ".join(words)
+    return title
+
+
+def get_DOI_variant(DOI: str, rng: random.Random) -> str:
+    """
+    Gives the DOI in one of the formats found in ETIS data.
+    """
+    return rng.choice([DOI, DOI, f'https://doi.org/{DOI}', f'http://dx.doi.org/{DOI}', f'DOI: {DOI}'])
+
+
+def generate_corpus(n_projects: int, seed: int = 1913) -> dict:
+    """
+    Generates a synthetic corpus of ETIS projects and publications and the matching OpenAIRE and Open Access Button data.
+    OpenAIRE has a record with a noisy title for most ETIS projects, plus unrelated projects.
+    Open Access Button finds a URL for part of the publications that have a DOI.
+    Most DOIs have a long-tailed citation count.
+    """
+    rng = random.Random(seed)
+
+    ETIS_projects = []
+    ETIS_publications = []
+    openaire_projects = []
+    open_access_button_records = {}
+    # Citation counts have their own random generator, so that they don't change the rest of the corpus
+    citation_rng = random.Random(seed + 1)
+    citation_counts = {}
+    for i_project in range(n_projects):
+        grant_ID = str(100000 + i_project)
+        acronym = get_acronym(rng)
+        title = get_title(rng)
+
+        # Some publications are reported under several projects
+        shared_publication_GUIDs = [rng.choice(ETIS_publications)["Guid"]] if ETIS_publications and rng.random() < 0.1 else []
+        publication_GUIDs = [get_GUID(rng) for _ in range(rng.choice([0, 1, 1, 2, 3, 5]))]
+        for publication_GUID in publication_GUIDs:
+            i_publication = len(ETIS_publications)
+            DOI = f'10.5555/bench.{i_publication}' if rng.random() < 0.85 else None
+            is_open_access = rng.random() < 0.7
+            publication = {
+                "Guid": publication_GUID,
+                "Title": get_title(rng, 6, 14),
+                "Periodical": rng.choice(PERIODICALS),
+                "Doi": get_DOI_variant(DOI, rng) if DOI else None,
+                "Url": f'https://example.org/articles/{i_publication}' if rng.random() < 0.3 else None,
+                "ClassificationCode": rng.choices(list(CLASSIFICATION_CODE_WEIGHTS), weights=list(CLASSIFICATION_CODE_WEIGHTS.values()))[0],
+                "PublishingYear": rng.choice(PUBLISHING_YEARS),
+                "PublicationStatusEng": "Published" if rng.random() < 0.95 else "Accepted",
+                "IsOpenAccessEng": "Yes" if is_open_access else "No",
+                "OpenAccessTypeNameEng": rng.choice(["Gold", "Green", "Hybrid"]) if is_open_access else None,
+                "OpenAccessLicenceNameEng": "CC BY 4.0" if is_open_access else None,
+                "PublicFile": rng.random() < 0.2,
+            }
+            ETIS_publications += [publication]
+            if DOI and rng.random() < (0.8 if is_open_access else 0.2):
+                open_access_button_records[DOI] = {"url": f'/files/{i_publication}.pdf'}
+            if DOI and citation_rng.random() < 0.9:
+                citation_counts[DOI] = int((citation_rng.paretovariate(1.5) - 1) * (8 if is_open_access else 5))
+
+        ETIS_projects += [{
+            "Guid": get_GUID(rng),
+            "TitleEng": title,
+            "Acronym": acronym,
+            "FinancierProjectNr": grant_ID if rng.random() < 0.6 else None,
+            "ProjectStatus": 3,
+            "Programmes": [{"ProgrammeCode": rng.choice(ETIS_HORIZON_PROGRAM_CODES)}],
+            "Publications": [{"Guid": GUID} for GUID in publication_GUIDs + shared_publication_GUIDs],
+        }]
+
+        if rng.random() < 0.8:
+            openaire_projects += [{
+                "id": f'corda__h2020::{grant_ID}',
+                "code": grant_ID,
+                "acronym": acronym,
+                "title": get_noisy_title(title, acronym, rng),
+            }]
+
+    # Projects of other countries' partners that have no ETIS counterpart
+    for i_project in range(n_projects // 5):
+        grant_ID = str(900000 + i_project)
+        openaire_projects += [{
+            "id": f'corda__h2020::{grant_ID}',
+            "code": grant_ID,
+            "acronym": get_acronym(rng),
+            "title": get_title(rng),
+        }]
+    rng.shuffle(openaire_projects)
+
+    corpus = {
+        "ETIS_PROJECTS": ETIS_projects,
+        "ETIS_PUBLICATIONS": ETIS_publications,
+        "OPENAIRE_PROJECTS": openaire_projects,
+        "OPEN_ACCESS_BUTTON_RECORDS": open_access_button_records,
+        "CITATION_COUNTS": citation_counts,
+    }
+    return corpus
+
+
+def generate_title_sets(n_projects: int, noise_rate: float = 0.8, near_duplicate_rate: float = 0.1, seed: int = 1913) -> dict:
+    """
+    Generates ETIS project titles and OpenAIRE graph project titles for benchmarking title matching.
+    Each ETIS project has an OpenAIRE counterpart, which has noise around the title with probability noise_rate.
+    OpenAIRE also has unrelated projects and near duplicates (one word changed) of some ETIS titles that make matching ambiguous.
+    Gives the projects and the true Horizon ID of each ETIS project.
+    """
+    rng = random.Random(seed)
+    noisy_weights = {noise_type: 1 for noise_type in NOISE_TYPES if noise_type != "none"}
+
+    ETIS_projects = []
+    openaire_graph_projects = []
+    true_horizon_IDs = {}
+    for i_project in range(n_projects):
+        grant_ID = str(100000 + i_project)
+        acronym = get_acronym(rng)
+        title = get_title(rng)
+        GUID = get_GUID(rng)
+        ETIS_projects += [{"Guid": GUID, "TitleEng": title}]
+        true_horizon_IDs[GUID] = grant_ID
+
+        openaire_title = get_noisy_title(title, acronym, rng, noisy_weights) if rng.random() < noise_rate else title
+        openaire_graph_projects += [{"id": f'corda__h2020::{grant_ID}', "code": grant_ID, "title": openaire_title}]
+
+        if rng.random() < near_duplicate_rate:
+            words = title.lower().split()
+            words[rng.randrange(len(words))] = rng.choice(TITLE_WORDS)
+            near_duplicate_grant_ID = str(500000 + i_project)
+            openaire_graph_projects += [{"id": f'corda__h2020::{near_duplicate_grant_ID}', "code": near_duplicate_grant_ID, "title": " ".join(words).capitalize()}]
+
+    for i_project in range(n_projects // 5):
+        grant_ID = str(900000 + i_project)
+        openaire_graph_projects += [{"id": f'corda__h2020::{grant_ID}', "code": grant_ID, "title": get_title(rng)}]
+    rng.shuffle(openaire_graph_projects)
+
+    title_sets = {
+        "ETIS_PROJECTS": ETIS_projects,
+        "OPENAIRE_GRAPH_PROJECTS": openaire_graph_projects,
+        "TRUE_HORIZON_IDS": true_horizon_IDs,
+    }
+    return title_sets
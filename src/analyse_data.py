@@ -1,52 +1,144 @@
 # standard
-import json
 import logging
-import sys
+# external
+import polars
+# local
+import metrics
+from common import setup_logger
+from columnar_storage import get_latest_file_path, read_latest_table
 
 
 ##########
 # Inputs #
 ##########
 
-OPEN_ACCESS_DATA_PATH = "./data/results/open_access_data_20250112182245UTC.json"
+RESULTS_DATA_DIRECTORY_PATH = "./data/results/"
+METRICS_DIRECTORY_PATH = "./data/metrics/"
+
+
+#########################
+# Classes and functions #
+#########################
+
+def is_open() -> polars.Expr:
+    """
+    Expression that decides whether publication is open to read.
+    """
+    manually_checked = polars.col("IS_AVAILABLE_MANUALLY_CHECKED")
+    has_oa_button_URL = polars.col("OA_BUTTON_URL").fill_null("") != ""
+
+    # Publication is open if it is manually verified that it's open
+    is_open_manually_checked = manually_checked.fill_null(False)
+
+    # Publication is open if ETIS and Open Access Button both say that it's open and there is no manually checked info
+    is_open_by_sources = manually_checked.is_null() & has_oa_button_URL & polars.col("IS_OPEN_ACCESS")
+
+    return is_open_manually_checked | is_open_by_sources
 
 
 #####################
 # Environment setup #
 #####################
 
-# Logger
 logger = logging.getLogger()
-logger.setLevel("INFO")
-logger.addHandler(logging.StreamHandler(sys.stdout))
 
 
 #############
 # Load data #
 #############
 
-with open(OPEN_ACCESS_DATA_PATH, encoding="utf8") as read_file:
-    open_access_data = json.loads(read_file.read())
+def load_open_access_data() -> tuple[polars.DataFrame, bool]:
+    """
+    Gives the latest open access data with citation counts, if there are any, and whether there are citation counts.
+    """
+    with metrics.stage("load_open_access_data"):
+        # Load only the columns used in the analysis
+        open_access_data = read_latest_table(
+            RESULTS_DATA_DIRECTORY_PATH,
+            "open_access_data",
+            columns=["GUID", "CLUSTER_ID", "DOI", "IS_OPEN_ACCESS", "OA_BUTTON_URL", "IS_AVAILABLE_MANUALLY_CHECKED"])
+
+        # Files saved before duplicate clustering have no CLUSTER_ID, so each GUID is its own cluster
+        if "CLUSTER_ID" not in open_access_data.columns:
+            open_access_data = open_access_data.with_columns(polars.col("GUID").alias("CLUSTER_ID"))
+
+        # Citation counts are optional. They are added by get_citation_counts.
+        has_citation_counts = bool(get_latest_file_path(RESULTS_DATA_DIRECTORY_PATH, "citation_counts", "json"))
+        if has_citation_counts:
+            citation_counts = read_latest_table(RESULTS_DATA_DIRECTORY_PATH, "citation_counts", columns=["DOI", "CITATION_COUNT"])
+            # DOI columns with no values have no type, so they are cast to strings for the join
+            open_access_data = open_access_data.with_columns(polars.col("DOI").cast(polars.String)).join(
+                citation_counts.with_columns(polars.col("DOI").cast(polars.String)),
+                on="DOI",
+                how="left")
+        else:
+            open_access_data = open_access_data.with_columns(polars.lit(None, dtype=polars.Int64).alias("CITATION_COUNT"))
+
+    return open_access_data, has_citation_counts
 
 
 ################
 # Analyse data #
 ################
 
-publications_open = []
-publications_not_open = []
-for publication in open_access_data:
-    # Publication is open if it is manually verified that it's open
-    if publication["IS_AVAILABLE_MANUALLY_CHECKED"]:
-        publications_open += [publication]
-        continue
+def analyse_open_access_data(open_access_data: polars.DataFrame, has_citation_counts: bool) -> None:
+    """
+    Logs the share of publications that are open to read and compares citation counts of open and not open publications.
+    """
+    with metrics.stage("analyse_open_access_data"):
+        # Same publication can be reported under several GUIDs. Count each cluster of duplicates once.
+        # Publication is open if any of its duplicate records says it's open
+        publications = (
+            open_access_data
+            .with_columns(is_open().alias("IS_OPEN"))
+            .group_by("CLUSTER_ID")
+            .agg(
+                polars.col("IS_OPEN").any(),
+                # Only some of the duplicate records of a publication may have a DOI
+                polars.col("CITATION_COUNT").max()))
 
-    # Publication is open if ETIS and Open Access Button both say that it's open and there is no manually checked info
-    if publication["IS_AVAILABLE_MANUALLY_CHECKED"] is None and publication["OA_BUTTON_URL"] and publication["IS_OPEN_ACCESS"]:
-        publications_open += [publication]
-        continue
+        n_publications = publications.height
+        n_publications_open = publications["IS_OPEN"].sum()
+
+        info_string = f'{n_publications_open} of {n_publications} publications ({round(n_publications_open / n_publications * 100)}%) are open to read. {open_access_data.height} GUIDs were collapsed into {n_publications} distinct publications'
+        logger.info(info_string)
+
+        # Compare citation counts of open and not open publications
+        if has_citation_counts:
+            citations_by_openness = (
+                publications
+                .group_by("IS_OPEN")
+                .agg(
+                    polars.col("CITATION_COUNT").count().alias("N_WITH_CITATION_COUNT"),
+                    polars.col("CITATION_COUNT").mean().alias("MEAN_CITATION_COUNT"),
+                    polars.col("CITATION_COUNT").median().alias("MEDIAN_CITATION_COUNT"))
+                .sort("IS_OPEN", descending=True))
+
+            for row in citations_by_openness.iter_rows(named=True):
+                if not row["N_WITH_CITATION_COUNT"]:
+                    continue
+                info_string = f'{"Open" if row["IS_OPEN"] else "Not open"} publications are cited {row["MEAN_CITATION_COUNT"]:.1f} times on average (median {row["MEDIAN_CITATION_COUNT"]:.0f}, {row["N_WITH_CITATION_COUNT"]} publications with citation counts)'
+                logger.info(info_string)
+
+
+########
+# Main #
+########
+
+def main() -> None:
+    """
+    Analyses the latest open access data.
+    """
+    setup_logger()
+
+    try:
+        open_access_data, has_citation_counts = load_open_access_data()
+        analyse_open_access_data(open_access_data, has_citation_counts)
+    finally:
+        metrics_save_path = metrics.save(METRICS_DIRECTORY_PATH, "analyse_data")
+        info_string = f'Saved run metrics to {metrics_save_path}'
+        logger.info(info_string)
 
-    publications_not_open += [publication]
 
-info_string = f'{len(publications_open)} of {len(open_access_data)} publications ({round(len(publications_open) / len(open_access_data) * 100)}%) are open to read'
-logger.info(info_string)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# standard
+import gzip
+import json
+import logging
+import os
+# local
+from common import make_directories, setup_logger
+from normalization import clean_DOI
+from open_access_snapshot import MAX_FIELD_SIZE, build_open_access_snapshot_index
+
+
+##########
+# Inputs #
+##########
+
+# Unpaywall-style snapshot: one JSON object per line with "doi", "is_oa", "oa_status" and "best_oa_location"
+# Can be gzipped
+OPEN_ACCESS_SNAPSHOT_DUMP_PATH = "./data/snapshot/unpaywall_snapshot.jsonl.gz"
+OPEN_ACCESS_SNAPSHOT_INDEX_PATH = "./data/cache/open_access_snapshot.idx"
+
+
+#########################
+# Classes and functions #
+#########################
+
+def read_snapshot_records(path: str):
+    """
+    Yields (DOI, is_open_access, best_open_access_URL, open_access_type) tuples from a snapshot dump.
+    Reads the dump line by line.
+    """
+    open_function = gzip.open if path.endswith(".gz") else open
+    with open_function(path, "rt", encoding="utf8") as read_file:
+        for line in read_file:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            best_open_access_location = item.get("best_oa_location") or {}
+            yield (
+                clean_DOI(item.get("doi") or ""),
+                item.get("is_oa"),
+                best_open_access_location.get("url_for_pdf") or best_open_access_location.get("url"),
+                item.get("oa_status")
+            )
+
+
+#####################
+# Environment setup #
+#####################
+
+logger = logging.getLogger()
+
+
+###############
+# Build index #
+###############
+
+def build_index() -> int:
+    """
+    Builds the DOI index of the open access snapshot dump. Gives the number of DOIs indexed.
+    """
+    n_records, n_oversized_records = build_open_access_snapshot_index(
+        records=read_snapshot_records(OPEN_ACCESS_SNAPSHOT_DUMP_PATH),
+        index_path=OPEN_ACCESS_SNAPSHOT_INDEX_PATH)
+
+    info_string = f'Indexed {n_records} DOIs from {OPEN_ACCESS_SNAPSHOT_DUMP_PATH}. Saved index to {OPEN_ACCESS_SNAPSHOT_INDEX_PATH}'
+    logger.info(info_string)
+    if n_oversized_records:
+        info_string = f'Skipped {n_oversized_records} records with a DOI or URL longer than {MAX_FIELD_SIZE} bytes'
+        logger.info(info_string)
+    return n_records
+
+
+########
+# Main #
+########
+
+def main() -> None:
+    """
+    Builds the open access snapshot index.
+    """
+    make_directories(os.path.dirname(OPEN_ACCESS_SNAPSHOT_INDEX_PATH))
+    setup_logger()
+
+    build_index()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# standard
+import datetime
+import json
+import os
+import urllib.parse
+# local
+import metrics
+from normalization import clean_DOI
+from transport import PooledSession
+
+
+#########################
+# Classes and functions #
+#########################
+
+def get_lookup_DOI(DOI: str) -> str:
+    """
+    Gives the DOI without URL-encoding, as APIs expect it in query parameters.
+    Undoes the encoding of clean_DOI and the encoding that some ETIS DOIs already have, e.g. %28 for "(".
+    """
+    unquoted_DOI = urllib.parse.unquote(DOI)
+    while unquoted_DOI != DOI:
+        DOI, unquoted_DOI = unquoted_DOI, urllib.parse.unquote(unquoted_DOI)
+    return unquoted_DOI
+
+
+class OpenAlexCitationProvider(PooledSession):
+    """
+    Gives citation counts of publications from OpenAlex API.
+    Looks up several DOIs in a single request.
+    https://docs.openalex.org/api-entities/works/filter-works
+    """
+    # OPENALEX_API_URL environment variable overrides it, e.g. for benchmarks against a local server
+    BASE_URL = os.environ.get("OPENALEX_API_URL", "https://api.openalex.org")
+    MAX_BATCH_SIZE = 50             # OpenAlex accepts up to 50 values in an OR filter
+
+    def __init__(self, email: str = None) -> None:
+        super().__init__()
+        self.email = email              # Requests with an email address get into the faster "polite pool"
+
+    def get_citation_counts(self, DOIs: list[str]) -> dict[str, int]:
+        """
+        Gives the citation count of each DOI that OpenAlex knows. DOIs are expected to be cleaned by clean_DOI.
+        DOIs are sent without URL-encoding, because requests encodes the query parameters itself.
+        Raises an error on a bad response, so that missing counts are not mistaken for unknown DOIs.
+        """
+        # Lookup DOI: DOI as given
+        DOIs_by_lookup_DOI = {get_lookup_DOI(DOI): DOI for DOI in DOIs}
+        query_parameters = {
+            "filter": f'doi:{"|".join(DOIs_by_lookup_DOI)}',
+            "select": "doi,cited_by_count",
+            "per-page": self.MAX_BATCH_SIZE,
+        }
+        if self.email:
+            query_parameters["mailto"] = self.email
+
+        URL = f'{self.BASE_URL}/works'
+        response = self.get(URL, params=query_parameters)
+        response.raise_for_status()
+        citation_counts = {}
+        for work in response.json()["results"]:
+            DOI = DOIs_by_lookup_DOI.get(get_lookup_DOI(clean_DOI(work.get("doi") or "")))
+            if DOI:
+                citation_counts[DOI] = work["cited_by_count"]
+        return citation_counts
+
+
+class StaticCitationProvider:
+    """
+    Gives citation counts from a local JSON file of DOI: citation count.
+    Stand-in for an API provider, e.g. for testing the enrichment stage without network access.
+    """
+    MAX_BATCH_SIZE = 1000
+
+    def __init__(self, path: str) -> None:
+        with open(path, encoding="utf8") as read_file:
+            self.citation_counts = {clean_DOI(DOI): citation_count for DOI, citation_count in json.loads(read_file.read()).items()}
+
+    def get_citation_counts(self, DOIs: list[str]) -> dict[str, int]:
+        """
+        Gives the citation count of each DOI that is in the file.
+        """
+        return {DOI: self.citation_counts[DOI] for DOI in DOIs if DOI in self.citation_counts}
+
+
+# Provider name: provider class
+CITATION_PROVIDERS = {
+    "openalex": OpenAlexCitationProvider,
+    "static": StaticCitationProvider,
+}
+
+
+def get_citation_provider(provider_string: str):
+    """
+    Gives a citation provider from a string of provider name and an optional argument separated by colon,
+    e.g. "openalex", "openalex:name@example.com" or "static:./data/manual/citation_counts.json".
+    """
+    name, _, argument = provider_string.partition(":")
+    if name not in CITATION_PROVIDERS:
+        raise ValueError(f'Unknown citation provider: {name}. Known providers: {list(CITATION_PROVIDERS)}')
+    return CITATION_PROVIDERS[name](argument) if argument else CITATION_PROVIDERS[name]()
+
+
+class CitationCache:
+    """
+    Persistent cache of citation counts. Counts change slowly, so they are kept for a while.
+    DOIs that the provider doesn't know are cached too, with count None.
+    """
+    def __init__(self, path: str, TTL_days: float) -> None:
+        self.path = path
+        self.TTL = datetime.timedelta(days=TTL_days)
+        self.n_hits = 0
+        self.n_misses = 0
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf8") as read_file:
+                self.entries = json.loads(read_file.read())
+
+    def get(self, DOI: str) -> dict:
+        """
+        Gives the cached entry for DOI or None if there is no entry or it has expired.
+        """
+        entry = self.entries.get(DOI)
+        if entry and datetime.datetime.now(datetime.timezone.utc) - datetime.datetime.fromisoformat(entry["TIMESTAMP"]) < self.TTL:
+            self.n_hits += 1
+            metrics.count("cache_lookups_total", {"cache": "citations", "result": "hit"})
+            return entry
+        self.n_misses += 1
+        metrics.count("cache_lookups_total", {"cache": "citations", "result": "miss"})
+        return None
+
+    def set(self, DOI: str, citation_count: int) -> dict:
+        """
+        Caches the citation count of DOI.
+        """
+        entry = {
+            "CITATION_COUNT": citation_count,
+            "TIMESTAMP": datetime.datetime.now(datetime.timezone.utc).isoformat()
+        }
+        self.entries[DOI] = entry
+        return entry
+
+    def save(self) -> None:
+        """
+        Writes the cache to its file.
+        """
+        with open(self.path, "w", encoding="utf8") as save_file:
+            save_file.write(json.dumps(self.entries, ensure_ascii=False))
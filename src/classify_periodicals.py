@@ -0,0 +1,118 @@
+# standard
+import logging
+# external
+import polars
+# local
+import metrics
+from columnar_storage import read_latest_table
+from common import get_timestamp_string, save_data, setup_logger
+from periodical_index import LISTED, NEEDS_REVIEW, PeriodicalIndex
+
+
+##########
+# Inputs #
+##########
+
+RESULTS_DATA_DIRECTORY_PATH = "./data/results/"
+# Locally supplied list of predatory journals, e.g. from https://beallslist.net
+# CSV with columns name, issn, eissn and variants (abbreviations and former names separated by semicolons)
+PREDATORY_JOURNALS_PATH = "./data/manual/predatory_journals.csv"
+METRICS_DIRECTORY_PATH = "./data/metrics/"
+
+
+#####################
+# Environment setup #
+#####################
+
+logger = logging.getLogger()
+
+
+##########################
+# Build periodical index #
+##########################
+
+def build_periodical_index() -> PeriodicalIndex:
+    """
+    Gives the index of the predatory journal list.
+    """
+    with metrics.stage("build_periodical_index"):
+        predatory_journal_index = PeriodicalIndex.from_csv(PREDATORY_JOURNALS_PATH)
+
+        info_string = f'Indexed {len(predatory_journal_index.journals)} predatory journals with {len(predatory_journal_index.journals_by_ISSN)} ISSNs and {len(predatory_journal_index.names)} name variants from {PREDATORY_JOURNALS_PATH}'
+        logger.info(info_string)
+    return predatory_journal_index
+
+
+########################
+# Classify periodicals #
+########################
+
+def classify_periodicals(predatory_journal_index: PeriodicalIndex) -> list[dict]:
+    """
+    Gives the predatory journal classification of each distinct periodical in the latest open access data. Saves the classifications to the results directory.
+    """
+    with metrics.stage("classify_periodicals"):
+        open_access_data = read_latest_table(RESULTS_DATA_DIRECTORY_PATH, "open_access_data", columns=["GUID", "CLUSTER_ID", "PERIODICAL"])
+
+        # Files saved before duplicate clustering have no CLUSTER_ID, so each GUID is its own cluster
+        if "CLUSTER_ID" not in open_access_data.columns:
+            open_access_data = open_access_data.with_columns(polars.col("GUID").alias("CLUSTER_ID"))
+
+        # Each distinct periodical string is classified once, however many articles are published in it
+        periodicals = [periodical for periodical in open_access_data["PERIODICAL"].cast(polars.String).unique().sort().to_list() if periodical]
+        periodical_classifications = [predatory_journal_index.classify(periodical) for periodical in periodicals]
+
+        periodical_classifications_save_path = f'{RESULTS_DATA_DIRECTORY_PATH.strip("/")}/periodical_classifications_{get_timestamp_string()}.json'
+        save_data(periodical_classifications, periodical_classifications_save_path)
+
+        # Count each publication once, even if it's reported under several GUIDs
+        # Only ISSN and exact name matches count as predatory. Fuzzy matches are reported separately for a manual check.
+        predatory_periodicals = [classification["PERIODICAL"] for classification in periodical_classifications if classification["OUTCOME"] == LISTED]
+        review_periodicals = [classification["PERIODICAL"] for classification in periodical_classifications if classification["OUTCOME"] == NEEDS_REVIEW]
+        n_publications = open_access_data["CLUSTER_ID"].n_unique()
+        n_predatory_publications = (
+            open_access_data
+            .filter(polars.col("PERIODICAL").cast(polars.String).is_in(predatory_periodicals))
+            ["CLUSTER_ID"]
+            .n_unique())
+        n_review_publications = (
+            open_access_data
+            .filter(polars.col("PERIODICAL").cast(polars.String).is_in(review_periodicals))
+            ["CLUSTER_ID"]
+            .n_unique())
+
+        n_match_types = {}
+        for classification in periodical_classifications:
+            if classification["MATCH_TYPE"]:
+                n_match_types[classification["MATCH_TYPE"]] = n_match_types.get(classification["MATCH_TYPE"], 0) + 1
+
+        info_string1 = f'{len(predatory_periodicals)} of {len(periodicals)} distinct periodicals are on the predatory journal list (matched by {n_match_types}). Saved classifications to {periodical_classifications_save_path}'
+        info_string2 = f'{n_predatory_publications} of {n_publications} publications ({round(n_predatory_publications / n_publications * 100) if n_publications else 0}%) are in predatory journals'
+        info_string3 = f'{len(review_periodicals)} periodicals with {n_review_publications} publications have names similar to the predatory journal list and need a manual check (OUTCOME {NEEDS_REVIEW})'
+        logger.info(info_string1)
+        logger.info(info_string2)
+        logger.info(info_string3)
+    return periodical_classifications
+
+
+########
+# Main #
+########
+
+def main() -> None:
+    """
+    Classifies the periodicals of the latest open access data against the predatory journal list.
+    """
+    setup_logger()
+
+    try:
+        predatory_journal_index = build_periodical_index()
+        classify_periodicals(predatory_journal_index)
+    finally:
+        metrics_save_path = metrics.save(METRICS_DIRECTORY_PATH, "classify_periodicals")
+        info_string = f'Saved run metrics to {metrics_save_path}'
+        logger.info(info_string)
+
+
+if __name__ == "__main__":
+    main()
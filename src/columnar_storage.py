@@ -0,0 +1,95 @@
+# standard
+import json
+import os
+import re
+
+
+#########################
+# Classes and functions #
+#########################
+
+def get_latest_file_path(dir_path: str, file_handle: str, extension: str) -> str:
+    """
+    Gives the path of the file with the latest timestamp in filename from given dir_path.
+    Checks only filenames with the given file_handle followed by a timestamp and the given extension.
+    Gives None if there is no such file.
+    """
+    name_pattern = file_handle + r'_(\d+)\w*\.' + extension + '$'
+
+    files = [file for file in os.listdir(dir_path) if re.match(name_pattern, file)]
+    if not files:
+        return None
+    files_latest = sorted(files, key=lambda x: re.match(name_pattern, x).group(1))[-1]
+    path = f'{dir_path.strip("/")}/{files_latest}'
+    return path
+
+
+def is_nested(value) -> bool:
+    """
+    Checks whether value has nested structure that doesn't fit into a flat column.
+    Lists of scalars fit into list columns.
+    """
+    if isinstance(value, dict):
+        return True
+    if isinstance(value, list):
+        return any(isinstance(item, (dict, list)) for item in value)
+    return False
+
+
+def get_columns(items: list[dict]) -> dict[str, list]:
+    """
+    Turns a list of records into columns.
+    Nested values and columns with mixed value types are saved as JSON strings, so that every column has a single type.
+    """
+    names = list(dict.fromkeys(name for item in items for name in item))
+    columns = {}
+    for name in names:
+        values = [item.get(name) for item in items]
+        value_types = {type(value) for value in values if value is not None}
+        if value_types == {int, float}:
+            value_types = {float}
+
+        if len(value_types) > 1 or any(is_nested(value) for value in values):
+            values = [None if value is None else json.dumps(value, ensure_ascii=False) for value in values]
+        columns[name] = values
+    return columns
+
+
+def save_parquet(items: list[dict], path: str) -> None:
+    """
+    Saves a list of records as a zstd compressed Parquet file.
+    """
+    import polars
+
+    columns = get_columns(items)
+    data_frame = polars.DataFrame([polars.Series(name, values, strict=False) for name, values in columns.items()])
+    data_frame.write_parquet(path, compression="zstd")
+
+
+def read_latest_table(dir_path: str, file_handle: str, columns: list[str] = None):
+    """
+    Reads the latest data file with the given file_handle from dir_path into a polars DataFrame.
+    Prefers the Parquet file and reads only the given columns from it (memory-mapped).
+    Falls back to the JSON file for data that was saved before Parquet files were added.
+    Columns that are not in the data are left out.
+    """
+    import polars
+
+    parquet_path = get_latest_file_path(dir_path, file_handle, "parquet")
+    JSON_path = get_latest_file_path(dir_path, file_handle, "json")
+    if not (parquet_path or JSON_path):
+        raise FileNotFoundError(f'No {file_handle} Parquet or JSON files in {dir_path}')
+
+    # Use Parquet unless there is a newer JSON file
+    if parquet_path and not (JSON_path and JSON_path[:-len(".json")] > parquet_path[:-len(".parquet")]):
+        available_columns = polars.read_parquet_schema(parquet_path)
+        columns = [column for column in columns if column in available_columns] if columns else None
+        data_frame = polars.read_parquet(parquet_path, columns=columns, memory_map=True)
+        return data_frame
+
+    with open(JSON_path, encoding="utf8") as read_file:
+        items = json.loads(read_file.read())
+    data_frame = polars.DataFrame([polars.Series(name, values, strict=False) for name, values in get_columns(items).items()])
+    if columns:
+        data_frame = data_frame.select([column for column in columns if column in data_frame.columns])
+    return data_frame
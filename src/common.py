@@ -0,0 +1,73 @@
+# standard
+import datetime
+import json
+import logging
+import os
+import re
+import sys
+# local
+from columnar_storage import get_latest_file_path, save_parquet
+
+
+#########################
+# Classes and functions #
+#########################
+
+def get_timestamp_string() -> str:
+    """
+    Gives a standard current timestamp string to use in filenames.
+    """
+    timestamp_format = "%Y%m%d%H%M%S%Z"
+
+    timestamp = datetime.datetime.now(datetime.timezone.utc)
+    timestamp_string = datetime.datetime.strftime(timestamp, timestamp_format)
+    return timestamp_string
+
+
+def read_latest_file(dir_path: str, file_handle: str = None) -> list[dict]:
+    """
+    Reads file with the latest timestamp in filename from given dir_path.
+    If file_handle is given, checks only filenames with the given file_handle followed by a timestamp.
+    """
+    path = get_latest_file_path(dir_path, file_handle or ".+", "json")
+    if not path:
+        raise FileNotFoundError(f'No {file_handle or "timestamped"} JSON files in {dir_path}')
+
+    with open(path, encoding="utf8") as read_file:
+        data = json.loads(read_file.read())
+
+    return data
+
+
+def save_data(data: list, save_path: str, parquet: bool = True) -> None:
+    """
+    Saves data to a JSON file for people to read.
+    Saves the same data next to it as a compressed Parquet file for analysis scripts that only need some of the columns.
+    """
+    with open(save_path, "w", encoding="utf8") as save_file:
+        save_file.write(json.dumps(data, indent=2, ensure_ascii=False))
+
+    if parquet:
+        save_parquet(data, re.sub(r"\.json$", ".parquet", save_path))
+
+
+def make_directories(*dir_paths: str) -> None:
+    """
+    Creates the directories that don't exist yet.
+    """
+    for dir_path in dir_paths:
+        if not os.path.exists(dir_path):
+            os.makedirs(dir_path)
+
+
+def setup_logger() -> logging.Logger:
+    """
+    Gives the root logger that writes info messages to stdout. Adds the handler only once, so stages can be run one after another.
+    """
+    logger = logging.getLogger()
+    logger.setLevel("INFO")
+    if not any(getattr(handler, "is_horizon_analyzer_handler", False) for handler in logger.handlers):
+        handler = logging.StreamHandler(sys.stdout)
+        handler.is_horizon_analyzer_handler = True
+        logger.addHandler(handler)
+    return logger
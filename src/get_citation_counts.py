@@ -0,0 +1,135 @@
+# standard
+import concurrent.futures
+import logging
+import os
+# external
+import requests
+import tqdm
+# local
+import metrics
+from citations import CitationCache, get_citation_provider
+from columnar_storage import read_latest_table
+from common import get_timestamp_string, make_directories, save_data, setup_logger
+
+
+##########
+# Inputs #
+##########
+
+RESULTS_DATA_DIRECTORY_PATH = "./data/results/"
+CACHE_DIRECTORY_PATH = "./data/cache/"
+CITATION_CACHE_PATH = "./data/cache/citation_cache.json"
+METRICS_DIRECTORY_PATH = "./data/metrics/"
+
+# Provider name and optional argument, e.g. "openalex:name@example.com" or "static:./data/manual/citation_counts.json"
+CITATION_PROVIDER = os.environ.get("CITATION_PROVIDER", "openalex")
+CITATION_CACHE_TTL_DAYS = 30        # Re-query citation counts after this many days
+MAX_CONCURRENT_REQUESTS = 4         # Don't send more simultaneous requests than this to the provider
+
+
+#########################
+# Classes and functions #
+#########################
+
+def get_batches(items: list, batch_size: int) -> list[list]:
+    """
+    Splits items into batches of at most batch_size items.
+    """
+    return [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+
+
+#####################
+# Environment setup #
+#####################
+
+logger = logging.getLogger()
+
+
+#######################
+# Get citation counts #
+#######################
+
+def get_citation_counts() -> dict[str, int]:
+    """
+    Gives citation counts of the DOIs in the latest open access data from the citation provider or cache. Saves them to the results directory.
+    """
+    with metrics.stage("get_citation_counts") as stage:
+        # DOIs in open access data are already cleaned
+        open_access_data = read_latest_table(RESULTS_DATA_DIRECTORY_PATH, "open_access_data", columns=["DOI"])
+        DOIs = [DOI for DOI in open_access_data["DOI"].unique().sort().to_list() if DOI]
+
+        citation_provider = get_citation_provider(CITATION_PROVIDER)
+        citation_cache = CitationCache(path=CITATION_CACHE_PATH, TTL_days=CITATION_CACHE_TTL_DAYS)
+
+        citation_counts = {}
+        DOIs_to_request = []
+        for DOI in DOIs:
+            cache_entry = citation_cache.get(DOI)
+            if cache_entry:
+                citation_counts[DOI] = cache_entry["CITATION_COUNT"]
+            else:
+                DOIs_to_request += [DOI]
+
+        n_bad_responses = 0
+        bad_response_threshold = 10         # Throw after this threshold of bad responses (don't spam API)
+
+        # Several DOIs are looked up in each request. Batches are requested concurrently, but at most MAX_CONCURRENT_REQUESTS at a time.
+        batches = get_batches(DOIs_to_request, citation_provider.MAX_BATCH_SIZE)
+        failed_DOIs = []
+        # Counts are saved to the cache also when the run stops on the bad response threshold, so that they are not requested again
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+                futures = {executor.submit(citation_provider.get_citation_counts, batch): batch for batch in batches}
+                for future in tqdm.tqdm(concurrent.futures.as_completed(futures), total=len(futures), desc="Requesting citation counts"):
+                    batch = futures[future]
+                    try:
+                        batch_citation_counts = future.result()
+                    except requests.RequestException:
+                        failed_DOIs += batch
+                        n_bad_responses += 1
+                        metrics.count("bad_responses_total", {"stage": stage["NAME"]})
+                        if n_bad_responses >= bad_response_threshold:
+                            # Batches that haven't been sent yet are not sent
+                            executor.shutdown(wait=False, cancel_futures=True)
+                            raise ConnectionError(f'Reached bad response threshold: {bad_response_threshold}')
+                        continue
+
+                    # DOIs that the provider doesn't know are cached with no count, so that they are not requested again on every run
+                    for DOI in batch:
+                        citation_counts[DOI] = citation_cache.set(DOI, batch_citation_counts.get(DOI))["CITATION_COUNT"]
+        finally:
+            citation_cache.save()
+
+        citation_counts_data = [{"DOI": DOI, "CITATION_COUNT": citation_count} for DOI, citation_count in sorted(citation_counts.items())]
+        citation_counts_save_path = f'{RESULTS_DATA_DIRECTORY_PATH.strip("/")}/citation_counts_{get_timestamp_string()}.json'
+        save_data(citation_counts_data, citation_counts_save_path)
+
+        n_found = sum(citation_count is not None for citation_count in citation_counts.values())
+        info_string1 = f'Found citation counts for {n_found} of {len(DOIs)} DOIs. Saved to {citation_counts_save_path}'
+        info_string2 = f'Made {len(batches)} batched requests for {len(DOIs_to_request)} DOIs. {citation_cache.n_hits} DOIs were answered from cache {CITATION_CACHE_PATH}. {len(failed_DOIs)} DOIs failed'
+        logger.info(info_string1)
+        logger.info(info_string2)
+    return citation_counts
+
+
+########
+# Main #
+########
+
+def main() -> None:
+    """
+    Enriches the latest open access data with citation counts.
+    """
+    make_directories(RESULTS_DATA_DIRECTORY_PATH, CACHE_DIRECTORY_PATH)
+    setup_logger()
+
+    try:
+        get_citation_counts()
+    finally:
+        metrics_save_path = metrics.save(METRICS_DIRECTORY_PATH, "get_citation_counts")
+        info_string = f'Saved run metrics to {metrics_save_path}'
+        logger.info(info_string)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,13 +3,20 @@ import datetime
 import json
 import logging
 import os
-import re
-import sys
 import time
-import urllib
 # external
 import requests
 import tqdm
+# local
+import metrics
+from common import get_timestamp_string, make_directories, read_latest_file, save_data, setup_logger
+from normalization import clean_DOIs
+from open_access_button import OpenAccessButtonCache, OpenAccessButtonSession, get_lookup_inputs, limit_rate
+from open_access_snapshot import OpenAccessSnapshotIndex
+from open_access_url_verification import verify_URLs
+from publication_clustering import cluster_publications
+from records import EtisProject, EtisPublication, OpenAccessDatum
+from transport import PooledSession
 
 
 ##########
@@ -34,22 +41,52 @@ ETIS_FINISHED_PROJECT_STATUS_CODE = 3
     # 2 - ongoing projects
     # 3 - finished projects
 
+# Page through ETIS publications with server-side filters instead of requesting each publication by GUID
+ETIS_PUBLICATION_BULK_RETRIEVAL = True
+ETIS_PUBLICATION_BULK_YEARS = range(2014, datetime.datetime.now().year + 1)    # Horizon 2020 started in 2014
+ETIS_PUBLICATION_CLASSIFICATION_PARAMETER = "ClassificationCode"
+ETIS_PUBLICATION_YEAR_PARAMETER = "PublishingYear"
+ETIS_PUBLICATION_FETCH_STRAGGLERS = False
+    # False - treat publications that bulk retrieval didn't return as not relevant
+    # True - request publications that bulk retrieval didn't return one by one
+    # Bulk pages hold every scientific article of the years, not only the ones of the Horizon projects.
+    # Publications that they don't return are mostly not scientific articles. Fetching them too sends more requests in total
+    # than requesting all publications by GUID. Only articles with no publishing year or one outside ETIS_PUBLICATION_BULK_YEARS are missed.
+    # Publications are always requested one by one if the server doesn't apply the filters
+SAVE_ALL_PUBLICATIONS = False       # Also save publications that are not scientific articles (for debugging)
+# Check that the Open Access Button URLs lead to the publications. Sends requests to every publisher server, so it's off by default.
+# VERIFY_OPEN_ACCESS_BUTTON_URLS environment variable turns it on, e.g. for benchmarks against a local server.
+# Without verification, Open Access Button URL verdicts come from the latest earlier verification or are left unknown.
+VERIFY_OPEN_ACCESS_BUTTON_URLS = os.environ.get("VERIFY_OPEN_ACCESS_BUTTON_URLS", "").lower() in ("1", "true", "yes")
+
 RAW_DATA_DIRECTORY_PATH = "./data/raw/"
 RESULTS_DATA_DIRECTORY_PATH = "./data/results/"
 MANUALLY_CHECKED_PUBLICATIONS_PATH = "./data/manual/manually_checked_publications.json"
+CACHE_DIRECTORY_PATH = "./data/cache/"
+OPEN_ACCESS_BUTTON_CACHE_PATH = "./data/cache/open_access_button_cache.json"
+OPEN_ACCESS_SNAPSHOT_INDEX_PATH = "./data/cache/open_access_snapshot.idx"       # Built by build_open_access_snapshot_index
+METRICS_DIRECTORY_PATH = "./data/metrics/"
+
+SAVE_PARQUET = True                # Save data as Parquet next to the JSON files, for faster loading in analysis
+
+OPEN_ACCESS_BUTTON_HIT_TTL_DAYS = 90        # Re-query inputs that found a URL after this many days
+OPEN_ACCESS_BUTTON_MISS_TTL_DAYS = 14       # Re-query inputs that didn't find a URL after this many days (publications may become open)
+# Limit requests that can be made per second to respect API rules. Can be raised for benchmarks against a local server.
+OPEN_ACCESS_BUTTON_REQUESTS_PER_SECOND_LIMIT = float(os.environ.get("OPEN_ACCESS_BUTTON_REQUESTS_PER_SECOND_LIMIT", 1))
 
 
 #########################
 # Classes and functions #
 #########################
 
-class EtisSession(requests.Session):
+class EtisSession(PooledSession):
     """
     Class for requesting info from ETIS API.
     """
     # https://www.etis.ee:2346/api - test
     # https://www.etis.ee:7443/api - live
-    BASE_URL = "https://www.etis.ee:7443/api"
+    # ETIS_API_URL environment variable overrides it, e.g. for benchmarks against a local server
+    BASE_URL = os.environ.get("ETIS_API_URL", "https://www.etis.ee:7443/api")
 
     def __init__(self, service: str) -> None:
         super().__init__()
@@ -75,408 +112,597 @@ class EtisSession(requests.Session):
         return response
 
 
-class OpenAccessButtonSession(requests.Session):
+def is_scientific_article(publication_data: dict) -> bool:
     """
-    Class for requesting info from Open Access Button API.
-    https://openaccessbutton.org/api
+    Checks whether ETIS publication data is an already published scientific article.
     """
-    BASE_URL = "https://api.openaccessbutton.org"
-
-    def __init__(self, API_key: str = None) -> None:
-        super().__init__()
-        self.API_key = API_key
-
-    def find(self, ID: str) -> requests.Response:
-        """
-        Gives URL to any Open Access paper.
-        Accepts a single parameter called "id", which should contain (in order of preference)
-        a URL-encoded doi, pmc, pmid, url, title, or citation.
-        """
-        query_parameters = {
-            "id": ID
-        }
-        URL = f'{self.BASE_URL}/find'
-        response = self.get(URL, params=query_parameters)
-        return response
+    if not publication_data:
+        return False
+    if not publication_data["ClassificationCode"] in ETIS_SCIENTIFIC_ARTICLES_CLASSIFICATION_CODES:
+        return False
+    if not publication_data["PublicationStatusEng"].lower() == "published":
+        return False
+    return True
 
 
-def clean_DOI(DOI: str) -> str:
-    """
-    Removes the leading doi.org URL or DOI:.
-    URL-encodes the DOI.
-    """
-    DOI = DOI.strip(" ").lower()
-    if not DOI:
-        return DOI
-    if DOI[:4] == "doi:":
-        # Drop leading "DOI: "
-        DOI = DOI[4:].strip(" ")
-    if "doi.org" in DOI:
-        # Drop leading http://dx.doi.org/ or https://doi.org/
-        DOI = re.sub(r"^.+doi.org/\s*", "", DOI)
-        
-    URL_safe_DOI = urllib.parse.quote(DOI)
-    return URL_safe_DOI
-
-
-def limit_rate(last_lap_timestamp: float, requests_per_second_limit: int = 50) -> None:
+def is_filtered_page(items: list[dict], classification_code: str, year: int) -> bool:
     """
-    Adds sleep to request cycles to adher to the rate limits.
-    Uses monotonic timestamps.
+    Checks whether all publications on a page have the classification code and publishing year that the page was filtered by.
+    A server that ignores the filters returns pages of unfiltered publications.
     """
-    # Safety margin 0.1 triggers slowing down when request frequency is within 90% of rate limit
-    safety_margin = 0.1
+    for item in items:
+        if item.get(ETIS_PUBLICATION_CLASSIFICATION_PARAMETER) != classification_code:
+            return False
+        if str(item.get(ETIS_PUBLICATION_YEAR_PARAMETER)) != str(year):
+            return False
+    return True
 
-    requests_per_second_current = 1 / (time.monotonic() - last_lap_timestamp)
-    requests_per_second_limit_safe = requests_per_second_limit * (1 - safety_margin)
-    if requests_per_second_current >= requests_per_second_limit_safe:
-        time.sleep(1 / requests_per_second_limit)
 
-
-def get_timestamp_string() -> str:
+class JsonArrayWriter:
     """
-    Gives a standard current timestamp string to use in filenames.
+    Writes a JSON array to a file one item at a time, so that the items don't have to be kept in memory.
+    Output is formatted the same way as json.dumps with indent=2.
     """
-    timestamp_format = "%Y%m%d%H%M%S%Z"
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.n_items = 0
+        self.file = None
 
-    timestamp = datetime.datetime.now(datetime.timezone.utc)
-    timestamp_string = datetime.datetime.strftime(timestamp, timestamp_format)
-    return timestamp_string
+    def __enter__(self):
+        self.open()
+        return self
 
+    def __exit__(self, *_) -> None:
+        self.close()
 
-def read_latest_file(dir_path: str, file_handle: str = None) -> list[dict]:
-    """
-    Reads file with the latest timestamp in filename from given dir_path.
-    If file_handle is given, checks only filenames with the given file_handle followed by a timestamp.
-    """
-    if not file_handle:
-        file_handle = ".+"
-    name_pattern = file_handle + r'_(\d+)'
+    def open(self) -> None:
+        """
+        Opens the file and starts the array.
+        """
+        self.file = open(self.path, "w", encoding="utf8")
+        self.file.write("[")
 
-    files = [file for file in os.listdir(dir_path) if re.match(name_pattern, file)]
-    files_latest = sorted(files, key=lambda x: re.match(name_pattern, x).group(1))[-1]
-    path = f'{dir_path.strip("/")}/{files_latest}'
+    def close(self) -> None:
+        """
+        Ends the array and closes the file.
+        """
+        self.file.write("\n]" if self.n_items else "]")
+        self.file.close()
 
-    with open(path, encoding="utf8") as read_file:
-        data = json.loads(read_file.read())
-    
-    return data
+    def write(self, item) -> None:
+        """
+        Appends an item to the array.
+        """
+        item_string = json.dumps(item, indent=2, ensure_ascii=False).replace("\n", "\n  ")
+        self.file.write(f'{"," if self.n_items else ""}\n  {item_string}')
+        self.n_items += 1
 
 
 #####################
 # Environment setup #
 #####################
 
-# Create directories
-if not os.path.exists(RAW_DATA_DIRECTORY_PATH):
-    os.makedirs(RAW_DATA_DIRECTORY_PATH)
-
-if not os.path.exists(RESULTS_DATA_DIRECTORY_PATH):
-    os.makedirs(RESULTS_DATA_DIRECTORY_PATH)
-
-# Logger
 logger = logging.getLogger()
-logger.setLevel("INFO")
-logger.addHandler(logging.StreamHandler(sys.stdout))
 
 
 ######################
 # Pull ETIS Projects #
 ######################
 
-ETIS_project_session = EtisSession(service="project")
-ETIS_project_parameters = {
-    "ProjectStatus": ETIS_FINISHED_PROJECT_STATUS_CODE,
-}
-
-n_bad_responses = 0
-bad_response_threshold = 10         # Throw after this threshold of bad responses (don't spam API)
-items_per_request = 500             # Get items in batches
-
-bad_responses = []
-ETIS_projects = []
-with tqdm.tqdm() as ETIS_progress_bar:
-    _ = ETIS_progress_bar.set_description_str("Requesting ETIS projects")
-    for program_code in ETIS_HORIZON_PROGRAM_CODES:
-        ETIS_project_parameters["ProgrammeCode"] = program_code
-        i = 0
-        while True:
-            response = ETIS_project_session.get_items(
-                n=items_per_request,
-                i_start=i,
-                parameters=ETIS_project_parameters)
-            
-            if not response:
-                bad_responses += [response]
-                n_bad_responses += 1
-                if n_bad_responses >= bad_response_threshold:
-                    raise ConnectionError(f'Reached bad response threshold: {bad_response_threshold}')
-                continue
+def pull_etis_projects() -> None:
+    """
+    Requests finished Horizon projects from ETIS and saves them.
+    """
+    with metrics.stage("pull_etis_projects") as stage:
+        ETIS_project_session = EtisSession(service="project")
+        ETIS_project_parameters = {
+            "ProjectStatus": ETIS_FINISHED_PROJECT_STATUS_CODE,
+        }
+
+        n_bad_responses = 0
+        bad_response_threshold = 10         # Throw after this threshold of bad responses (don't spam API)
+        items_per_request = 500             # Get items in batches
+
+        bad_responses = []
+        ETIS_projects = []
+        with tqdm.tqdm() as ETIS_progress_bar:
+            _ = ETIS_progress_bar.set_description_str("Requesting ETIS projects")
+            for program_code in ETIS_HORIZON_PROGRAM_CODES:
+                ETIS_project_parameters["ProgrammeCode"] = program_code
+                i = 0
+                while True:
+                    response = ETIS_project_session.get_items(
+                        n=items_per_request,
+                        i_start=i,
+                        parameters=ETIS_project_parameters)
 
-            items = response.json()
-            if not items:
-                break
+                    if not response:
+                        bad_responses += [response]
+                        n_bad_responses += 1
+                        metrics.count("request_retries_total", {"stage": stage["NAME"]})     # Same page is requested again
+                        if n_bad_responses >= bad_response_threshold:
+                            raise ConnectionError(f'Reached bad response threshold: {bad_response_threshold}')
+                        continue
 
-            ETIS_projects += items
-            i += items_per_request
-            _ = ETIS_progress_bar.update()
+                    items = response.json()
+                    if not items:
+                        break
 
+                    ETIS_projects += items
+                    i += items_per_request
+                    _ = ETIS_progress_bar.update()
 
-ETIS_projects_save_path = f'{RAW_DATA_DIRECTORY_PATH.strip("/")}/etis_projects_{get_timestamp_string()}.json'
-with open(ETIS_projects_save_path, "w", encoding="utf8") as save_file:
-    save_file.write(json.dumps(ETIS_projects, indent=2, ensure_ascii=False))
 
-info_string = f'Found {len(ETIS_projects)} relevant projects in ETIS. Saved to {ETIS_projects_save_path}'
-logger.info(info_string)
+        ETIS_projects_save_path = f'{RAW_DATA_DIRECTORY_PATH.strip("/")}/etis_projects_{get_timestamp_string()}.json'
+        save_data(ETIS_projects, ETIS_projects_save_path, SAVE_PARQUET)
+
+        info_string = f'Found {len(ETIS_projects)} relevant projects in ETIS. Saved to {ETIS_projects_save_path}'
+        logger.info(info_string)
 
 
 ################################
 # Get project publication info #
 ################################
 
-# Reload data from save file
-ETIS_projects = read_latest_file(RAW_DATA_DIRECTORY_PATH, "etis_projects")
-
-# Parse publications
-# Select unique publications (same publications can be reported under several projects)
-n_publications = 0
-projects_with_no_publications = []
-publications_index = {}
-for project in ETIS_projects:
-    if not project["Publications"]:
-        projects_with_no_publications += [project]
-        continue
-
-    project_GUID = project["Guid"]
-    for publication in project["Publications"]:
-        n_publications += 1
-        GUID = publication["Guid"]
-        publication_data = publications_index.get(GUID) or {}
-
-        if not publication_data:
-            publication_data["GUID"] = GUID
-            publication_data["PROJECT_GUIDS"] = []
-
-        publication_data["PROJECT_GUIDS"] += [project_GUID]
-        publications_index[GUID] = publication_data
-
-publications = list(publications_index.values())
-
-info_string = f'Found {n_publications} publications under the projects. {len(publications)} of these are unique. {len(projects_with_no_publications)} of the {len(ETIS_projects)} projects have no publications'
-logger.info(info_string)
-
-
-###################################
-# Pull publication info from ETIS #
-###################################
-
-ETIS_publication_session = EtisSession(service="publication")
-
-n_bad_responses = 0
-bad_response_threshold = 10         # Throw after this threshold of bad responses (don't spam API)
-
-bad_responses = []
-publications_with_no_data = []
-for publication in tqdm.tqdm(publications, desc="Requesting ETIS publications"):
-    response = ETIS_publication_session.get_items(
-        parameters={"Guid": publication["GUID"]}
-    )
-    if not response:
-        bad_responses += [response]
-        n_bad_responses += 1
-        if n_bad_responses >= bad_response_threshold:
-            raise ConnectionError(f'Reached bad response threshold: {bad_response_threshold}')
-        continue
-
-    publication["DATA"] = {}
-    try:
-        publication["DATA"] = response.json()[0]
-    except Exception as exception:
-        publications_with_no_data += [publication]
+def get_project_publication_info() -> list[dict]:
+    """
+    Gives the unique publications of the saved ETIS projects with the GUIDs of the projects they are reported under.
+    """
+    with metrics.stage("get_project_publication_info"):
+        # Reload data from save file
+        ETIS_projects = [EtisProject.from_etis(item) for item in read_latest_file(RAW_DATA_DIRECTORY_PATH, "etis_projects")]
+
+        # Parse publications
+        # Select unique publications (same publications can be reported under several projects)
+        n_publications = 0
+        projects_with_no_publications = []
+        publications_index = {}
+        for project in ETIS_projects:
+            if not project.publication_GUIDs:
+                projects_with_no_publications += [project]
+                continue
+
+            project_GUID = project.GUID
+            for GUID in project.publication_GUIDs:
+                n_publications += 1
+                publication_data = publications_index.get(GUID) or {}
+
+                if not publication_data:
+                    publication_data["GUID"] = GUID
+                    publication_data["PROJECT_GUIDS"] = []
+
+                publication_data["PROJECT_GUIDS"] += [project_GUID]
+                publications_index[GUID] = publication_data
+
+        publications = list(publications_index.values())
 
-publications_save_path = f'{RAW_DATA_DIRECTORY_PATH.strip("/")}/publications_{get_timestamp_string()}.json'
-with open(publications_save_path, "w", encoding="utf8") as save_file:
-    save_file.write(json.dumps(publications, indent=2, ensure_ascii=False))
+        info_string = f'Found {n_publications} publications under the projects. {len(publications)} of these are unique. {len(projects_with_no_publications)} of the {len(ETIS_projects)} projects have no publications'
+        logger.info(info_string)
+    return publications
 
-publications_with_no_data_save_path = f'{RAW_DATA_DIRECTORY_PATH.strip("/")}/publications_with_no_data_{get_timestamp_string()}.json'
-with open(publications_with_no_data_save_path, "w", encoding="utf8") as save_file:
-    save_file.write(json.dumps(publications_with_no_data, indent=2, ensure_ascii=False))
 
-info_string1 = f'Pulled publication data from ETIS. Saved to {publications_save_path}'
-info_string2 = f'ETIS API failed to return data for {len(publications_with_no_data)} of the {len(publications)} publications. See {publications_with_no_data_save_path} for details'
-logger.info(info_string1)
-logger.info(info_string2)
+######################################
+# Pull scientific articles from ETIS #
+######################################
 
+def pull_scientific_articles(publications: list[dict]) -> None:
+    """
+    Requests the publications from ETIS and saves the ones that are published scientific articles.
+    """
+    with metrics.stage("pull_scientific_articles") as stage:
+        ETIS_publication_session = EtisSession(service="publication")
+
+        n_bad_responses = 0
+        bad_response_threshold = 10         # Throw after this threshold of bad responses (don't spam API)
+        items_per_request = 500             # Get items in batches
+
+        # Publications are classified as they arrive. Only already published scientific articles are kept.
+        # Other publications are written to the optional full publications file and then discarded.
+        all_publications_save_path = f'{RAW_DATA_DIRECTORY_PATH.strip("/")}/publications_{get_timestamp_string()}.json'
+        all_publications_writer = JsonArrayWriter(all_publications_save_path) if SAVE_ALL_PUBLICATIONS else None
+        if all_publications_writer:
+            all_publications_writer.open()
+
+        bad_responses = []
+        publications_with_no_data = []
+        scientific_articles = []
+        publications_to_request_by_GUID = publications
+        if ETIS_PUBLICATION_BULK_RETRIEVAL:
+            # Join pages of filtered publications against the publications of the relevant projects
+            publications_index = {publication["GUID"]: publication for publication in publications}
+            bulk_retrieved_GUIDs = set()
+            are_filters_applied = True
+            with tqdm.tqdm() as ETIS_progress_bar:
+                _ = ETIS_progress_bar.set_description_str("Requesting ETIS publication pages")
+                for classification_code in ETIS_SCIENTIFIC_ARTICLES_CLASSIFICATION_CODES:
+                    for year in ETIS_PUBLICATION_BULK_YEARS:
+                        if not are_filters_applied:
+                            break
+                        ETIS_publication_parameters = {
+                            ETIS_PUBLICATION_CLASSIFICATION_PARAMETER: classification_code,
+                            ETIS_PUBLICATION_YEAR_PARAMETER: year
+                        }
+                        i = 0
+                        while True:
+                            response = ETIS_publication_session.get_items(
+                                n=items_per_request,
+                                i_start=i,
+                                parameters=ETIS_publication_parameters)
+
+                            if not response:
+                                bad_responses += [response]
+                                n_bad_responses += 1
+                                metrics.count("request_retries_total", {"stage": stage["NAME"]})     # Same page is requested again
+                                if n_bad_responses >= bad_response_threshold:
+                                    raise ConnectionError(f'Reached bad response threshold: {bad_response_threshold}')
+                                continue
+
+                            items = response.json()
+                            if not items:
+                                break
+
+                            # Don't page through the whole publication database if the server ignores the filters
+                            if not is_filtered_page(items, classification_code, year):
+                                are_filters_applied = False
+                                break
+
+                            for item in items:
+                                publication = publications_index.get(item["Guid"])
+                                if publication is None or item["Guid"] in bulk_retrieved_GUIDs:
+                                    continue
+                                bulk_retrieved_GUIDs.add(item["Guid"])
+
+                                if all_publications_writer:
+                                    all_publications_writer.write({**publication, "DATA": item})
+                                # Only the fields used in the analysis are kept from articles
+                                if is_scientific_article(item):
+                                    scientific_articles += [EtisPublication.from_etis(publication["GUID"], publication["PROJECT_GUIDS"], item)]
+
+                            i += items_per_request
+                            _ = ETIS_progress_bar.update()
+
+            stragglers = [publication for publication in publications if publication["GUID"] not in bulk_retrieved_GUIDs]
+            publications_to_request_by_GUID = stragglers if ETIS_PUBLICATION_FETCH_STRAGGLERS or not are_filters_applied else []
+
+            if not are_filters_applied:
+                info_string = f'ETIS API returned publications that do not match the {ETIS_PUBLICATION_CLASSIFICATION_PARAMETER} and {ETIS_PUBLICATION_YEAR_PARAMETER} filters. Stopped bulk retrieval'
+                logger.info(info_string)
+            info_string = f'Found {len(bulk_retrieved_GUIDs)} of the {len(publications)} publications by bulk retrieval. {len(stragglers)} publications were not in the bulk results. Requesting {len(publications_to_request_by_GUID)} publications by GUID'
+            logger.info(info_string)
+
+        for publication in tqdm.tqdm(publications_to_request_by_GUID, desc="Requesting ETIS publications"):
+            response = ETIS_publication_session.get_items(
+                parameters={"Guid": publication["GUID"]}
+            )
+            if not response:
+                bad_responses += [response]
+                n_bad_responses += 1
+                metrics.count("bad_responses_total", {"stage": stage["NAME"]})
+                if n_bad_responses >= bad_response_threshold:
+                    raise ConnectionError(f'Reached bad response threshold: {bad_response_threshold}')
+                continue
 
-###########################
-# Get scientific articles #
-###########################
+            try:
+                publication_data = response.json()[0]
+            except Exception as exception:
+                publications_with_no_data += [publication]
+                continue
 
-# Reload data from save file
-publications = read_latest_file(RAW_DATA_DIRECTORY_PATH, "publications")
+            if all_publications_writer:
+                all_publications_writer.write({**publication, "DATA": publication_data})
+            if is_scientific_article(publication_data):
+                scientific_articles += [EtisPublication.from_etis(publication["GUID"], publication["PROJECT_GUIDS"], publication_data)]
 
-# Select only already published scientific articles
-scientific_articles = []
-for publication in publications:
-    if not publication["DATA"]:
-        continue
-    if not publication["DATA"]["ClassificationCode"] in ETIS_SCIENTIFIC_ARTICLES_CLASSIFICATION_CODES:
-        continue
-    if not publication["DATA"]["PublicationStatusEng"].lower() == "published":
-        continue
+        if all_publications_writer:
+            all_publications_writer.close()
+            info_string = f'Saved all pulled publications to {all_publications_save_path}'
+            logger.info(info_string)
 
-    scientific_articles += [publication]
+        publications_with_no_data_save_path = f'{RAW_DATA_DIRECTORY_PATH.strip("/")}/publications_with_no_data_{get_timestamp_string()}.json'
+        save_data(publications_with_no_data, publications_with_no_data_save_path, SAVE_PARQUET)
 
-scientific_articles_save_path = f'{RAW_DATA_DIRECTORY_PATH.strip("/")}/scientific_articles_{get_timestamp_string()}.json'
-with open(scientific_articles_save_path, "w", encoding="utf8") as save_file:
-    save_file.write(json.dumps(scientific_articles, indent=2, ensure_ascii=False))
+        scientific_articles_save_path = f'{RAW_DATA_DIRECTORY_PATH.strip("/")}/scientific_articles_{get_timestamp_string()}.json'
+        save_data([article.to_dict() for article in scientific_articles], scientific_articles_save_path, SAVE_PARQUET)
 
-info_string = f'{len(scientific_articles)} of the {len(publications)} publications are classified as scientific articles. Saved to {scientific_articles_save_path}'
-logger.info(info_string)
+        info_string1 = f'{len(scientific_articles)} of the {len(publications)} publications are classified as scientific articles. Saved to {scientific_articles_save_path}'
+        info_string2 = f'ETIS API failed to return data for {len(publications_with_no_data)} of the {len(publications_to_request_by_GUID)} publications requested by GUID. See {publications_with_no_data_save_path} for details'
+        logger.info(info_string1)
+        logger.info(info_string2)
 
 
 #################################################
 # Pull publication info from Open Access Button #
 #################################################
 
-# Reload data from save file
-scientific_articles = read_latest_file(RAW_DATA_DIRECTORY_PATH, "scientific_articles")
-
-open_access_button_session = OpenAccessButtonSession()
-
-n_bad_responses = 0
-bad_response_threshold = 10         # Throw after this threshold of bad responses (don't spam API)
-requests_per_second_limit = 1       # Limit requests that can be made per second to respect API rules
-
-bad_responses = []
-oa_button_reponses = []
-lap_timestamp = time.monotonic()
-for publication in tqdm.tqdm(scientific_articles, desc="Requesting publication Open Access Button data"):
-    inputs = [
-        clean_DOI(publication["DATA"]["Doi"]),
-        publication["DATA"]["Url"],
-        publication["DATA"]["Title"]
-    ]
-    inputs = [input for input in inputs if input]       # Drop null inputs
-
-    oa_button_reponse = {
-        "GUID": publication["GUID"],
-        "UNSUCCESSFUL_INPUTS": [],
-        "SUCCESSFUL_INPUT": None,
-        "DATA": None}
-    
-    for input in inputs:
-        # Add delay if the pace of the requests is coming close to the API rate limit
-        limit_rate(lap_timestamp, requests_per_second_limit)
+def pull_open_access_button_data() -> None:
+    """
+    Looks up the saved scientific articles from the open access snapshot and Open Access Button and saves the results.
+    """
+    with metrics.stage("pull_open_access_button_data") as stage:
+        # Reload data from save file
+        scientific_articles = [EtisPublication.from_dict(item) for item in read_latest_file(RAW_DATA_DIRECTORY_PATH, "scientific_articles")]
+
+        open_access_button_session = OpenAccessButtonSession()
+        open_access_button_cache = OpenAccessButtonCache(
+            path=OPEN_ACCESS_BUTTON_CACHE_PATH,
+            hit_TTL_days=OPEN_ACCESS_BUTTON_HIT_TTL_DAYS,
+            miss_TTL_days=OPEN_ACCESS_BUTTON_MISS_TTL_DAYS)
+
+        # Answer DOI lookups from the local open access snapshot when there is one
+        # Open Access Button is only queried for articles that are not in the snapshot
+        open_access_snapshot_index = None
+        if os.path.exists(OPEN_ACCESS_SNAPSHOT_INDEX_PATH):
+            open_access_snapshot_index = OpenAccessSnapshotIndex(OPEN_ACCESS_SNAPSHOT_INDEX_PATH)
+
+        n_bad_responses = 0
+        bad_response_threshold = 10         # Throw after this threshold of bad responses (don't spam API)
+        requests_per_second_limit = OPEN_ACCESS_BUTTON_REQUESTS_PER_SECOND_LIMIT
+
+        # Group articles that would send the same inputs to Open Access Button (e.g. same publication under several GUIDs)
+        # Each group is looked up once and the result is given to every article in the group
+        article_groups = {}
+        article_DOIs = clean_DOIs([publication.DOI for publication in scientific_articles])
+        for publication, DOI in zip(scientific_articles, article_DOIs):
+            inputs = get_lookup_inputs(DOI, publication.URL, publication.title)
+            lookup_keys = tuple(OpenAccessButtonCache.get_key(input_type, input) for input_type, input in inputs)
+            article_group = article_groups.setdefault(lookup_keys, {"INPUTS": inputs, "GUIDS": []})
+            article_group["GUIDS"] += [publication.GUID]
+
+        n_requests = 0
+        n_snapshot_matches = 0
+        bad_responses = []
+        oa_button_reponses = []
         lap_timestamp = time.monotonic()
-        response = open_access_button_session.find(input)
-        
-        if not response:
-            bad_responses += [response]
-            n_bad_responses += 1
-            if n_bad_responses >= bad_response_threshold:
-                raise ConnectionError(f'Reached bad response threshold: {bad_response_threshold}')
-            continue
+        # Lookups are saved to the cache also when the run stops, e.g. on the bad response threshold, so that they are not requested again
+        try:
+            for lookup_keys, article_group in tqdm.tqdm(article_groups.items(), desc="Requesting publication Open Access Button data"):
+                unsuccessful_inputs = []
+                successful_input = None
+                data = None
+
+                input_type, input = article_group["INPUTS"][0] if article_group["INPUTS"] else (None, None)
+                snapshot_record = None
+                if open_access_snapshot_index and input_type == "DOI":
+                    snapshot_record = open_access_snapshot_index.get(input)
+                    metrics.count("cache_lookups_total", {"cache": "open_access_snapshot", "result": "hit" if snapshot_record else "miss"})
+
+                if snapshot_record:
+                    n_snapshot_matches += 1
+                    data = {
+                        "url": snapshot_record["BEST_OPEN_ACCESS_URL"],
+                        "is_oa": snapshot_record["IS_OPEN_ACCESS"],
+                        "oa_type": snapshot_record["OPEN_ACCESS_TYPE"],
+                        "source": "open_access_snapshot"}
+                    if data["url"]:
+                        successful_input = input
+                    else:
+                        unsuccessful_inputs += [input]
+
+                # Query Open Access Button only for articles that the snapshot doesn't cover
+                remaining_lookups = [] if snapshot_record else zip(lookup_keys, article_group["INPUTS"])
+                for lookup_key, (_, input) in remaining_lookups:
+                    cache_entry = open_access_button_cache.get(lookup_key)
+
+                    if not cache_entry:
+                        # Add delay if the pace of the requests is coming close to the API rate limit
+                        limit_rate(lap_timestamp, requests_per_second_limit)
+                        lap_timestamp = time.monotonic()
+                        response = open_access_button_session.find(input)
+                        n_requests += 1
+
+                        if not response:
+                            bad_responses += [response]
+                            n_bad_responses += 1
+                            metrics.count("bad_responses_total", {"stage": stage["NAME"]})
+                            if n_bad_responses >= bad_response_threshold:
+                                raise ConnectionError(f'Reached bad response threshold: {bad_response_threshold}')
+                            continue
+
+                        cache_entry = open_access_button_cache.set(lookup_key, response.json())
+
+                    data = cache_entry["DATA"]
+
+                    if cache_entry["IS_FOUND"]:
+                        successful_input = input
+                        break
+
+                    unsuccessful_inputs += [input]
+
+                for GUID in article_group["GUIDS"]:
+                    oa_button_reponse = {
+                        "GUID": GUID,
+                        "UNSUCCESSFUL_INPUTS": unsuccessful_inputs,
+                        "SUCCESSFUL_INPUT": successful_input,
+                        "DATA": data}
+                    oa_button_reponses += [oa_button_reponse]
+        finally:
+            open_access_button_cache.save()
+            if open_access_snapshot_index:
+                open_access_snapshot_index.close()
+
+        oa_button_reponses_save_path = f'{RAW_DATA_DIRECTORY_PATH.strip("/")}/oa_button_reponses_{get_timestamp_string()}.json'
+        save_data(oa_button_reponses, oa_button_reponses_save_path, SAVE_PARQUET)
+
+        info_string1 = f'Checked publication open access status by Open Access Button API. Saved results to {oa_button_reponses_save_path}'
+        info_string2 = f'Open Access Button API failed to return data for {len(bad_responses)} of the {len(scientific_articles)} scientific articles'
+        info_string3 = f'Made {n_requests} Open Access Button requests for {len(article_groups)} unique lookups. {n_snapshot_matches} lookups were answered from the local open access snapshot and {open_access_button_cache.n_hits} inputs from cache {OPEN_ACCESS_BUTTON_CACHE_PATH}'
+        logger.info(info_string1)
+        logger.info(info_string2)
+        logger.info(info_string3)
+
+
+##################################
+# Verify Open Access Button URLs #
+##################################
+
+def verify_open_access_button_urls() -> None:
+    """
+    Checks that the saved Open Access Button URLs lead to the publications and saves the verdicts.
+    """
+    with metrics.stage("verify_open_access_button_urls"):
+        # Reload data from save file
+        oa_button_reponses = read_latest_file(RAW_DATA_DIRECTORY_PATH, "oa_button_reponses")
 
-        oa_button_reponse["DATA"] = response.json()
+        max_workers = 32                    # Number of URLs checked simultaneously
+        max_requests_per_host = 4           # Don't send more simultaneous requests than this to any single server
+        request_timeout = 30                # Seconds
 
-        if response.json().get("url"):
-            oa_button_reponse["SUCCESSFUL_INPUT"] = input
-            break
+        oa_button_URLs = list(dict.fromkeys(item["DATA"]["url"] for item in oa_button_reponses if (item["DATA"] or {}).get("url")))
+        with tqdm.tqdm(total=len(oa_button_URLs), desc="Verifying Open Access Button URLs") as verification_progress_bar:
+            oa_button_URL_verifications = verify_URLs(
+                oa_button_URLs,
+                max_workers=max_workers,
+                max_per_host=max_requests_per_host,
+                timeout=request_timeout,
+                progress_bar=verification_progress_bar)
 
-        oa_button_reponse["UNSUCCESSFUL_INPUTS"] += [input]
-    
-    oa_button_reponses += [oa_button_reponse]
+        oa_button_URL_verifications_save_path = f'{RAW_DATA_DIRECTORY_PATH.strip("/")}/oa_button_url_verifications_{get_timestamp_string()}.json'
+        save_data(oa_button_URL_verifications, oa_button_URL_verifications_save_path, SAVE_PARQUET)
 
-oa_button_reponses_save_path = f'{RAW_DATA_DIRECTORY_PATH.strip("/")}/oa_button_reponses_{get_timestamp_string()}.json'
-with open(oa_button_reponses_save_path, "w", encoding="utf8") as save_file:
-    save_file.write(json.dumps(oa_button_reponses, indent=2, ensure_ascii=False))
+        n_verdicts = {}
+        for verification in oa_button_URL_verifications:
+            n_verdicts[verification["VERDICT"]] = n_verdicts.get(verification["VERDICT"], 0) + 1
 
-info_string1 = f'Checked publication open access status by Open Access Button API. Saved results to {oa_button_reponses_save_path}'
-info_string2 = f'Open Access Button API failed to return data for {len(bad_responses)} of the {len(scientific_articles)} scientific articles'
-logger.info(info_string1)
-logger.info(info_string2)
+        info_string = f'Verified {len(oa_button_URL_verifications)} Open Access Button URLs: {n_verdicts}. Saved results to {oa_button_URL_verifications_save_path}'
+        logger.info(info_string)
 
 
 ##############################
 # Summarise open access data #
 ##############################
 
-# Reload data from save file
-oa_button_reponses = read_latest_file(RAW_DATA_DIRECTORY_PATH, "oa_button_reponses")
-scientific_articles = read_latest_file(RAW_DATA_DIRECTORY_PATH, "scientific_articles")
-
-manually_checked_publications = []
-if os.path.exists(MANUALLY_CHECKED_PUBLICATIONS_PATH):
-    with open(MANUALLY_CHECKED_PUBLICATIONS_PATH, encoding="utf8") as read_file:
-        manually_checked_publications = json.loads(read_file.read())
-
-oa_button_reponses_index = {item["GUID"]: item for item in oa_button_reponses}
-open_access_manual_check_results_index = {item["GUID"]: item for item in manually_checked_publications}
-
-open_access_data = []
-for article in scientific_articles:
-    ETIS_data = article["DATA"]
-    oa_button_reponse = oa_button_reponses_index.get(article["GUID"]) or {}
-    oa_button_data = oa_button_reponse.get("DATA") or {}
-    manual_check_result = open_access_manual_check_results_index.get(article["GUID"]) or {}
-
-    open_access_datum = {
-        "GUID": article["GUID"],
-        "PROJECT_GUIDS": article["PROJECT_GUIDS"],
-        "TITLE": ETIS_data["Title"],
-        "PERIODICAL": ETIS_data["Periodical"],
-        "DOI": clean_DOI(ETIS_data["Doi"]),
-        "URL": ETIS_data["Url"],
-        "IS_OPEN_ACCESS": ETIS_data["IsOpenAccessEng"].lower() == "yes",
-        "OPEN_ACCESS_TYPE": ETIS_data["OpenAccessTypeNameEng"],
-        "LICENSE": ETIS_data.get("OpenAccessLicenceNameEng"),
-        "IS_PUBLIC_FILE": ETIS_data["PublicFile"],
-        "OA_BUTTON_URL": oa_button_data.get("url"),
-        "IS_AVAILABLE_MANUALLY_CHECKED": manual_check_result.get("IS_AVAILABLE")
-    }
-    open_access_data += [open_access_datum]
-
-open_access_data_save_path = f'{RESULTS_DATA_DIRECTORY_PATH.strip("/")}/open_access_data_{get_timestamp_string()}.json'
-with open(open_access_data_save_path, "w", encoding="utf8") as save_file:
-    save_file.write(json.dumps(open_access_data, indent=2, ensure_ascii=False))
-
-info_string = f'Summarised publication open access data. Saved results to {open_access_data_save_path}'
-logger.info(info_string)
+def summarise_open_access_data() -> None:
+    """
+    Combines ETIS, Open Access Button and manual check data of the scientific articles and saves it as open access data.
+    """
+    with metrics.stage("summarise_open_access_data"):
+        # Reload data from save file
+        oa_button_reponses = read_latest_file(RAW_DATA_DIRECTORY_PATH, "oa_button_reponses")
+        scientific_articles = [EtisPublication.from_dict(item) for item in read_latest_file(RAW_DATA_DIRECTORY_PATH, "scientific_articles")]
+        try:
+            oa_button_URL_verifications = read_latest_file(RAW_DATA_DIRECTORY_PATH, "oa_button_url_verifications")
+        except FileNotFoundError:
+            # URL verification is optional: without it all Open Access Button URL verdicts stay unknown
+            oa_button_URL_verifications = []
+            warning_string = f'No Open Access Button URL verifications found in {RAW_DATA_DIRECTORY_PATH}. Treating all Open Access Button URLs as not verified.'
+            logger.warning(warning_string)
+
+        manually_checked_publications = []
+        if os.path.exists(MANUALLY_CHECKED_PUBLICATIONS_PATH):
+            with open(MANUALLY_CHECKED_PUBLICATIONS_PATH, encoding="utf8") as read_file:
+                manually_checked_publications = json.loads(read_file.read())
+
+        oa_button_reponses_index = {item["GUID"]: item for item in oa_button_reponses}
+        oa_button_URL_verifications_index = {item["URL"]: item for item in oa_button_URL_verifications}
+        open_access_manual_check_results_index = {item["GUID"]: item for item in manually_checked_publications}
+
+        open_access_data = []
+        article_DOIs = clean_DOIs([article.DOI for article in scientific_articles])
+        for article, DOI in zip(scientific_articles, article_DOIs):
+            oa_button_reponse = oa_button_reponses_index.get(article.GUID) or {}
+            oa_button_data = oa_button_reponse.get("DATA") or {}
+            manual_check_result = open_access_manual_check_results_index.get(article.GUID) or {}
+
+            open_access_datum = OpenAccessDatum(
+                GUID=article.GUID,
+                project_GUIDs=article.project_GUIDs,
+                title=article.title,
+                periodical=article.periodical,
+                DOI=DOI,
+                URL=article.URL,
+                is_open_access=(article.is_open_access or "").lower() == "yes",
+                open_access_type=article.open_access_type,
+                license=article.license,
+                is_public_file=article.is_public_file,
+                OA_button_URL=oa_button_data.get("url"),
+                OA_button_URL_verdict=(oa_button_URL_verifications_index.get(oa_button_data.get("url")) or {}).get("VERDICT"),
+                is_available_manually_checked=manual_check_result.get("IS_AVAILABLE"),
+                publishing_year=article.publishing_year)
+            open_access_data += [open_access_datum]
+
+        # Same publication can be reported under different GUIDs
+        # Mark duplicates (same DOI or near-identical title) with a shared cluster ID that analysis can collapse on
+        cluster_IDs = cluster_publications(
+            GUIDs=[datum.GUID for datum in open_access_data],
+            DOIs=[datum.DOI for datum in open_access_data],
+            titles=[datum.title for datum in open_access_data],
+            periodicals=[datum.periodical for datum in open_access_data])
+        for open_access_datum, cluster_ID in zip(open_access_data, cluster_IDs):
+            open_access_datum.cluster_ID = cluster_ID
+
+        open_access_data_save_path = f'{RESULTS_DATA_DIRECTORY_PATH.strip("/")}/open_access_data_{get_timestamp_string()}.json'
+        save_data([datum.to_dict() for datum in open_access_data], open_access_data_save_path, SAVE_PARQUET)
+
+        info_string = f'Summarised publication open access data. Found {len(set(cluster_IDs))} distinct publications among {len(open_access_data)} GUIDs. Saved results to {open_access_data_save_path}'
+        logger.info(info_string)
 
 
 ########################################
 # Check for ambiguous open access data #
 ########################################
 
-# Reload data from save file
-open_access_data = read_latest_file(RESULTS_DATA_DIRECTORY_PATH, "open_access_data")
+def check_ambiguous_open_access_data() -> None:
+    """
+    Saves the publications whose ETIS and Open Access Button open access info doesn't agree.
+    """
+    with metrics.stage("check_ambiguous_open_access_data"):
+        # Reload data from save file
+        open_access_data = [OpenAccessDatum.from_dict(item) for item in read_latest_file(RESULTS_DATA_DIRECTORY_PATH, "open_access_data")]
+
+        # A publication has ambiguous open access data if it's ETIS and Open Access Button information doesn't align.
 
-# A publication has ambiguous open access data if it's ETIS and Open Access Button information doesn't align.
+        open_access_data_ambiguous = []
+        for publication in open_access_data:
+            # Skip publications where ETIS and Open Access Button info both agree that publication is available
+            if publication.is_open_access and publication.OA_button_URL:
+                continue
+
+            # Skip publications where ETIS and Open Access Button info both agree that publication is not available
+            if not (publication.is_open_access or publication.OA_button_URL):
+                continue
+
+            # Skip publications that have manually checked availability status
+            if publication.is_available_manually_checked is not None:
+                continue
 
-open_access_data_ambiguous = []
-for publication in open_access_data:
-    # Skip publications where ETIS and Open Access Button info both agree that publication is available
-    if publication["IS_OPEN_ACCESS"] and publication["OA_BUTTON_URL"]:
-        continue
+            # All remaining publications have ambiguous open access status
+            open_access_data_ambiguous += [publication]
 
-    # Skip publications where ETIS and Open Access Button info both agree that publication is not available
-    if not (publication["IS_OPEN_ACCESS"] or publication["OA_BUTTON_URL"]):
-        continue
+        if open_access_data_ambiguous:
+            open_access_data_ambiguous_save_path = f'{RESULTS_DATA_DIRECTORY_PATH.strip("/")}/open_access_data_ambiguous_{get_timestamp_string()}.json'
+            save_data([datum.to_dict() for datum in open_access_data_ambiguous], open_access_data_ambiguous_save_path, SAVE_PARQUET)
 
-    # Skip publications that have manually checked availability status
-    if publication["IS_AVAILABLE_MANUALLY_CHECKED"] is not None:
-        continue
+            info_string1 = f'{len(open_access_data_ambiguous)} publications have ambiguous open access status. See details in {open_access_data_ambiguous_save_path}'
+            info_string2 = f'You can manually override the publication availability status in {MANUALLY_CHECKED_PUBLICATIONS_PATH}'
+            logger.info(info_string1)
+            logger.info(info_string2)
 
-    # All remaining publications have ambiguous open access status
-    open_access_data_ambiguous += [publication]
 
-if open_access_data_ambiguous:
-    open_access_data_ambiguous_save_path = f'{RESULTS_DATA_DIRECTORY_PATH.strip("/")}/open_access_data_ambiguous_{get_timestamp_string()}.json'
-    with open(open_access_data_ambiguous_save_path, "w", encoding="utf8") as save_file:
-        save_file.write(json.dumps(open_access_data_ambiguous, indent=2, ensure_ascii=False))
+########
+# Main #
+########
 
-    info_string1 = f'{len(open_access_data_ambiguous)} publications have ambiguous open access status. See details in {open_access_data_ambiguous_save_path}'
-    info_string2 = f'You can manually override the publication availability status in {MANUALLY_CHECKED_PUBLICATIONS_PATH}'
-    logger.info(info_string1)
-    logger.info(info_string2)
+def main() -> None:
+    """
+    Harvests ETIS and Open Access Button data and summarises the open access status of the scientific articles of Horizon projects.
+    """
+    make_directories(RAW_DATA_DIRECTORY_PATH, RESULTS_DATA_DIRECTORY_PATH, CACHE_DIRECTORY_PATH)
+    setup_logger()
+
+    try:
+        pull_etis_projects()
+        publications = get_project_publication_info()
+        pull_scientific_articles(publications)
+        pull_open_access_button_data()
+        if VERIFY_OPEN_ACCESS_BUTTON_URLS:
+            verify_open_access_button_urls()
+        summarise_open_access_data()
+        check_ambiguous_open_access_data()
+    finally:
+        metrics_save_path = metrics.save(METRICS_DIRECTORY_PATH, "get_data")
+        info_string = f'Saved run metrics to {metrics_save_path}'
+        logger.info(info_string)
+
+
+if __name__ == "__main__":
+    main()
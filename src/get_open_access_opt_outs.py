@@ -1,16 +1,7 @@
 # standard
-import datetime
-import json
-import logging
 import os
-import re
-import sys
-import time
-import urllib
 # external
 import polars
-import requests
-import tqdm
 
 
 ##########
@@ -39,5 +30,30 @@ project_schema = {
     "cost": polars.Float64
 }
 
-project = polars.read_csv(projects_path, schema=project_schema)
-print(project.head())
+
+#########################
+# Classes and functions #
+#########################
+
+def read_projects() -> polars.DataFrame:
+    """
+    Gives the OpenAIRE projects table from the projects CSV.
+    """
+    project = polars.read_csv(projects_path, schema=project_schema)
+    return project
+
+
+########
+# Main #
+########
+
+def main() -> None:
+    """
+    Shows the first rows of the OpenAIRE projects table.
+    """
+    project = read_projects()
+    print(project.head())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,13 @@
 # standard
-import datetime
-import json
 import logging
-import sys
+import os
 # external
 import requests
 import tqdm
+# local
+import metrics
+from common import get_timestamp_string, make_directories, save_data, setup_logger
+from transport import PooledSession
 
 
 ##########
@@ -13,18 +15,19 @@ import tqdm
 ##########
 
 RAW_DATA_DIRECTORY_PATH = "./data/raw/"
+METRICS_DIRECTORY_PATH = "./data/metrics/"
 
 
 #########################
 # Classes and functions #
 #########################
 
-class OpenAireGraphSession(requests.Session):
+class OpenAireGraphSession(PooledSession):
     """
     Class for requesting info from OpenAIRE graph API.
     https://graph.openaire.eu/docs/apis/graph-api/
     """
-    BASE_URL = "https://api.openaire.eu/graph/v1"
+    BASE_URL = os.environ.get("OPENAIRE_GRAPH_API_URL", "https://api.openaire.eu/graph/v1")
 
     def __init__(self, service: str) -> None:
         super().__init__()
@@ -48,75 +51,86 @@ class OpenAireGraphSession(requests.Session):
         return response
 
 
-def get_timestamp_string() -> str:
-    """
-    Gives a standard current timestamp string to use in filenames.
-    """
-    timestamp_format = "%Y%m%d%H%M%S%Z"
-
-    timestamp = datetime.datetime.now(datetime.timezone.utc)
-    timestamp_string = datetime.datetime.strftime(timestamp, timestamp_format)
-    return timestamp_string
-
-
 #####################
 # Environment setup #
 #####################
 
-# Logger
 logger = logging.getLogger()
-logger.setLevel("INFO")
-logger.addHandler(logging.StreamHandler(sys.stdout))
 
 
 #########################
 # Get OpenAire projects #
 #########################
 
-openaire_graph_session = OpenAireGraphSession("projects")
-openaire_graph_parameters = {
-    "relOrganizationCountryCode": "EE",
-}
-
-n_bad_responses = 0
-bad_response_threshold = 10         # Throw after this threshold of bad responses (don't spam API)
-items_per_request = 100             # Get items in batches
-
-projects = []
-bad_responses = []
-with tqdm.tqdm() as openaire_graph_progress_bar:
-    _ = openaire_graph_progress_bar.set_description_str("Requesting OpenAire Graph projects")
-
-    i_page = 1
-    while True:
-        response = openaire_graph_session.get_items(
-            i_page=i_page,
-            n_per_page=items_per_request,
-            parameters=openaire_graph_parameters)
-        
-        if not response:
-            bad_responses += [response]
-            n_bad_responses += 1
-            if n_bad_responses >= bad_response_threshold:
-                raise ConnectionError(f'Reached bad response threshold: {bad_response_threshold}')
-            continue
-
-        items = response.json().get("results")
-        if not items:
-            break
-
-        projects += items
-        i_page += 1
-        _ = openaire_graph_progress_bar.update()
+def get_openaire_graph_projects() -> None:
+    """
+    Requests the OpenAIRE graph projects of Estonian organizations and saves them.
+    """
+    with metrics.stage("get_openaire_graph_projects") as stage:
+        openaire_graph_session = OpenAireGraphSession("projects")
+        openaire_graph_parameters = {
+            "relOrganizationCountryCode": "EE",
+        }
+
+        n_bad_responses = 0
+        bad_response_threshold = 10         # Throw after this threshold of bad responses (don't spam API)
+        items_per_request = 100             # Get items in batches
+
+        projects = []
+        bad_responses = []
+        with tqdm.tqdm() as openaire_graph_progress_bar:
+            _ = openaire_graph_progress_bar.set_description_str("Requesting OpenAire Graph projects")
+
+            i_page = 1
+            while True:
+                response = openaire_graph_session.get_items(
+                    i_page=i_page,
+                    n_per_page=items_per_request,
+                    parameters=openaire_graph_parameters)
+
+                if not response:
+                    bad_responses += [response]
+                    n_bad_responses += 1
+                    metrics.count("request_retries_total", {"stage": stage["NAME"]})     # Same page is requested again
+                    if n_bad_responses >= bad_response_threshold:
+                        raise ConnectionError(f'Reached bad response threshold: {bad_response_threshold}')
+                    continue
+
+                items = response.json().get("results")
+                if not items:
+                    break
+
+                projects += items
+                i_page += 1
+                _ = openaire_graph_progress_bar.update()
+
+        # Save projects to file
+        projects_save_path = f'{RAW_DATA_DIRECTORY_PATH.strip("/")}/openaire_graph_projects_{get_timestamp_string()}.json'
+        save_data(projects, projects_save_path)
+
+        info_string = f'Found {len(projects)} relevant projects in OpenAire Graph. Saved to {projects_save_path}'
+        logger.info(info_string)
+
+
+########
+# Main #
+########
+
+def main() -> None:
+    """
+    Harvests the OpenAIRE graph projects of Estonian organizations.
+    """
+    make_directories(RAW_DATA_DIRECTORY_PATH)
+    setup_logger()
 
+    try:
+        get_openaire_graph_projects()
+    finally:
+        metrics_save_path = metrics.save(METRICS_DIRECTORY_PATH, "get_openaire_graph_projects")
+        info_string = f'Saved run metrics to {metrics_save_path}'
+        logger.info(info_string)
 
-#########################
-# Save projects to file #
-#########################
 
-projects_save_path = f'{RAW_DATA_DIRECTORY_PATH.strip("/")}/openaire_graph_projects_{get_timestamp_string()}.json'
-with open(projects_save_path, "w", encoding="utf8") as save_file:
-    save_file.write(json.dumps(projects, indent=2, ensure_ascii=False))
+if __name__ == "__main__":
+    main()
 
-info_string = f'Found {len(projects)} relevant projects in OpenAire Graph. Saved to {projects_save_path}'
-logger.info(info_string)
@@ -1,13 +1,13 @@
 # standard
-import datetime
-import json
 import logging
 import os
-import re
-import sys
 # external
 import requests
 import tqdm
+# local
+import metrics
+from common import get_timestamp_string, make_directories, read_latest_file, save_data, setup_logger
+from transport import PooledSession
 
 
 ##########
@@ -32,7 +32,15 @@ ETIS_FINISHED_PROJECT_STATUS_CODE = 3
     # 2 - ongoing projects
     # 3 - finished projects
 
+# ETIS project field: OpenAIRE search parameter
+ETIS_OPENAIRE_MAP = {
+    "FinancierProjectNr": "grantID",
+    "Acronym": "acronym",
+    "TitleEng": "name"
+}
+
 RAW_DATA_DIRECTORY_PATH = "./data/raw/"
+METRICS_DIRECTORY_PATH = "./data/metrics/"
 
 
 #########################
@@ -40,13 +48,13 @@ RAW_DATA_DIRECTORY_PATH = "./data/raw/"
 #########################
 
 
-class OpenAireSession(requests.Session):
+class OpenAireSession(PooledSession):
     """
     Class for requesting info from OpenAIRE search API.
     https://graph.openaire.eu/docs/apis/search-api/projects
     https://zenodo.org/records/2643199
     """
-    BASE_URL = "https://api.openaire.eu/search"
+    BASE_URL = os.environ.get("OPENAIRE_SEARCH_API_URL", "https://api.openaire.eu/search")
 
     def __init__(self, service: str) -> None:
         super().__init__()
@@ -72,104 +80,101 @@ class OpenAireSession(requests.Session):
         return response
 
 
-def get_timestamp_string() -> str:
-    """
-    Gives a standard current timestamp string to use in filenames.
-    """
-    timestamp_format = "%Y%m%d%H%M%S%Z"
-
-    timestamp = datetime.datetime.now(datetime.timezone.utc)
-    timestamp_string = datetime.datetime.strftime(timestamp, timestamp_format)
-    return timestamp_string
-
-
-def read_latest_file(dir_path: str, file_handle: str = None) -> list[dict]:
-    """
-    Reads file with the latest timestamp in filename from given dir_path.
-    If file_handle is given, checks only filenames with the given file_handle followed by a timestamp.
-    """
-    if not file_handle:
-        file_handle = ".+"
-    name_pattern = file_handle + r'_(\d+)'
-
-    files = [file for file in os.listdir(dir_path) if re.match(name_pattern, file)]
-    files_latest = sorted(files, key=lambda x: re.match(name_pattern, x).group(1))[-1]
-    path = f'{dir_path.strip("/")}/{files_latest}'
-
-    with open(path, encoding="utf8") as read_file:
-        data = json.loads(read_file.read())
-    
-    return data
-
-
 #####################
 # Environment setup #
 #####################
 
-# Logger
 logger = logging.getLogger()
-logger.setLevel("INFO")
-logger.addHandler(logging.StreamHandler(sys.stdout))
 
 
 #############################
 # Check Horizon identifiers #
 #############################
 
-# Reload data from save file
-projects = read_latest_file(RAW_DATA_DIRECTORY_PATH, "projects")
+def check_horizon_identifiers() -> list[dict]:
+    """
+    Gives the identifiers of the saved ETIS Horizon projects to search OpenAIRE with.
+    """
+    with metrics.stage("check_horizon_identifiers"):
+        # Reload data from the ETIS projects file saved by get_data.py
+        ETIS_projects = read_latest_file(RAW_DATA_DIRECTORY_PATH, "etis_projects")
 
-ETIS_openaire_map = {
-    "FinancierProjectNr": "grantID",
-    "Acronym": "acronym",
-    "TitleEng": "name"
-}
+        input_parameters = list(ETIS_OPENAIRE_MAP.keys()) + ["Guid"]
+        openaire_inputs = []
+        for project in ETIS_projects:
+            programme_codes = {programme["ProgrammeCode"] for programme in project["Programmes"]}
+            if not (programme_codes & set(ETIS_HORIZON_PROGRAM_CODES)):
+                continue
 
-input_parameters = list(ETIS_openaire_map.keys()) + ["Guid"]
-openaire_inputs = []
-for project in projects:
-    if not (project["ProgrammeCode"] in ETIS_HORIZON_PROGRAM_CODES):
-        continue
+            openaire_inputs += [{parameter: project[parameter] for parameter in input_parameters}]
 
-    openaire_inputs += [{parameter: project[parameter] for parameter in input_parameters}]
+    return openaire_inputs
 
 
 #########################
 # Request OpenAIRE data #
 #########################
 
-openaire_session = OpenAireSession("projects")
+def request_openaire_data(openaire_inputs: list[dict]) -> None:
+    """
+    Searches OpenAIRE projects by each identifier and saves the Horizon IDs found.
+    """
+    with metrics.stage("request_openaire_data"):
+        openaire_session = OpenAireSession("projects")
 
-openaire_search_project_results = []
-for input in tqdm.tqdm(openaire_inputs, desc="OpenAIRE requests"):
-    result = {key: {"input": value} for key, value in input.items()}  
-    for input_key, input_value in input.items():
-        if not input_value or input_key == "Guid":
-            continue
+        openaire_search_project_results = []
+        for input in tqdm.tqdm(openaire_inputs, desc="OpenAIRE requests"):
+            result = {key: {"input": value} for key, value in input.items()}  
+            for input_key, input_value in input.items():
+                if not input_value or input_key == "Guid":
+                    continue
 
-        response = openaire_session.get_items(parameters={ETIS_openaire_map[input_key]: input_value})
+                response = openaire_session.get_items(parameters={ETIS_OPENAIRE_MAP[input_key]: input_value})
 
-        result[input_key]["status"] = response.status_code
-        result[input_key]["result"] = []
-        if not response:
-            continue
+                result[input_key]["status"] = response.status_code
+                result[input_key]["result"] = []
+                if not response:
+                    continue
 
-        response_json = response.json()
-        n_items = int(response_json["response"]["header"]["total"]["$"])
-        if n_items == 0:
-           continue
+                response_json = response.json()
+                n_items = int(response_json["response"]["header"]["total"]["$"])
+                if n_items == 0:
+                   continue
 
-        result[input_key]["result"] = [item["metadata"]["oaf:entity"]["oaf:project"]["code"]["$"] for item in response_json["response"]["results"]["result"]]
+                result[input_key]["result"] = [item["metadata"]["oaf:entity"]["oaf:project"]["code"]["$"] for item in response_json["response"]["results"]["result"]]
 
-        n_used_requests = int(response.headers["x-ratelimit-used"])
-        n_request_limit = int(response.headers["x-ratelimit-limit"])
+                n_used_requests = int(response.headers["x-ratelimit-used"])
+                n_request_limit = int(response.headers["x-ratelimit-limit"])
 
-        if n_used_requests >= n_request_limit:
-            raise RuntimeError("OpenAIRE request limit reached.")
+                metrics.set_gauge("rate_limit_requests_remaining", n_request_limit - n_used_requests, {"endpoint": "openaire_search"})
+                if n_used_requests >= n_request_limit:
+                    raise RuntimeError("OpenAIRE request limit reached.")
+
+            openaire_search_project_results += [result]
+
+        openaire_search_project_results_save_path = f'{RAW_DATA_DIRECTORY_PATH.strip("/")}/openaire_search_project_results_{get_timestamp_string()}.json'
+        save_data(openaire_search_project_results, openaire_search_project_results_save_path)
+
+
+########
+# Main #
+########
+
+def main() -> None:
+    """
+    Searches OpenAIRE for the Horizon IDs of the ETIS projects.
+    """
+    make_directories(RAW_DATA_DIRECTORY_PATH)
+    setup_logger()
 
-    openaire_search_project_results += [result]
+    try:
+        openaire_inputs = check_horizon_identifiers()
+        request_openaire_data(openaire_inputs)
+    finally:
+        metrics_save_path = metrics.save(METRICS_DIRECTORY_PATH, "get_openaire_search_project_results")
+        info_string = f'Saved run metrics to {metrics_save_path}'
+        logger.info(info_string)
 
 
-openaire_search_project_results_save_path = f'{RAW_DATA_DIRECTORY_PATH.strip("/")}/openaire_search_project_results_{get_timestamp_string()}.json'
-with open(openaire_search_project_results_save_path, "w", encoding="utf8") as save_file:
-    save_file.write(json.dumps(openaire_search_project_results, indent=2, ensure_ascii=False))
+if __name__ == "__main__":
+    main()
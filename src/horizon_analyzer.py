@@ -0,0 +1,96 @@
+# standard
+import argparse
+import importlib
+
+
+##########
+# Inputs #
+##########
+
+# Command: module that runs it and a short description.
+# Modules are imported only when their command runs, so that commands don't pay for the dependencies of other commands.
+# Commands with ARGUMENTS pass the rest of the command line to the main function of the module.
+COMMANDS = {
+    "run_pipeline": {
+        "MODULE": "run_pipeline",
+        "HELP": "Run the pipeline stages that are out of date.",
+        "ARGUMENTS": True,
+    },
+    "build_open_access_snapshot_index": {
+        "MODULE": "build_open_access_snapshot_index",
+        "HELP": "Index the DOIs of the local open access snapshot dump.",
+    },
+    "get_data": {
+        "MODULE": "get_data",
+        "HELP": "Pull ETIS publications of Horizon projects and their open access status.",
+    },
+    "get_openaire_graph_projects": {
+        "MODULE": "get_openaire_graph_projects",
+        "HELP": "Pull Estonian projects from OpenAIRE Graph API.",
+    },
+    "get_openaire_search_project_results": {
+        "MODULE": "get_openaire_search_project_results",
+        "HELP": "Search OpenAIRE for the Horizon IDs of ETIS projects.",
+    },
+    "get_etis_project_horizon_ids": {
+        "MODULE": "get_etis_project_horizon_ids",
+        "HELP": "Match ETIS projects to Horizon IDs.",
+    },
+    "get_open_access_opt_outs": {
+        "MODULE": "get_open_access_opt_outs",
+        "HELP": "Show the OpenAIRE projects table.",
+    },
+    "get_citation_counts": {
+        "MODULE": "get_citation_counts",
+        "HELP": "Look up citation counts of the publications.",
+    },
+    "classify_periodicals": {
+        "MODULE": "classify_periodicals",
+        "HELP": "Check the periodicals against the predatory journal list.",
+    },
+    "analyse_data": {
+        "MODULE": "analyse_data",
+        "HELP": "Summarise open access status of the publications.",
+    },
+    "select_publications_for_manual_check": {
+        "MODULE": "select_publications_for_manual_check",
+        "HELP": "Select a random sample of publications for manual check.",
+    },
+    "recheck_open_access": {
+        "MODULE": "recheck_open_access",
+        "HELP": "Keep re-checking ambiguous and not open publications within a daily request budget.",
+        "ARGUMENTS": True,
+    },
+}
+
+
+########
+# Main #
+########
+
+def main(arguments: list[str] = None) -> None:
+    """
+    Runs a pipeline command.
+    """
+    argument_parser = argparse.ArgumentParser(
+        prog="horizon_analyzer",
+        description="Analyse open access status of publications of Horizon projects. Run from the project directory.")
+    subparsers = argument_parser.add_subparsers(dest="command", metavar="command", required=True)
+    for name, command in COMMANDS.items():
+        # Commands with arguments give their own help
+        _ = subparsers.add_parser(name, help=command["HELP"], description=command["HELP"], add_help=not command.get("ARGUMENTS"))
+    arguments, command_arguments = argument_parser.parse_known_args(arguments)
+
+    command = COMMANDS[arguments.command]
+    if command_arguments and not command.get("ARGUMENTS"):
+        argument_parser.error(f'{arguments.command} takes no arguments: {command_arguments}')
+
+    module = importlib.import_module(command["MODULE"])
+    if command.get("ARGUMENTS"):
+        module.main(command_arguments)
+    else:
+        module.main()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+# standard
+import bisect
+import contextlib
+import datetime
+import json
+import os
+import threading
+import time
+import urllib.parse
+# local
+import profiling
+
+
+#############
+# Constants #
+#############
+
+METRIC_PREFIX = "horizon_analyzer"
+LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]      # Seconds
+
+
+#########
+# State #
+#########
+
+# Metrics are collected for the whole run of a script and shared by all threads
+lock = threading.Lock()
+counters = {}           # (name, labels): value
+gauges = {}             # (name, labels): value
+histograms = {}         # (name, labels): {"BUCKETS": [...], "BUCKET_COUNTS": [...], "SUM": float, "COUNT": int}
+stages = []
+active_stage_name = None        # Requests are recorded under the stage that is running
+run_started = datetime.datetime.now(datetime.timezone.utc)
+
+
+#########################
+# Classes and functions #
+#########################
+
+def get_labels_key(labels: dict) -> tuple:
+    """
+    Gives a hashable key of metric labels.
+    """
+    return tuple(sorted((labels or {}).items()))
+
+
+def count(name: str, labels: dict = None, value: float = 1) -> None:
+    """
+    Increases a counter metric.
+    """
+    key = (name, get_labels_key(labels))
+    with lock:
+        counters[key] = counters.get(key, 0) + value
+
+
+def set_gauge(name: str, value: float, labels: dict = None) -> None:
+    """
+    Sets a gauge metric to its current value, e.g. remaining API quota.
+    """
+    key = (name, get_labels_key(labels))
+    with lock:
+        gauges[key] = value
+
+
+def observe(name: str, value: float, labels: dict = None, buckets: list[float] = LATENCY_BUCKETS) -> None:
+    """
+    Records a value in a histogram metric.
+    """
+    key = (name, get_labels_key(labels))
+    with lock:
+        histogram = histograms.setdefault(key, {"BUCKETS": buckets, "BUCKET_COUNTS": [0] * (len(buckets) + 1), "SUM": 0, "COUNT": 0})
+        histogram["BUCKET_COUNTS"][bisect.bisect_left(buckets, value)] += 1
+        histogram["SUM"] += value
+        histogram["COUNT"] += 1
+
+
+def record_response(response, *args, **kwargs):
+    """
+    requests response hook that records request count, latency and bytes transferred per endpoint.
+    Endpoint is the host and path of the request URL without query parameters.
+    """
+    URL = urllib.parse.urlsplit(response.request.url)
+    labels = {"endpoint": f'{URL.netloc}{URL.path}', "method": response.request.method}
+    _record_response(response, labels, kwargs.get("stream"))
+    return response
+
+
+def record_response_by_host(response, *args, **kwargs):
+    """
+    requests response hook that records request count, latency and bytes transferred per host.
+    For sessions that request many different paths, e.g. URL verification.
+    """
+    URL = urllib.parse.urlsplit(response.request.url)
+    labels = {"endpoint": URL.netloc, "method": response.request.method}
+    _record_response(response, labels, kwargs.get("stream"))
+    return response
+
+
+def _record_response(response, labels: dict, is_stream: bool) -> None:
+    labels = {**labels, "stage": active_stage_name or ""}
+    count("http_requests_total", {**labels, "status": str(response.status_code)})
+    observe("http_request_duration_seconds", response.elapsed.total_seconds(), labels)
+
+    # Streamed content is not read here, so only the declared length is known
+    n_bytes = int(response.headers.get("Content-Length") or 0) if is_stream else len(response.content)
+    count("http_response_bytes_total", labels, n_bytes)
+    count("http_request_bytes_total", labels, len(response.request.body or b""))
+
+
+def start_stage(name: str) -> dict:
+    """
+    Starts measuring wall and CPU time of a pipeline stage.
+    Also profiles the stage if profiling is switched on.
+    """
+    global active_stage_name
+    active_stage_name = name
+    stage = {
+        "NAME": name,
+        "STARTED": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+    if profiling.is_enabled():
+        stage["PROFILE"] = profiling.start_stage(name)
+    stage["WALL_START"] = time.perf_counter()
+    stage["CPU_START"] = time.process_time()
+    return stage
+
+
+def end_stage(stage: dict) -> None:
+    """
+    Stops measuring a pipeline stage and records its wall and CPU time.
+    """
+    global active_stage_name
+    active_stage_name = None
+    wall_seconds = time.perf_counter() - stage.pop("WALL_START")
+    CPU_seconds = time.process_time() - stage.pop("CPU_START")
+    stage["WALL_SECONDS"] = wall_seconds
+    stage["CPU_SECONDS"] = CPU_seconds
+    if "PROFILE" in stage:
+        stage["PEAK_MEMORY_BYTES"] = profiling.end_stage(stage.pop("PROFILE"))
+        set_gauge("stage_peak_memory_bytes", stage["PEAK_MEMORY_BYTES"], {"stage": stage["NAME"]})
+    with lock:
+        stages.append(stage)
+    count("stage_wall_seconds_total", {"stage": stage["NAME"]}, wall_seconds)
+    count("stage_cpu_seconds_total", {"stage": stage["NAME"]}, CPU_seconds)
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    """
+    Measures a pipeline stage that runs in the with block. Gives the stage.
+    Stage is ended also when it fails, so that the metrics of failed runs are complete. Failed stages are marked as FAILED.
+    """
+    started_stage = start_stage(name)
+    try:
+        yield started_stage
+    except BaseException:
+        started_stage["FAILED"] = True
+        raise
+    finally:
+        end_stage(started_stage)
+
+
+def reset() -> None:
+    """
+    Clears the collected metrics and starts a new run, e.g. for the next cycle of a long-running script.
+    """
+    global active_stage_name, run_started
+    with lock:
+        counters.clear()
+        gauges.clear()
+        histograms.clear()
+        stages.clear()
+        active_stage_name = None
+        run_started = datetime.datetime.now(datetime.timezone.utc)
+    profiling.reset()
+
+
+def get_prometheus_text() -> str:
+    """
+    Gives the metrics in Prometheus text exposition format.
+    """
+    def format_labels(labels: tuple, extra_labels: tuple = ()) -> str:
+        label_strings = []
+        for key, value in labels + extra_labels:
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            label_strings += [f'{key}="{value}"']
+        return "{" + ",".join(label_strings) + "}" if label_strings else ""
+
+    lines = []
+    with lock:
+        for metric_name in sorted({name for name, _ in counters}):
+            lines += [f'# TYPE {METRIC_PREFIX}_{metric_name} counter']
+            for (name, labels), value in sorted(counters.items()):
+                if name == metric_name:
+                    lines += [f'{METRIC_PREFIX}_{name}{format_labels(labels)} {value}']
+
+        for metric_name in sorted({name for name, _ in gauges}):
+            lines += [f'# TYPE {METRIC_PREFIX}_{metric_name} gauge']
+            for (name, labels), value in sorted(gauges.items()):
+                if name == metric_name:
+                    lines += [f'{METRIC_PREFIX}_{name}{format_labels(labels)} {value}']
+
+        for metric_name in sorted({name for name, _ in histograms}):
+            lines += [f'# TYPE {METRIC_PREFIX}_{metric_name} histogram']
+            for (name, labels), histogram in sorted(histograms.items()):
+                if name != metric_name:
+                    continue
+                cumulative_count = 0
+                for upper_bound, bucket_count in zip(histogram["BUCKETS"] + ["+Inf"], histogram["BUCKET_COUNTS"]):
+                    cumulative_count += bucket_count
+                    lines += [f'{METRIC_PREFIX}_{name}_bucket{format_labels(labels, (("le", upper_bound),))} {cumulative_count}']
+                lines += [f'{METRIC_PREFIX}_{name}_sum{format_labels(labels)} {histogram["SUM"]}']
+                lines += [f'{METRIC_PREFIX}_{name}_count{format_labels(labels)} {histogram["COUNT"]}']
+
+    return "\n".join(lines) + "\n"
+
+
+def get_summary() -> dict:
+    """
+    Gives all metrics as a JSON-serializable structure.
+    """
+    with lock:
+        summary = {
+            "RUN_STARTED": run_started.isoformat(),
+            "STAGES": list(stages),
+            "COUNTERS": [{"NAME": name, "LABELS": dict(labels), "VALUE": value} for (name, labels), value in sorted(counters.items())],
+            "GAUGES": [{"NAME": name, "LABELS": dict(labels), "VALUE": value} for (name, labels), value in sorted(gauges.items())],
+            "HISTOGRAMS": [{"NAME": name, "LABELS": dict(labels), **histogram} for (name, labels), histogram in sorted(histograms.items())]
+        }
+    return summary
+
+
+def save(dir_path: str, file_handle: str) -> str:
+    """
+    Saves the metrics of the run as a JSON file and a Prometheus text file, and the stage profiles if profiling is switched on.
+    Gives the path of the JSON file.
+    """
+    if not os.path.exists(dir_path):
+        os.makedirs(dir_path)
+
+    timestamp_string = datetime.datetime.strftime(datetime.datetime.now(datetime.timezone.utc), "%Y%m%d%H%M%S%Z")
+    save_path = f'{dir_path.strip("/")}/{file_handle}_metrics_{timestamp_string}'
+    with open(f'{save_path}.json', "w", encoding="utf8") as save_file:
+        save_file.write(json.dumps(get_summary(), indent=2, ensure_ascii=False))
+    with open(f'{save_path}.prom', "w", encoding="utf8") as save_file:
+        save_file.write(get_prometheus_text())
+    profiling.save(dir_path, file_handle, timestamp_string)
+    return f'{save_path}.json'
@@ -0,0 +1,89 @@
+# standard
+import functools
+import re
+import urllib.parse
+
+
+#############
+# Constants #
+#############
+
+# Patterns are compiled once, results are memoized. The same DOIs and titles are normalized in several stages.
+CACHE_SIZE = 2**18
+
+DOI_URL_PREFIX_PATTERN = re.compile(r"^.+doi.org/\s*")
+PUNCTUATION_PATTERN = re.compile(r"[^\w\s]")
+
+# Remove leading/trailing parenthesised words
+leading_parenthesis_pattern = r'^\([^\(\)]+\)\s*'
+trailing_parenthesis_pattern = r'\s*\([^\(\)]+\)$'
+
+# Remove leading/trailing words separated by hyphen or colon
+leading_hyphen_pattern = r'^[\w\d]+\s*[-–:]\s*'
+trailing_hyphen_pattern = r'\s*[-–]\s*[\w\d]+$'
+
+TITLE_AFFIX_PATTERN = re.compile(fr'{leading_parenthesis_pattern}|{trailing_parenthesis_pattern}|{leading_hyphen_pattern}|{trailing_hyphen_pattern}')
+
+
+#########################
+# Classes and functions #
+#########################
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def clean_DOI(DOI: str) -> str:
+    """
+    Removes the leading doi.org URL or DOI:.
+    URL-encodes the DOI.
+    """
+    DOI = DOI.strip(" ").lower()
+    if not DOI:
+        return DOI
+    if DOI[:4] == "doi:":
+        # Drop leading "DOI: "
+        DOI = DOI[4:].strip(" ")
+    if "doi.org" in DOI:
+        # Drop leading http://dx.doi.org/ or https://doi.org/
+        DOI = DOI_URL_PREFIX_PATTERN.sub("", DOI)
+
+    URL_safe_DOI = urllib.parse.quote(DOI)
+    return URL_safe_DOI
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def normalize_title(title: str) -> str:
+    """
+    Lowercases the title and drops punctuation and repeated whitespace.
+    Gives the same string for titles that differ only by formatting.
+    """
+    title = PUNCTUATION_PATTERN.sub(" ", title.lower())
+    normalized_title = " ".join(title.split())
+    return normalized_title
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def get_title_compare_string(title: str) -> str:
+    """
+    Gives the title in the form that is compared in title matching: lower case, without acronyms and tags around the title.
+    """
+    return TITLE_AFFIX_PATTERN.sub("", title.lower().strip())
+
+
+def clean_DOIs(DOIs: list[str]) -> list[str]:
+    """
+    Cleans a column of DOIs. Missing DOIs give empty strings.
+    """
+    return [clean_DOI(DOI or "") for DOI in DOIs]
+
+
+def normalize_titles(titles: list[str]) -> list[str]:
+    """
+    Normalizes a column of titles. Missing titles give empty strings.
+    """
+    return [normalize_title(title or "") for title in titles]
+
+
+def get_title_compare_strings(titles: list[str]) -> list[str]:
+    """
+    Gives the compare strings of a column of titles. Missing titles give empty strings.
+    """
+    return [get_title_compare_string(title or "") for title in titles]
@@ -0,0 +1,135 @@
+# standard
+import datetime
+import json
+import os
+import time
+# external
+import requests
+# local
+import metrics
+from normalization import normalize_title
+from transport import PooledSession
+
+
+#########################
+# Classes and functions #
+#########################
+
+class OpenAccessButtonSession(PooledSession):
+    """
+    Class for requesting info from Open Access Button API.
+    https://openaccessbutton.org/api
+    """
+    BASE_URL = os.environ.get("OPEN_ACCESS_BUTTON_API_URL", "https://api.openaccessbutton.org")
+
+    def __init__(self, API_key: str = None) -> None:
+        super().__init__()
+        self.API_key = API_key
+
+    def find(self, ID: str) -> requests.Response:
+        """
+        Gives URL to any Open Access paper.
+        Accepts a single parameter called "id", which should contain (in order of preference)
+        a URL-encoded doi, pmc, pmid, url, title, or citation.
+        """
+        query_parameters = {
+            "id": ID
+        }
+        URL = f'{self.BASE_URL}/find'
+        response = self.get(URL, params=query_parameters)
+        return response
+
+
+class OpenAccessButtonCache:
+    """
+    Persistent cache of Open Access Button lookup results.
+    Keeps successful and unsuccessful lookups for different amounts of time.
+    """
+    def __init__(self, path: str, hit_TTL_days: float, miss_TTL_days: float) -> None:
+        self.path = path
+        self.hit_TTL = datetime.timedelta(days=hit_TTL_days)
+        self.miss_TTL = datetime.timedelta(days=miss_TTL_days)
+        self.n_hits = 0
+        self.n_misses = 0
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf8") as read_file:
+                self.entries = json.loads(read_file.read())
+
+    @staticmethod
+    def get_key(input_type: str, input: str) -> str:
+        """
+        Gives the cache key for an input, e.g. a canonical DOI or a normalized title.
+        DOI inputs are expected to be already cleaned by clean_DOI.
+        """
+        if input_type == "TITLE":
+            input = normalize_title(input)
+        else:
+            input = input.strip()
+        return f'{input_type}:{input}'
+
+    def get(self, key: str) -> dict:
+        """
+        Gives the cached entry for key or None if there is no entry or it has expired.
+        """
+        entry = self.entries.get(key)
+        if entry:
+            TTL = self.hit_TTL if entry["IS_FOUND"] else self.miss_TTL
+            if datetime.datetime.now(datetime.timezone.utc) - datetime.datetime.fromisoformat(entry["TIMESTAMP"]) < TTL:
+                self.n_hits += 1
+                metrics.count("cache_lookups_total", {"cache": "open_access_button", "result": "hit"})
+                return entry
+        self.n_misses += 1
+        metrics.count("cache_lookups_total", {"cache": "open_access_button", "result": "miss"})
+        return None
+
+    def set(self, key: str, data: dict) -> dict:
+        """
+        Caches the Open Access Button response data for key.
+        """
+        entry = {
+            "IS_FOUND": bool((data or {}).get("url")),
+            "TIMESTAMP": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "DATA": data
+        }
+        self.entries[key] = entry
+        return entry
+
+    def save(self) -> None:
+        """
+        Writes the cache to its file.
+        get_data and recheck_open_access share the cache file. It's replaced in one step, so that a reader never sees a half-written file.
+        """
+        temporary_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(temporary_path, "w", encoding="utf8") as save_file:
+            save_file.write(json.dumps(self.entries, ensure_ascii=False))
+        os.replace(temporary_path, self.path)
+
+
+def limit_rate(last_lap_timestamp: float, requests_per_second_limit: int = 50) -> None:
+    """
+    Adds sleep to request cycles to adher to the rate limits.
+    Uses monotonic timestamps.
+    """
+    # Safety margin 0.1 triggers slowing down when request frequency is within 90% of rate limit
+    safety_margin = 0.1
+
+    requests_per_second_current = 1 / (time.monotonic() - last_lap_timestamp)
+    requests_per_second_limit_safe = requests_per_second_limit * (1 - safety_margin)
+    if requests_per_second_current >= requests_per_second_limit_safe:
+        time.sleep(1 / requests_per_second_limit)
+        metrics.count("rate_limit_sleeps_total")
+        metrics.count("rate_limit_sleep_seconds_total", value=1 / requests_per_second_limit)
+
+
+def get_lookup_inputs(DOI: str, URL: str, title: str) -> list[tuple[str, str]]:
+    """
+    Gives the Open Access Button inputs of a publication in the order they are tried: (input type, input).
+    DOI is expected to be already cleaned by clean_DOI. Missing inputs are left out.
+    """
+    inputs = [
+        ("DOI", DOI),
+        ("URL", URL),
+        ("TITLE", title)
+    ]
+    return [(input_type, input) for input_type, input in inputs if input]
@@ -0,0 +1,179 @@
+# standard
+import hashlib
+import mmap
+import os
+import shutil
+import struct
+
+
+#############
+# Constants #
+#############
+
+# Index file layout:
+# header | hash table of (key hash, record offset) slots | records
+# Record offset 0 marks an empty slot, because records are always stored after the header.
+INDEX_MAGIC = b"OASIDX01"
+HEADER_FORMAT = "<8sQQQ"            # magic, number of slots, number of records, records offset
+SLOT_FORMAT = "<QQ"                 # key hash, record offset
+RECORD_HEADER_FORMAT = "<HHBB"      # DOI length, URL length, is open access, open access type code
+MAX_FIELD_SIZE = 2**16 - 1          # Longest DOI and URL in bytes that the record header can hold
+
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+SLOT_SIZE = struct.calcsize(SLOT_FORMAT)
+RECORD_HEADER_SIZE = struct.calcsize(RECORD_HEADER_FORMAT)
+
+# Unpaywall oa_status values
+OPEN_ACCESS_TYPES = [None, "gold", "hybrid", "bronze", "green", "closed", "diamond"]
+
+
+#########################
+# Classes and functions #
+#########################
+
+def get_key_hash(key: bytes) -> int:
+    """
+    Gives a stable 64-bit hash of an index key.
+    """
+    key_hash = int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+    return key_hash
+
+
+def pack_record(DOI: str, is_open_access: bool, best_open_access_URL: str, open_access_type: str) -> bytes:
+    """
+    Packs a snapshot record into bytes.
+    Gives None if the DOI or URL is too long for the record format. They are not truncated:
+    a truncated DOI would never be looked up and a truncated URL could end in the middle of a character.
+    """
+    DOI_bytes = DOI.encode("utf8")
+    URL_bytes = (best_open_access_URL or "").encode("utf8")
+    if len(DOI_bytes) > MAX_FIELD_SIZE or len(URL_bytes) > MAX_FIELD_SIZE:
+        return None
+    type_code = OPEN_ACCESS_TYPES.index(open_access_type) if open_access_type in OPEN_ACCESS_TYPES else 0
+
+    record_header = struct.pack(RECORD_HEADER_FORMAT, len(DOI_bytes), len(URL_bytes), bool(is_open_access), type_code)
+    return record_header + DOI_bytes + URL_bytes
+
+
+def build_open_access_snapshot_index(records, index_path: str) -> tuple[int, int]:
+    """
+    Builds a DOI index file from an iterable of (DOI, is_open_access, best_open_access_URL, open_access_type) tuples.
+    DOIs should be cleaned the same way as the DOIs that are later looked up.
+    Records are streamed to disk, so the input never has to fit into memory.
+    Later records override earlier records with the same DOI.
+    Records with a DOI or URL longer than MAX_FIELD_SIZE bytes are skipped.
+    Returns the number of records written and the number of records skipped for their size.
+    """
+    records_path = f'{index_path}.records'
+    n_records = 0
+    n_oversized_records = 0
+    with open(records_path, "wb") as records_file:
+        for DOI, is_open_access, best_open_access_URL, open_access_type in records:
+            if not DOI:
+                continue
+            record = pack_record(DOI, is_open_access, best_open_access_URL, open_access_type)
+            if record is None:
+                n_oversized_records += 1
+                continue
+            records_file.write(record)
+            n_records += 1
+
+    # Keep the table at most half full for short probe sequences
+    n_slots = 1
+    while n_slots < 2 * n_records:
+        n_slots *= 2
+    records_offset = HEADER_SIZE + n_slots * SLOT_SIZE
+
+    with open(index_path, "wb") as index_file:
+        index_file.write(struct.pack(HEADER_FORMAT, INDEX_MAGIC, n_slots, n_records, records_offset))
+        index_file.truncate(records_offset)
+        index_file.seek(records_offset)
+        with open(records_path, "rb") as records_file:
+            shutil.copyfileobj(records_file, index_file)
+    os.remove(records_path)
+
+    with open(index_path, "r+b") as index_file, mmap.mmap(index_file.fileno(), 0) as index_map:
+        record_offset = records_offset
+        while record_offset < len(index_map):
+            DOI_length, URL_length, _, _ = struct.unpack_from(RECORD_HEADER_FORMAT, index_map, record_offset)
+            DOI_start = record_offset + RECORD_HEADER_SIZE
+            DOI_bytes = index_map[DOI_start:DOI_start + DOI_length]
+            key_hash = get_key_hash(DOI_bytes)
+
+            i_slot = key_hash & (n_slots - 1)
+            while True:
+                slot_offset = HEADER_SIZE + i_slot * SLOT_SIZE
+                slot_hash, slot_record_offset = struct.unpack_from(SLOT_FORMAT, index_map, slot_offset)
+                if not slot_record_offset:
+                    break
+                if slot_hash == key_hash:
+                    slot_DOI_length = struct.unpack_from(RECORD_HEADER_FORMAT, index_map, slot_record_offset)[0]
+                    slot_DOI_start = slot_record_offset + RECORD_HEADER_SIZE
+                    if index_map[slot_DOI_start:slot_DOI_start + slot_DOI_length] == DOI_bytes:
+                        break
+                i_slot = (i_slot + 1) & (n_slots - 1)
+
+            struct.pack_into(SLOT_FORMAT, index_map, slot_offset, key_hash, record_offset)
+            record_offset = DOI_start + DOI_length + URL_length
+
+    return n_records, n_oversized_records
+
+
+class OpenAccessSnapshotIndex:
+    """
+    Read-only memory-mapped DOI index of open access snapshot records.
+    Lookups read only the hash table slots and the record they point to,
+    so the snapshot is never loaded into memory.
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.n_slots, self.n_records, self.records_offset = struct.unpack_from(HEADER_FORMAT, self.map, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f'{path} is not an open access snapshot index')
+
+    def __len__(self) -> int:
+        return self.n_records
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.map.close()
+        self.file.close()
+
+    def get(self, DOI: str) -> dict:
+        """
+        Gives the snapshot record of a DOI or None if the DOI is not in the snapshot.
+        DOI should be cleaned the same way as the DOIs the index was built from.
+        """
+        if not DOI or not self.n_records:
+            return None
+
+        DOI_bytes = DOI.encode("utf8")
+        key_hash = get_key_hash(DOI_bytes)
+        i_slot = key_hash & (self.n_slots - 1)
+        while True:
+            slot_hash, record_offset = struct.unpack_from(SLOT_FORMAT, self.map, HEADER_SIZE + i_slot * SLOT_SIZE)
+            if not record_offset:
+                return None
+
+            if slot_hash == key_hash:
+                DOI_length, URL_length, is_open_access, type_code = struct.unpack_from(RECORD_HEADER_FORMAT, self.map, record_offset)
+                DOI_start = record_offset + RECORD_HEADER_SIZE
+                URL_start = DOI_start + DOI_length
+                if self.map[DOI_start:URL_start] == DOI_bytes:
+                    record = {
+                        "DOI": DOI,
+                        "IS_OPEN_ACCESS": bool(is_open_access),
+                        "BEST_OPEN_ACCESS_URL": self.map[URL_start:URL_start + URL_length].decode("utf8") or None,
+                        "OPEN_ACCESS_TYPE": OPEN_ACCESS_TYPES[type_code]
+                    }
+                    return record
+
+            i_slot = (i_slot + 1) & (self.n_slots - 1)
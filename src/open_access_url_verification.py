@@ -0,0 +1,114 @@
+# standard
+import concurrent.futures
+import itertools
+import threading
+import urllib.parse
+# external
+import requests
+# local
+import metrics
+from transport import PooledSession
+
+
+#############
+# Constants #
+#############
+
+PDF_MAGIC_BYTES = b"%PDF-"
+SNIFF_BYTES = 1024                  # Number of bytes to request for content sniffing
+
+# Verdicts
+VERDICT_PDF = "PDF"                 # URL leads to a PDF file
+VERDICT_HTML = "HTML"               # URL leads to a web page (e.g. a landing page that may or may not have the full text)
+VERDICT_OTHER = "OTHER"             # URL leads to some other type of content
+VERDICT_NOT_FOUND = "NOT_FOUND"     # Server says the URL doesn't exist
+VERDICT_ERROR = "ERROR"             # Server returned some other error
+VERDICT_UNREACHABLE = "UNREACHABLE" # Connection failed or timed out
+
+
+#########################
+# Classes and functions #
+#########################
+
+def get_verdict(status_code: int, content_type: str, first_bytes: bytes) -> str:
+    """
+    Decides what the URL leads to, based on response status, content type and the first bytes of content.
+    """
+    if status_code in (404, 410):
+        return VERDICT_NOT_FOUND
+    if status_code >= 400:
+        return VERDICT_ERROR
+    if first_bytes.lstrip().startswith(PDF_MAGIC_BYTES):
+        return VERDICT_PDF
+    if "html" in content_type:
+        return VERDICT_HTML
+    if "pdf" in content_type and not first_bytes:
+        return VERDICT_PDF
+    return VERDICT_OTHER
+
+
+def verify_URL(session: requests.Session, URL: str, timeout: float = 30) -> dict:
+    """
+    Checks whether URL is live and what kind of content it leads to.
+    Sends a HEAD request first and a range GET request for the first bytes if content needs sniffing.
+    """
+    verification = {
+        "URL": URL,
+        "FINAL_URL": None,
+        "STATUS_CODE": None,
+        "CONTENT_TYPE": None,
+        "IS_PDF": False,
+        "VERDICT": VERDICT_UNREACHABLE
+    }
+    try:
+        response = session.head(URL, allow_redirects=True, timeout=timeout)
+        content_type = response.headers.get("Content-Type", "").lower()
+        first_bytes = b""
+
+        # Some servers don't support HEAD. PDFs are confirmed by magic bytes, because servers often lie about content type.
+        if response.status_code >= 400 or "html" not in content_type:
+            with session.get(URL, headers={"Range": f'bytes=0-{SNIFF_BYTES - 1}'}, stream=True, timeout=timeout) as response:
+                content_type = response.headers.get("Content-Type", "").lower()
+                if response.status_code < 400:
+                    first_bytes = next(response.iter_content(SNIFF_BYTES), b"")
+    except requests.RequestException:
+        metrics.count("http_request_errors_total", {"endpoint": urllib.parse.urlsplit(URL).netloc})
+        return verification
+
+    verification["FINAL_URL"] = response.url
+    verification["STATUS_CODE"] = response.status_code
+    verification["CONTENT_TYPE"] = content_type or None
+    verification["VERDICT"] = get_verdict(response.status_code, content_type, first_bytes)
+    verification["IS_PDF"] = verification["VERDICT"] == VERDICT_PDF
+    return verification
+
+
+def verify_URLs(URLs: list[str], max_workers: int = 32, max_per_host: int = 4, timeout: float = 30, progress_bar=None) -> list[dict]:
+    """
+    Verifies URLs concurrently over a shared connection pool.
+    Limits the number of simultaneous requests to each host to not overload any single server.
+    Gives results in the same order as the input URLs.
+    """
+    URLs_by_host = {}
+    for URL in dict.fromkeys(URLs):
+        URLs_by_host.setdefault(urllib.parse.urlsplit(URL).netloc.lower(), []).append(URL)
+    host_semaphores = {host: threading.BoundedSemaphore(max_per_host) for host in URLs_by_host}
+
+    # URL paths are different for every publication, so requests are recorded per host
+    session = PooledSession(pool_maxsize=max_per_host, timeout=timeout, response_hook=metrics.record_response_by_host)
+    session.headers.update({"User-Agent": "horizon_analyzer open access URL verification"})
+
+    def verify_with_host_limit(URL: str) -> dict:
+        with host_semaphores[urllib.parse.urlsplit(URL).netloc.lower()]:
+            verification = verify_URL(session, URL, timeout)
+        if progress_bar is not None:
+            _ = progress_bar.update()
+        return verification
+
+    # Interleave hosts, so that workers aren't all waiting for the same host
+    interleaved_URLs = [URL for URLs in itertools.zip_longest(*URLs_by_host.values()) for URL in URLs if URL]
+
+    with session, concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        verifications = dict(zip(interleaved_URLs, executor.map(verify_with_host_limit, interleaved_URLs)))
+
+    return [verifications[URL] for URL in URLs]
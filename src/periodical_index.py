@@ -0,0 +1,201 @@
+# standard
+import csv
+import functools
+import re
+# local
+import metrics
+from normalization import CACHE_SIZE, normalize_title
+
+
+#############
+# Constants #
+#############
+
+ISSN_PATTERN = re.compile(r"\b(\d{4})-?(\d{3}[\dXx])\b")
+LEADING_ARTICLE_PATTERN = re.compile(r"^the\s+")
+
+# Fuzzy matches need at least this Dice similarity of name trigrams (0-1)
+# Predatory journals often have names that differ from legitimate journals by a word, so the threshold is high.
+# Fuzzy matches also have to be spelling variants: the same words or fewer character edits than any differing word has letters.
+FUZZY_MATCH_MIN_SIMILARITY = 0.9
+
+ISSN_MATCH = "ISSN"
+EXACT_MATCH = "EXACT"
+FUZZY_MATCH = "FUZZY"
+
+# Outcomes of classification. Only ISSN and exact name matches are counted as on the list, fuzzy matches need a manual check.
+LISTED = "LISTED"
+NEEDS_REVIEW = "NEEDS_REVIEW"
+MATCH_OUTCOMES = {
+    ISSN_MATCH: LISTED,
+    EXACT_MATCH: LISTED,
+    FUZZY_MATCH: NEEDS_REVIEW,
+}
+
+
+#########################
+# Classes and functions #
+#########################
+
+def get_ISSNs(string: str) -> list[str]:
+    """
+    Gives the ISSNs in a string in the standard 1234-567X format.
+    """
+    return [f'{first_half}-{second_half.upper()}' for first_half, second_half in ISSN_PATTERN.findall(string or "")]
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def normalize_periodical_name(name: str) -> str:
+    """
+    Gives the periodical name in the form that is compared: lower case, without ISSNs, punctuation and leading "The".
+    "&" and "and" give the same name.
+    """
+    name = ISSN_PATTERN.sub(" ", name.lower().replace("&", " and "))
+    return LEADING_ARTICLE_PATTERN.sub("", normalize_title(name))
+
+
+def get_trigrams(string: str) -> set[str]:
+    """
+    Gives the character trigrams of a string. The string is padded, so that the first and last letters count as much as others.
+    """
+    padded_string = f'  {string} '
+    return {padded_string[i:i + 3] for i in range(len(padded_string) - 2)}
+
+
+def get_edit_distance(string: str, other_string: str) -> int:
+    """
+    Gives the Levenshtein distance of two strings: the number of single character insertions, deletions and substitutions between them.
+    """
+    previous_row = list(range(len(other_string) + 1))
+    for i, character in enumerate(string, start=1):
+        row = [i]
+        for j, other_character in enumerate(other_string, start=1):
+            row += [min(previous_row[j] + 1, row[j - 1] + 1, previous_row[j - 1] + (character != other_character))]
+        previous_row = row
+    return previous_row[-1]
+
+
+def is_spelling_variant(name: str, other_name: str) -> bool:
+    """
+    Checks whether two normalized names have the same words or differ by fewer character edits than any differing word has letters.
+    Names where a whole word is added, removed or replaced are not spelling variants.
+    """
+    differing_words = set(name.split()) ^ set(other_name.split())
+    if not differing_words:
+        return True
+    return get_edit_distance(name, other_name) < min(len(word) for word in differing_words)
+
+
+class PeriodicalIndex:
+    """
+    Index of a journal list for classifying free-text periodical names.
+    Looks up ISSNs and normalized names by hash and falls back to trigram similarity of names.
+    Each distinct periodical string is classified once.
+    """
+    def __init__(self, journals: list[dict]) -> None:
+        """
+        Takes journals with NAME, ISSNS (list) and NAME_VARIANTS (list, e.g. abbreviations and former names).
+        """
+        self.journals = journals
+        self.journals_by_ISSN = {}
+        self.journals_by_name = {}
+        for journal in journals:
+            for ISSN in journal["ISSNS"]:
+                self.journals_by_ISSN.setdefault(ISSN, journal)
+            for name in [journal["NAME"]] + journal["NAME_VARIANTS"]:
+                normalized_name = normalize_periodical_name(name)
+                if normalized_name:
+                    self.journals_by_name.setdefault(normalized_name, journal)
+
+        # Trigram inverted index of the normalized names for the fuzzy fallback
+        self.names = list(self.journals_by_name)
+        self.name_trigram_counts = []
+        self.names_by_trigram = {}
+        for i_name, name in enumerate(self.names):
+            trigrams = get_trigrams(name)
+            self.name_trigram_counts += [len(trigrams)]
+            for trigram in trigrams:
+                self.names_by_trigram.setdefault(trigram, []).append(i_name)
+
+        self.classifications = {}
+
+    @classmethod
+    def from_csv(cls, path: str):
+        """
+        Reads a journal list from a CSV file with columns name, issn, eissn and variants (separated by semicolons).
+        ISSNs and variants are optional.
+        """
+        journals = []
+        with open(path, encoding="utf8", newline="") as read_file:
+            for row in csv.DictReader(read_file):
+                if not (row.get("name") or "").strip():
+                    continue
+                journal = {
+                    "NAME": row["name"].strip(),
+                    "ISSNS": get_ISSNs(f'{row.get("issn") or ""} {row.get("eissn") or ""}'),
+                    "NAME_VARIANTS": [variant.strip() for variant in (row.get("variants") or "").split(";") if variant.strip()],
+                }
+                journals += [journal]
+        return cls(journals)
+
+    def get_fuzzy_match(self, normalized_name: str) -> tuple[str, float]:
+        """
+        Gives the indexed name that has the most similar trigrams to normalized_name and its Dice similarity.
+        Only names that share trigrams with normalized_name and have a length that could reach the threshold are scored.
+        """
+        trigrams = get_trigrams(normalized_name)
+        n_shared_trigrams = {}
+        for trigram in trigrams:
+            for i_name in self.names_by_trigram.get(trigram, []):
+                n_shared_trigrams[i_name] = n_shared_trigrams.get(i_name, 0) + 1
+
+        best_name, best_similarity = None, 0
+        min_count = len(trigrams) * FUZZY_MATCH_MIN_SIMILARITY / (2 - FUZZY_MATCH_MIN_SIMILARITY)
+        max_count = len(trigrams) * (2 - FUZZY_MATCH_MIN_SIMILARITY) / FUZZY_MATCH_MIN_SIMILARITY
+        for i_name, n_shared in n_shared_trigrams.items():
+            name_trigram_count = self.name_trigram_counts[i_name]
+            if not min_count <= name_trigram_count <= max_count:
+                continue
+            similarity = 2 * n_shared / (len(trigrams) + name_trigram_count)
+            if similarity > best_similarity:
+                best_name, best_similarity = self.names[i_name], similarity
+        return best_name, best_similarity
+
+    def classify(self, periodical: str) -> dict:
+        """
+        Gives the journal list entry that matches a periodical string, how it was matched and the outcome.
+        Outcome is LISTED for ISSN and exact name matches and NEEDS_REVIEW for fuzzy matches.
+        Match type and outcome are None if the periodical is not on the list.
+        """
+        classification = self.classifications.get(periodical)
+        if classification:
+            metrics.count("cache_lookups_total", {"cache": "periodical_classifications", "result": "hit"})
+            return classification
+        metrics.count("cache_lookups_total", {"cache": "periodical_classifications", "result": "miss"})
+
+        journal, match_type, similarity = None, None, None
+        journal = next((self.journals_by_ISSN[ISSN] for ISSN in get_ISSNs(periodical) if ISSN in self.journals_by_ISSN), None)
+        if journal:
+            match_type, similarity = ISSN_MATCH, 1.0
+
+        normalized_name = normalize_periodical_name(periodical or "")
+        if not journal and normalized_name in self.journals_by_name:
+            journal = self.journals_by_name[normalized_name]
+            match_type, similarity = EXACT_MATCH, 1.0
+
+        if not journal and normalized_name:
+            fuzzy_name, fuzzy_similarity = self.get_fuzzy_match(normalized_name)
+            if fuzzy_similarity >= FUZZY_MATCH_MIN_SIMILARITY and is_spelling_variant(normalized_name, fuzzy_name):
+                journal = self.journals_by_name[fuzzy_name]
+                match_type, similarity = FUZZY_MATCH, fuzzy_similarity
+
+        classification = {
+            "PERIODICAL": periodical,
+            "MATCH_TYPE": match_type,
+            "OUTCOME": MATCH_OUTCOMES.get(match_type),
+            "MATCHED_JOURNAL": journal["NAME"] if journal else None,
+            "SIMILARITY": similarity,
+        }
+        self.classifications[periodical] = classification
+        metrics.count("periodical_classifications_total", {"match_type": match_type or "none"})
+        return classification
@@ -0,0 +1,113 @@
+# standard
+import io
+import os
+
+
+#############
+# Constants #
+#############
+
+# Set to 1 to profile every stage of the scripts, e.g. HORIZON_ANALYZER_PROFILE=1 python src/get_data.py
+# Set to "memory" to only track peak memory, without the overhead of cProfile (e.g. for benchmarks)
+PROFILE_ENVIRONMENT_VARIABLE = "HORIZON_ANALYZER_PROFILE"
+TOP_N_ENVIRONMENT_VARIABLE = "HORIZON_ANALYZER_PROFILE_TOP_N"
+
+
+#########
+# State #
+#########
+
+# Profiles of the stages that ended since the last save. Saved with the run metrics by metrics.save.
+stage_profiles = []
+
+
+#########################
+# Classes and functions #
+#########################
+
+def is_enabled() -> bool:
+    """
+    Checks whether profiling is switched on by the environment variable.
+    """
+    return os.environ.get(PROFILE_ENVIRONMENT_VARIABLE, "").lower() not in ("", "0", "false", "no")
+
+
+def is_memory_only() -> bool:
+    """
+    Checks whether only memory is tracked.
+    """
+    return os.environ.get(PROFILE_ENVIRONMENT_VARIABLE, "").lower() == "memory"
+
+
+def start_stage(name: str) -> dict:
+    """
+    Starts profiling a stage: function calls with cProfile and memory allocations with tracemalloc.
+    cProfile only sees the thread that started the stage, not worker threads.
+    """
+    # Imported here, so that runs without profiling don't pay for importing the profilers
+    import cProfile
+    import tracemalloc
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    profiler = None
+    if not is_memory_only():
+        profiler = cProfile.Profile()
+        profiler.enable()
+    stage_profile = {
+        "NAME": name,
+        "PROFILER": profiler
+    }
+    return stage_profile
+
+
+def end_stage(stage_profile: dict) -> int:
+    """
+    Stops profiling a stage and keeps its profile until the next save.
+    Gives the peak memory allocated during the stage in bytes.
+    """
+    import tracemalloc
+
+    profiler = stage_profile["PROFILER"]
+    if profiler:
+        profiler.disable()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    if profiler:
+        stage_profiles.append({**stage_profile, "PEAK_MEMORY_BYTES": peak_memory})
+    return peak_memory
+
+
+def save(dir_path: str, file_handle: str, timestamp_string: str) -> None:
+    """
+    Saves the profile of each stage that ended since the last save and a report of their hot functions.
+    Files are named like the run metrics, e.g. get_data_profile_pull_etis_projects_<timestamp>.prof.
+    """
+    import pstats
+
+    if not stage_profiles:
+        return
+
+    n_top_functions = int(os.environ.get(TOP_N_ENVIRONMENT_VARIABLE) or 20)
+    report = io.StringIO()
+    for stage_profile in stage_profiles:
+        # Profiles can be explored with e.g. snakeviz or python -m pstats
+        stage_profile["PROFILER"].dump_stats(f'{dir_path.strip("/")}/{file_handle}_profile_{stage_profile["NAME"]}_{timestamp_string}.prof')
+
+        report.write(f'{"=" * 80}\nStage: {stage_profile["NAME"]}\nPeak memory allocated: {stage_profile["PEAK_MEMORY_BYTES"] / 2**20:.1f} MiB\n')
+        statistics = pstats.Stats(stage_profile["PROFILER"], stream=report).strip_dirs()
+        report.write(f'\nTop {n_top_functions} functions by own time\n')
+        statistics.sort_stats(pstats.SortKey.TIME).print_stats(n_top_functions)
+        report.write(f'Top {n_top_functions} functions by cumulative time\n')
+        statistics.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(n_top_functions)
+
+    with open(f'{dir_path.strip("/")}/{file_handle}_hot_functions_{timestamp_string}.txt', "w", encoding="utf8") as report_file:
+        report_file.write(report.getvalue())
+    stage_profiles.clear()
+
+
+def reset() -> None:
+    """
+    Drops the profiles that are not saved yet.
+    """
+    stage_profiles.clear()
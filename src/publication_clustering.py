@@ -0,0 +1,179 @@
+# standard
+import hashlib
+import random
+# local
+from normalization import normalize_title
+
+
+#############
+# Constants #
+#############
+
+MERSENNE_PRIME = 2**61 - 1
+MAX_HASH = 2**64 - 1
+
+
+#########################
+# Classes and functions #
+#########################
+
+def get_title_shingles(title: str, shingle_length: int = 3) -> set[str]:
+    """
+    Gives the set of character n-grams of a lowercased title without punctuation.
+    """
+    title = normalize_title(title or "")
+    if len(title) < shingle_length:
+        return {title} if title else set()
+    return {title[i:i + shingle_length] for i in range(len(title) - shingle_length + 1)}
+
+
+def get_shingle_hash(shingle: str) -> int:
+    """
+    Gives a stable 64-bit hash of a shingle.
+    """
+    shingle_hash = int.from_bytes(hashlib.blake2b(shingle.encode("utf8"), digest_size=8).digest(), "little")
+    return shingle_hash
+
+
+def get_jaccard_similarity(set1: set, set2: set) -> float:
+    """
+    Gives the share of common items in two sets.
+    """
+    if not (set1 or set2):
+        return 0
+    return len(set1 & set2) / len(set1 | set2)
+
+
+class MinHasher:
+    """
+    Gives MinHash signatures of shingle sets.
+    Signatures of two sets agree on a share of positions that estimates the Jaccard similarity of the sets.
+    """
+    def __init__(self, n_permutations: int = 64, seed: int = 1913) -> None:
+        randomizer = random.Random(seed)
+        self.permutations = [
+            (randomizer.randrange(1, MERSENNE_PRIME), randomizer.randrange(0, MERSENNE_PRIME))
+            for _ in range(n_permutations)]
+
+    def get_signature(self, shingles: set[str]) -> tuple[int]:
+        """
+        Gives the MinHash signature of a set of shingles.
+        """
+        shingle_hashes = [get_shingle_hash(shingle) for shingle in shingles]
+        if not shingle_hashes:
+            return tuple(MAX_HASH for _ in self.permutations)
+        signature = tuple(
+            min((a * shingle_hash + b) % MERSENNE_PRIME for shingle_hash in shingle_hashes)
+            for a, b in self.permutations)
+        return signature
+
+
+class UnionFind:
+    """
+    Disjoint sets of item indices.
+    """
+    def __init__(self, n_items: int) -> None:
+        self.parents = list(range(n_items))
+
+    def find(self, i: int) -> int:
+        """
+        Gives the index of the representative item of the set that item i belongs to.
+        """
+        root = i
+        while self.parents[root] != root:
+            root = self.parents[root]
+        # Compress path
+        while self.parents[i] != root:
+            self.parents[i], i = root, self.parents[i]
+        return root
+
+    def union(self, i: int, j: int) -> None:
+        """
+        Merges the sets that items i and j belong to.
+        """
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i != root_j:
+            self.parents[max(root_i, root_j)] = min(root_i, root_j)
+
+
+def cluster_publications(
+        GUIDs: list[str],
+        DOIs: list[str],
+        titles: list[str],
+        periodicals: list[str],
+        n_bands: int = 16,
+        n_rows: int = 4,
+        similarity_threshold: float = 0.9,
+        min_title_shingles: int = 25) -> list[str]:
+    """
+    Groups publications that are likely the same publication reported under different GUIDs.
+    Publications are the same if they have the same DOI or if their titles are near-identical.
+    Title candidates are found by locality-sensitive hashing of MinHash signatures,
+    so the work grows roughly linearly with the number of publications instead of comparing every pair.
+    Candidates are confirmed by the exact Jaccard similarity of title shingles.
+    Titles with fewer than min_title_shingles shingles (about as many characters) can be generic, e.g. "Editorial" or "Preface".
+    They are only matched exactly (after normalization) and only between publications in the same periodical.
+    Publications with different DOIs are never merged by title, not even through other publications in their clusters.
+    Takes the GUIDs, DOIs, titles and periodicals of the publications as columns of equal length.
+    Gives a cluster ID for every publication: the smallest GUID in its cluster.
+    """
+    clusters = UnionFind(len(GUIDs))
+
+    # Same DOI
+    DOI_index = {}
+    for i, DOI in enumerate(DOIs):
+        DOI = (DOI or "").strip().lower()
+        if DOI:
+            clusters.union(DOI_index.setdefault(DOI, i), i)
+
+    # DOI of each cluster: cluster root: DOI. Clusters have at most one DOI, because title matches don't merge different DOIs.
+    cluster_DOIs = {clusters.find(i): DOI for DOI, i in DOI_index.items()}
+
+    def merge_by_title(i: int, j: int) -> None:
+        DOI_i, DOI_j = cluster_DOIs.get(clusters.find(i)), cluster_DOIs.get(clusters.find(j))
+        if DOI_i and DOI_j and DOI_i != DOI_j:
+            return
+        clusters.union(i, j)
+        cluster_DOIs[clusters.find(i)] = DOI_i or DOI_j
+
+    shingle_sets = [get_title_shingles(title) for title in titles]
+
+    # Identical short titles in the same periodical
+    short_title_blocks = {}
+    for i, (title, periodical, shingles) in enumerate(zip(titles, periodicals, shingle_sets)):
+        periodical = normalize_title(periodical or "")
+        if shingles and len(shingles) < min_title_shingles and periodical:
+            short_title_blocks.setdefault((normalize_title(title), periodical), []).append(i)
+    for block in short_title_blocks.values():
+        for i_member, i in enumerate(block):
+            for j in block[i_member + 1:]:
+                if clusters.find(i) != clusters.find(j):
+                    merge_by_title(i, j)
+
+    # Near-identical titles
+    min_hasher = MinHasher(n_permutations=n_bands * n_rows)
+    buckets = {}
+    for i, shingles in enumerate(shingle_sets):
+        if len(shingles) < min_title_shingles:
+            continue
+        signature = min_hasher.get_signature(shingles)
+        for i_band in range(n_bands):
+            band = signature[i_band * n_rows:(i_band + 1) * n_rows]
+            buckets.setdefault((i_band, band), []).append(i)
+
+    checked_pairs = set()
+    for bucket in buckets.values():
+        for i_member, i in enumerate(bucket):
+            for j in bucket[i_member + 1:]:
+                if (i, j) in checked_pairs or clusters.find(i) == clusters.find(j):
+                    continue
+                checked_pairs.add((i, j))
+                if get_jaccard_similarity(shingle_sets[i], shingle_sets[j]) >= similarity_threshold:
+                    merge_by_title(i, j)
+
+    cluster_IDs = {}
+    for i, GUID in enumerate(GUIDs):
+        root = clusters.find(i)
+        cluster_IDs[root] = min(cluster_IDs.get(root, GUID), GUID)
+
+    return [cluster_IDs[clusters.find(i)] for i in range(len(GUIDs))]
@@ -0,0 +1,324 @@
+# standard
+import argparse
+import datetime
+import heapq
+import json
+import logging
+import os
+import re
+import time
+# local
+import metrics
+from columnar_storage import get_latest_file_path
+from common import get_timestamp_string, make_directories, save_data, setup_logger
+from open_access_button import OpenAccessButtonCache, OpenAccessButtonSession, get_lookup_inputs, limit_rate
+from open_access_url_verification import verify_URLs
+from records import OpenAccessDatum
+
+
+##########
+# Inputs #
+##########
+
+RAW_DATA_DIRECTORY_PATH = "./data/raw/"
+RESULTS_DATA_DIRECTORY_PATH = "./data/results/"
+MANUALLY_CHECKED_PUBLICATIONS_PATH = "./data/manual/manually_checked_publications.json"
+CACHE_DIRECTORY_PATH = "./data/cache/"
+OPEN_ACCESS_BUTTON_CACHE_PATH = "./data/cache/open_access_button_cache.json"
+RECHECK_STATE_PATH = "./data/cache/recheck_open_access_state.json"
+METRICS_DIRECTORY_PATH = "./data/metrics/"
+
+SAVE_PARQUET = True                # Save data as Parquet next to the JSON files, for faster loading in analysis
+
+DAILY_REQUEST_BUDGET = 500          # Open Access Button requests per UTC day. A small share of the requests of a full harvest.
+MIN_RECHECK_INTERVAL_DAYS = 7       # Don't re-check a publication more often than this
+CHECK_INTERVAL_MINUTES = 60         # Look for new open access data and unused budget this often
+# Typical embargo lengths of publishers. The publication date is estimated to be in the middle of the publishing year.
+EMBARGO_MONTHS = [6, 12, 24]
+# Limit requests that can be made per second to respect API rules. Can be raised for benchmarks against a local server.
+OPEN_ACCESS_BUTTON_REQUESTS_PER_SECOND_LIMIT = float(os.environ.get("OPEN_ACCESS_BUTTON_REQUESTS_PER_SECOND_LIMIT", 1))
+
+# Re-check tiers in order of priority
+AMBIGUOUS_TIER = 0                  # ETIS and Open Access Button disagree
+NOT_OPEN_TIER = 1                   # ETIS and Open Access Button agree that the publication is not available
+
+
+#########################
+# Classes and functions #
+#########################
+
+def get_file_timestamp(path: str) -> datetime.datetime:
+    """
+    Gives the timestamp in a data filename.
+    """
+    timestamp_string = re.search(r"_(\d{14})\w*\.\w+$", path).group(1)
+    return datetime.datetime.strptime(timestamp_string, "%Y%m%d%H%M%S").replace(tzinfo=datetime.timezone.utc)
+
+
+def load_state(path: str) -> dict:
+    """
+    Reads the re-check state: last re-check time of each publication and requests made on each day.
+    """
+    state = {"LAST_CHECKED": {}, "REQUESTS_BY_DATE": {}}
+    if os.path.exists(path):
+        with open(path, encoding="utf8") as read_file:
+            state.update(json.loads(read_file.read()))
+    return state
+
+
+def save_state(state: dict, path: str) -> None:
+    """
+    Writes the re-check state. Keeps request counts of the last week only.
+    """
+    oldest_date = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=7)).date().isoformat()
+    state["REQUESTS_BY_DATE"] = {date: n for date, n in state["REQUESTS_BY_DATE"].items() if date >= oldest_date}
+    with open(path, "w", encoding="utf8") as save_file:
+        save_file.write(json.dumps(state, indent=2, ensure_ascii=False))
+
+
+def get_recheck_tier(publication: OpenAccessDatum) -> int:
+    """
+    Gives the re-check tier of a publication or None if it doesn't need re-checking.
+    Publications that are available by both ETIS and Open Access Button or that are manually checked are not re-checked.
+    """
+    if publication.is_available_manually_checked is not None:
+        return None
+    if publication.is_open_access and publication.OA_button_URL:
+        return None
+    if publication.is_open_access or publication.OA_button_URL:
+        return AMBIGUOUS_TIER
+    return NOT_OPEN_TIER
+
+
+def get_estimated_embargo_ends(publishing_year: int) -> list[datetime.datetime]:
+    """
+    Gives the estimated embargo end times of a publication from its publishing year, one for each typical embargo length.
+    """
+    # ETIS publishing years are not always numbers. Publications without a usable year have no estimated embargo end.
+    try:
+        publication_date = datetime.datetime(int(publishing_year), 7, 1, tzinfo=datetime.timezone.utc)
+    except (TypeError, ValueError):
+        return []
+    return [publication_date + datetime.timedelta(days=round(n_months * 30.44)) for n_months in EMBARGO_MONTHS]
+
+
+def get_recheck_priority(publication: OpenAccessDatum, last_checked: datetime.datetime, now: datetime.datetime) -> tuple:
+    """
+    Gives the priority of a publication in the re-check queue. Smaller is more urgent.
+    Ambiguous publications come first. Within a tier, publications whose estimated embargo ended after the last check come first,
+    then the publications that were checked longest ago.
+    """
+    is_embargo_ended_since_check = any(last_checked < embargo_end <= now for embargo_end in get_estimated_embargo_ends(publication.publishing_year))
+    return get_recheck_tier(publication), not is_embargo_ended_since_check, last_checked.timestamp()
+
+
+def build_recheck_queue(open_access_data: list[OpenAccessDatum], last_checked_index: dict, harvest_timestamp: datetime.datetime, now: datetime.datetime) -> list[tuple]:
+    """
+    Gives a heap of (priority, GUID) of the publications that need re-checking and weren't checked recently.
+    Publications are last checked at the latest of their last re-check and the last full harvest.
+    """
+    min_recheck_interval = datetime.timedelta(days=MIN_RECHECK_INTERVAL_DAYS)
+    recheck_queue = []
+    for publication in open_access_data:
+        if get_recheck_tier(publication) is None:
+            continue
+        last_checked = harvest_timestamp
+        if publication.GUID in last_checked_index:
+            last_checked = max(last_checked, datetime.datetime.fromisoformat(last_checked_index[publication.GUID]))
+        if now - last_checked < min_recheck_interval:
+            continue
+        recheck_queue += [(get_recheck_priority(publication, last_checked, now), publication.GUID)]
+    heapq.heapify(recheck_queue)
+    return recheck_queue
+
+
+def get_seconds_until_next_day() -> float:
+    """
+    Gives the number of seconds until the request budget is renewed at UTC midnight.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    next_day = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time(), tzinfo=datetime.timezone.utc)
+    return (next_day - now).total_seconds()
+
+
+def run_recheck_cycle(state: dict, daily_request_budget: int) -> int:
+    """
+    Re-checks publications from the latest open access data in order of priority until the daily request budget runs out.
+    Saves new open access data files when the status of any publication changed.
+    Gives the number of requests made.
+    """
+    open_access_data_path = get_latest_file_path(RESULTS_DATA_DIRECTORY_PATH, "open_access_data", "json")
+    harvest_path = get_latest_file_path(RAW_DATA_DIRECTORY_PATH, "oa_button_reponses", "json")
+    if not (open_access_data_path and harvest_path):
+        info_string = "No open access data to re-check. Run get_data.py first"
+        logger.info(info_string)
+        return 0
+
+    today = datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+    n_requests_today = state["REQUESTS_BY_DATE"].get(today, 0)
+    if n_requests_today >= daily_request_budget:
+        return 0
+
+    with metrics.stage("recheck_open_access") as stage:
+        with open(open_access_data_path, encoding="utf8") as read_file:
+            open_access_data = [OpenAccessDatum.from_dict(item) for item in json.loads(read_file.read())]
+        open_access_data_index = {publication.GUID: publication for publication in open_access_data}
+
+        # Manual checks that were added after the open access data was saved take the publications out of the queue
+        if os.path.exists(MANUALLY_CHECKED_PUBLICATIONS_PATH):
+            with open(MANUALLY_CHECKED_PUBLICATIONS_PATH, encoding="utf8") as read_file:
+                for item in json.loads(read_file.read()):
+                    if item["GUID"] in open_access_data_index:
+                        open_access_data_index[item["GUID"]].is_available_manually_checked = item.get("IS_AVAILABLE")
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        recheck_queue = build_recheck_queue(open_access_data, state["LAST_CHECKED"], get_file_timestamp(harvest_path), now)
+        metrics.set_gauge("recheck_queue_length", len(recheck_queue))
+
+        open_access_button_session = OpenAccessButtonSession()
+        # Results are written to the cache, so that the next full harvest reuses them, but the cache isn't read: re-checks have to be fresh
+        open_access_button_cache = OpenAccessButtonCache(path=OPEN_ACCESS_BUTTON_CACHE_PATH, hit_TTL_days=0, miss_TTL_days=0)
+
+        n_bad_responses = 0
+        bad_response_threshold = 10         # Throw after this threshold of bad responses (don't spam API)
+        requests_per_second_limit = OPEN_ACCESS_BUTTON_REQUESTS_PER_SECOND_LIMIT
+
+        n_requests = 0
+        rechecks = []
+        lap_timestamp = time.monotonic()
+        # Requests made and their results in the cache are saved also when the cycle stops on the bad response threshold, so that the budget is accounted for
+        try:
+            while recheck_queue:
+                priority, GUID = recheck_queue[0]
+                publication = open_access_data_index[GUID]
+                inputs = get_lookup_inputs(publication.DOI, publication.URL, publication.title)
+                # Publications are checked whole: all inputs have to fit into the remaining budget
+                if n_requests_today + n_requests + len(inputs) > daily_request_budget:
+                    break
+                _ = heapq.heappop(recheck_queue)
+
+                data = None
+                is_complete = True
+                for input_type, input in inputs:
+                    limit_rate(lap_timestamp, requests_per_second_limit)
+                    lap_timestamp = time.monotonic()
+                    response = open_access_button_session.find(input)
+                    n_requests += 1
+
+                    if not response:
+                        n_bad_responses += 1
+                        metrics.count("bad_responses_total", {"stage": stage["NAME"]})
+                        if n_bad_responses >= bad_response_threshold:
+                            raise ConnectionError(f'Reached bad response threshold: {bad_response_threshold}')
+                        is_complete = False
+                        continue
+
+                    cache_entry = open_access_button_cache.set(OpenAccessButtonCache.get_key(input_type, input), response.json())
+                    if cache_entry["IS_FOUND"]:
+                        data = cache_entry["DATA"]
+                        is_complete = True
+                        break
+
+                # Publications that got a bad response stay due and are re-checked in the next cycle
+                if not is_complete:
+                    continue
+
+                recheck = {
+                    "GUID": GUID,
+                    "TIER": "AMBIGUOUS" if priority[0] == AMBIGUOUS_TIER else "NOT_OPEN",
+                    "PREVIOUS_OA_BUTTON_URL": publication.OA_button_URL,
+                    "OA_BUTTON_URL": (data or {}).get("url"),
+                    "DATA": data,
+                    "TIMESTAMP": datetime.datetime.now(datetime.timezone.utc).isoformat()}
+                rechecks += [recheck]
+        finally:
+            state["REQUESTS_BY_DATE"][today] = n_requests_today + n_requests
+            open_access_button_cache.save()
+            save_state(state, RECHECK_STATE_PATH)
+        metrics.count("recheck_publications_total", value=len(rechecks))
+
+        changed_rechecks = [recheck for recheck in rechecks if recheck["OA_BUTTON_URL"] != recheck["PREVIOUS_OA_BUTTON_URL"]]
+        if changed_rechecks:
+            new_URLs = list(dict.fromkeys(recheck["OA_BUTTON_URL"] for recheck in changed_rechecks if recheck["OA_BUTTON_URL"]))
+            URL_verifications_index = {item["URL"]: item for item in verify_URLs(new_URLs)}
+            for recheck in changed_rechecks:
+                publication = open_access_data_index[recheck["GUID"]]
+                publication.OA_button_URL = recheck["OA_BUTTON_URL"]
+                publication.OA_button_URL_verdict = (URL_verifications_index.get(recheck["OA_BUTTON_URL"]) or {}).get("VERDICT")
+
+            open_access_data_save_path = f'{RESULTS_DATA_DIRECTORY_PATH.strip("/")}/open_access_data_{get_timestamp_string()}.json'
+            save_data([publication.to_dict() for publication in open_access_data], open_access_data_save_path, SAVE_PARQUET)
+
+            open_access_data_ambiguous = [publication for publication in open_access_data if get_recheck_tier(publication) == AMBIGUOUS_TIER]
+            open_access_data_ambiguous_save_path = f'{RESULTS_DATA_DIRECTORY_PATH.strip("/")}/open_access_data_ambiguous_{get_timestamp_string()}.json'
+            save_data([publication.to_dict() for publication in open_access_data_ambiguous], open_access_data_ambiguous_save_path, SAVE_PARQUET)
+
+            info_string = f'Open access status changed for {len(changed_rechecks)} publications. Saved updated data to {open_access_data_save_path} and {len(open_access_data_ambiguous)} ambiguous publications to {open_access_data_ambiguous_save_path}'
+            logger.info(info_string)
+
+        if rechecks:
+            rechecks_save_path = f'{RAW_DATA_DIRECTORY_PATH.strip("/")}/open_access_rechecks_{get_timestamp_string()}.json'
+            save_data(rechecks, rechecks_save_path, SAVE_PARQUET)
+            info_string = f'Re-checked {len(rechecks)} publications with {n_requests} Open Access Button requests. {len(recheck_queue)} publications are still due. Saved results to {rechecks_save_path}'
+            logger.info(info_string)
+
+        # Publications only count as checked when their results are saved. Otherwise they are re-checked in the next cycle.
+        for recheck in rechecks:
+            state["LAST_CHECKED"][recheck["GUID"]] = recheck["TIMESTAMP"]
+        save_state(state, RECHECK_STATE_PATH)
+
+    return n_requests
+
+
+#####################
+# Environment setup #
+#####################
+
+logger = logging.getLogger()
+
+
+###############################
+# Re-check open access status #
+###############################
+
+def main(arguments: list[str] = None) -> None:
+    """
+    Re-checks open access status of ambiguous and not open publications within a daily request budget.
+    Runs until stopped, unless called with --once.
+    """
+    argument_parser = argparse.ArgumentParser(
+        description="Keep open access data current by re-checking ambiguous and not open publications within a daily request budget.")
+    _ = argument_parser.add_argument("--once", action="store_true", help="Run a single re-check cycle and exit.")
+    _ = argument_parser.add_argument("--daily-request-budget", type=int, default=DAILY_REQUEST_BUDGET, help="Open Access Button requests per UTC day.")
+    arguments = argument_parser.parse_args(arguments)
+
+    make_directories(RAW_DATA_DIRECTORY_PATH, RESULTS_DATA_DIRECTORY_PATH, CACHE_DIRECTORY_PATH)
+    setup_logger()
+
+    while True:
+        recheck_state = load_state(RECHECK_STATE_PATH)
+        n_cycle_requests = None
+        try:
+            n_cycle_requests = run_recheck_cycle(recheck_state, arguments.daily_request_budget)
+        finally:
+            # Each cycle saves its own metrics. Cycles that made no requests are not saved, failed cycles are.
+            if n_cycle_requests != 0:
+                metrics_save_path = metrics.save(METRICS_DIRECTORY_PATH, "recheck_open_access")
+                info_string = f'Saved run metrics to {metrics_save_path}'
+                logger.info(info_string)
+            metrics.reset()
+
+        if arguments.once:
+            break
+
+        sleep_seconds = CHECK_INTERVAL_MINUTES * 60
+        today = datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+        if recheck_state["REQUESTS_BY_DATE"].get(today, 0) >= arguments.daily_request_budget:
+            sleep_seconds = get_seconds_until_next_day()
+            info_string = f'Daily request budget of {arguments.daily_request_budget} is used up. Next re-check cycle in {sleep_seconds / 3600:.1f} hours'
+            logger.info(info_string)
+        time.sleep(sleep_seconds)
+
+
+if __name__ == "__main__":
+    main()
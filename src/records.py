@@ -0,0 +1,137 @@
+# standard
+import dataclasses
+
+
+#############
+# Constants #
+#############
+
+# Record attribute: ETIS publication field
+# Only these fields are kept from the ETIS publication data
+ETIS_PUBLICATION_FIELDS = {
+    "title": "Title",
+    "periodical": "Periodical",
+    "DOI": "Doi",
+    "URL": "Url",
+    "classification_code": "ClassificationCode",
+    "publication_status": "PublicationStatusEng",
+    "is_open_access": "IsOpenAccessEng",
+    "open_access_type": "OpenAccessTypeNameEng",
+    "license": "OpenAccessLicenceNameEng",
+    "is_public_file": "PublicFile",
+    "publishing_year": "PublishingYear",
+}
+
+
+#########################
+# Classes and functions #
+#########################
+
+@dataclasses.dataclass(slots=True)
+class EtisProject:
+    """
+    ETIS project fields that are used in the analysis.
+    """
+    GUID: str
+    title: str
+    acronym: str
+    financier_project_number: str
+    programme_codes: tuple[str]
+    publication_GUIDs: tuple[str]
+
+    @classmethod
+    def from_etis(cls, item: dict):
+        """
+        Decodes a project from ETIS project API data.
+        """
+        project = cls(
+            GUID=item["Guid"],
+            title=item.get("TitleEng"),
+            acronym=item.get("Acronym"),
+            financier_project_number=item.get("FinancierProjectNr"),
+            programme_codes=tuple(programme["ProgrammeCode"] for programme in item.get("Programmes") or []),
+            publication_GUIDs=tuple(publication["Guid"] for publication in item.get("Publications") or []))
+        return project
+
+
+@dataclasses.dataclass(slots=True)
+class EtisPublication:
+    """
+    ETIS publication fields that are used in the analysis.
+    Saved in the same structure as the raw data: ETIS fields under "DATA".
+    """
+    GUID: str
+    project_GUIDs: list[str]
+    title: str = None
+    periodical: str = None
+    DOI: str = None
+    URL: str = None
+    classification_code: str = None
+    publication_status: str = None
+    is_open_access: str = None
+    open_access_type: str = None
+    license: str = None
+    is_public_file: bool = None
+    publishing_year: int = None
+
+    @classmethod
+    def from_etis(cls, GUID: str, project_GUIDs: list[str], data: dict):
+        """
+        Decodes a publication from ETIS publication API data.
+        """
+        fields = {attribute: data.get(ETIS_field) for attribute, ETIS_field in ETIS_PUBLICATION_FIELDS.items()}
+        return cls(GUID=GUID, project_GUIDs=project_GUIDs, **fields)
+
+    @classmethod
+    def from_dict(cls, item: dict):
+        """
+        Decodes a publication from a saved publication (GUID, PROJECT_GUIDS and ETIS DATA).
+        """
+        return cls.from_etis(item["GUID"], item["PROJECT_GUIDS"], item["DATA"] or {})
+
+    def to_dict(self) -> dict:
+        """
+        Gives the publication in the saved publication structure.
+        """
+        item = {
+            "GUID": self.GUID,
+            "PROJECT_GUIDS": self.project_GUIDs,
+            "DATA": {ETIS_field: getattr(self, attribute) for attribute, ETIS_field in ETIS_PUBLICATION_FIELDS.items()}
+        }
+        return item
+
+
+@dataclasses.dataclass(slots=True)
+class OpenAccessDatum:
+    """
+    Summary of the open access status of a scientific article.
+    Saved with upper case attribute names as keys.
+    """
+    GUID: str
+    project_GUIDs: list[str]
+    title: str
+    periodical: str
+    DOI: str
+    URL: str
+    is_open_access: bool
+    open_access_type: str
+    license: str
+    is_public_file: bool
+    OA_button_URL: str
+    OA_button_URL_verdict: str
+    is_available_manually_checked: bool
+    publishing_year: int = None
+    cluster_ID: str = None
+
+    @classmethod
+    def from_dict(cls, item: dict):
+        """
+        Decodes an item of a saved open access data file.
+        """
+        return cls(**{field.name: item.get(field.name.upper()) for field in dataclasses.fields(cls)})
+
+    def to_dict(self) -> dict:
+        """
+        Gives the item in the saved open access data structure.
+        """
+        return {field.name.upper(): getattr(self, field.name) for field in dataclasses.fields(self)}
@@ -0,0 +1,371 @@
+# standard
+import argparse
+import ast
+import concurrent.futures
+import datetime
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+# local
+from columnar_storage import get_latest_file_path
+from common import setup_logger
+
+
+##########
+# Inputs #
+##########
+
+RAW_DATA_DIRECTORY_PATH = "./data/raw/"
+RESULTS_DATA_DIRECTORY_PATH = "./data/results/"
+MANUAL_DATA_DIRECTORY_PATH = "./data/manual/"
+PIPELINE_STATE_PATH = "./data/pipeline_state.json"
+SCRIPTS_DIRECTORY_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# Inputs and outputs are either fixed paths (PATH) or timestamped files (DIRECTORY and HANDLE), of which the latest is used.
+# Optional inputs are hashed when they exist, but don't block the stage when they don't.
+# Stages with MAX_AGE_DAYS pull data from APIs. They are rerun when their last run is older than that.
+# On demand stages are only run when they are named explicitly.
+STAGES = {
+    "build_open_access_snapshot_index": {
+        "SCRIPT": "build_open_access_snapshot_index.py",
+        "INPUTS": [{"PATH": "./data/snapshot/unpaywall_snapshot.jsonl.gz"}],
+        "OUTPUTS": [{"PATH": "./data/cache/open_access_snapshot.idx"}],
+    },
+    "get_data": {
+        "SCRIPT": "get_data.py",
+        "INPUTS": [
+            {"PATH": "./data/manual/manually_checked_publications.json", "OPTIONAL": True},
+            {"PATH": "./data/cache/open_access_snapshot.idx", "OPTIONAL": True}],
+        "OUTPUTS": [
+            {"DIRECTORY": RAW_DATA_DIRECTORY_PATH, "HANDLE": "etis_projects"},
+            {"DIRECTORY": RAW_DATA_DIRECTORY_PATH, "HANDLE": "scientific_articles"},
+            {"DIRECTORY": RAW_DATA_DIRECTORY_PATH, "HANDLE": "oa_button_reponses"},
+            {"DIRECTORY": RESULTS_DATA_DIRECTORY_PATH, "HANDLE": "open_access_data"}],
+        "MAX_AGE_DAYS": 30,
+    },
+    "get_openaire_graph_projects": {
+        "SCRIPT": "get_openaire_graph_projects.py",
+        "INPUTS": [],
+        "OUTPUTS": [{"DIRECTORY": RAW_DATA_DIRECTORY_PATH, "HANDLE": "openaire_graph_projects"}],
+        "MAX_AGE_DAYS": 30,
+    },
+    "get_openaire_search_project_results": {
+        "SCRIPT": "get_openaire_search_project_results.py",
+        "INPUTS": [{"DIRECTORY": RAW_DATA_DIRECTORY_PATH, "HANDLE": "etis_projects"}],
+        "OUTPUTS": [{"DIRECTORY": RAW_DATA_DIRECTORY_PATH, "HANDLE": "openaire_search_project_results"}],
+    },
+    "get_etis_project_horizon_ids": {
+        "SCRIPT": "get_etis_project_horizon_ids.py",
+        "INPUTS": [
+            {"DIRECTORY": RAW_DATA_DIRECTORY_PATH, "HANDLE": "etis_projects"},
+            {"DIRECTORY": RAW_DATA_DIRECTORY_PATH, "HANDLE": "openaire_search_project_results"},
+            {"DIRECTORY": RAW_DATA_DIRECTORY_PATH, "HANDLE": "openaire_graph_projects"}],
+        "OUTPUTS": [],
+    },
+    "get_open_access_opt_outs": {
+        "SCRIPT": "get_open_access_opt_outs.py",
+        "INPUTS": [{"PATH": "./data/raw/project.csv"}],
+        "OUTPUTS": [],
+    },
+    "get_citation_counts": {
+        "SCRIPT": "get_citation_counts.py",
+        "INPUTS": [{"DIRECTORY": RESULTS_DATA_DIRECTORY_PATH, "HANDLE": "open_access_data"}],
+        "OUTPUTS": [{"DIRECTORY": RESULTS_DATA_DIRECTORY_PATH, "HANDLE": "citation_counts"}],
+        "MAX_AGE_DAYS": 30,
+    },
+    "classify_periodicals": {
+        "SCRIPT": "classify_periodicals.py",
+        "INPUTS": [
+            {"DIRECTORY": RESULTS_DATA_DIRECTORY_PATH, "HANDLE": "open_access_data"},
+            {"PATH": "./data/manual/predatory_journals.csv"}],
+        "OUTPUTS": [{"DIRECTORY": RESULTS_DATA_DIRECTORY_PATH, "HANDLE": "periodical_classifications"}],
+    },
+    "analyse_data": {
+        "SCRIPT": "analyse_data.py",
+        "INPUTS": [
+            {"DIRECTORY": RESULTS_DATA_DIRECTORY_PATH, "HANDLE": "open_access_data"},
+            {"DIRECTORY": RESULTS_DATA_DIRECTORY_PATH, "HANDLE": "citation_counts", "OPTIONAL": True}],
+        "OUTPUTS": [],
+    },
+    "select_publications_for_manual_check": {
+        "SCRIPT": "select_publications_for_manual_check.py",
+        "INPUTS": [{"DIRECTORY": RESULTS_DATA_DIRECTORY_PATH, "HANDLE": "open_access_data"}],
+        "OUTPUTS": [],
+        "ON_DEMAND": True,
+    },
+}
+
+
+#########################
+# Classes and functions #
+#########################
+
+def get_artifact_path(artifact: dict) -> str:
+    """
+    Gives the path of the current file of an input or output artifact or None if there is no such file.
+    """
+    if "PATH" in artifact:
+        return artifact["PATH"] if os.path.exists(artifact["PATH"]) else None
+    if not os.path.exists(artifact["DIRECTORY"]):
+        return None
+    return get_latest_file_path(artifact["DIRECTORY"], artifact["HANDLE"], "json")
+
+
+def get_artifact_key(artifact: dict) -> str:
+    """
+    Gives a key that identifies an artifact regardless of its timestamp.
+    """
+    if "PATH" in artifact:
+        return os.path.normpath(artifact["PATH"])
+    return os.path.join(os.path.normpath(artifact["DIRECTORY"]), artifact["HANDLE"])
+
+
+def get_file_hash(path: str) -> str:
+    """
+    Gives the SHA-256 hash of file contents. Reads the file in chunks.
+    """
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as read_file:
+        for chunk in iter(lambda: read_file.read(2**20), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def get_source_files(script: str) -> list[str]:
+    """
+    Gives the file names of the script and of the local modules that it imports, directly or through other local modules.
+    Local modules are the modules in the scripts directory. Imports inside functions are included.
+    """
+    source_files = set()
+    files_to_check = [script]
+    while files_to_check:
+        file = files_to_check.pop()
+        if file in source_files:
+            continue
+        source_files.add(file)
+
+        with open(os.path.join(SCRIPTS_DIRECTORY_PATH, file), encoding="utf8") as read_file:
+            syntax_tree = ast.parse(read_file.read())
+        for node in ast.walk(syntax_tree):
+            if isinstance(node, ast.Import):
+                module_names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                module_names = [node.module]
+            else:
+                continue
+            for module_name in module_names:
+                module_file = f'{module_name.split(".")[0]}.py'
+                if os.path.exists(os.path.join(SCRIPTS_DIRECTORY_PATH, module_file)):
+                    files_to_check += [module_file]
+    return sorted(source_files)
+
+
+def get_stage_fingerprint(stage: dict) -> str:
+    """
+    Gives a hash of the stage script, the local modules it imports and the current contents of all its inputs.
+    The stage has to be rerun when its fingerprint changes.
+    """
+    fingerprint = hashlib.sha256()
+    for file in get_source_files(stage["SCRIPT"]):
+        fingerprint.update(file.encode())
+        fingerprint.update(get_file_hash(os.path.join(SCRIPTS_DIRECTORY_PATH, file)).encode())
+    for artifact in stage["INPUTS"]:
+        path = get_artifact_path(artifact)
+        fingerprint.update(get_artifact_key(artifact).encode())
+        fingerprint.update((get_file_hash(path) if path else "missing").encode())
+    return fingerprint.hexdigest()
+
+
+def get_stage_dependencies(stages: dict) -> dict[str, set]:
+    """
+    Gives the names of the stages that produce the inputs of each stage.
+    """
+    producers = {}
+    for name, stage in stages.items():
+        for artifact in stage["OUTPUTS"]:
+            producers[get_artifact_key(artifact)] = name
+
+    dependencies = {}
+    for name, stage in stages.items():
+        dependencies[name] = {producers[get_artifact_key(artifact)] for artifact in stage["INPUTS"] if get_artifact_key(artifact) in producers}
+        dependencies[name].discard(name)
+    return dependencies
+
+
+def get_staleness_reason(name: str, stage: dict, state: dict, fingerprint: str) -> str:
+    """
+    Gives the reason why a stage has to be rerun or None if it's up to date.
+    """
+    stage_state = state.get(name)
+    if not stage_state:
+        return "never run"
+    if stage_state["FINGERPRINT"] != fingerprint:
+        return "inputs or script changed"
+    if any(not get_artifact_path(artifact) for artifact in stage["OUTPUTS"]):
+        return "outputs missing"
+    if "MAX_AGE_DAYS" in stage:
+        age = datetime.datetime.now(datetime.timezone.utc) - datetime.datetime.fromisoformat(stage_state["FINISHED"])
+        if age > datetime.timedelta(days=stage["MAX_AGE_DAYS"]):
+            return f'older than {stage["MAX_AGE_DAYS"]} days'
+    return None
+
+
+def run_stage(name: str, stage: dict, profile: bool = False) -> int:
+    """
+    Runs the stage script from the project directory. Gives the exit code of the script.
+    """
+    script_path = os.path.join(SCRIPTS_DIRECTORY_PATH, stage["SCRIPT"])
+    environment = {**os.environ, "HORIZON_ANALYZER_PROFILE": "1"} if profile else None
+    completed_process = subprocess.run([sys.executable, script_path], env=environment)
+    return completed_process.returncode
+
+
+#####################
+# Environment setup #
+#####################
+
+logger = logging.getLogger()
+
+
+########
+# Main #
+########
+
+def main(arguments: list[str] = None) -> None:
+    """
+    Runs the pipeline stages that are out of date. Exits with code 1 when any stage failed.
+    """
+    argument_parser = argparse.ArgumentParser(description="Run the pipeline stages that are out of date.")
+    _ = argument_parser.add_argument("stages", nargs="*", help="Stages to run with their upstream stages. Default: all stages that are not on demand.")
+    _ = argument_parser.add_argument("--force", nargs="*", metavar="STAGE", help="Rerun these stages even if they are up to date. All selected stages if no stage is given.")
+    _ = argument_parser.add_argument("--jobs", type=int, default=4, help="Number of stages to run in parallel.")
+    _ = argument_parser.add_argument("--dry-run", action="store_true", help="Only show which stages would run.")
+    _ = argument_parser.add_argument("--profile", action="store_true", help="Profile the stages. Profiles are saved with the run metrics.")
+    arguments = argument_parser.parse_args(arguments)
+
+    setup_logger()
+
+    unknown_stages = [name for name in arguments.stages + (arguments.force or []) if name not in STAGES]
+    if unknown_stages:
+        argument_parser.error(f'Unknown stages: {unknown_stages}. Known stages: {list(STAGES)}')
+
+    # Select stages
+    dependencies = get_stage_dependencies(STAGES)
+
+    # Add upstream stages of the requested stages
+    selected_stages = set(arguments.stages or [name for name, stage in STAGES.items() if not stage.get("ON_DEMAND")])
+    stages_to_check = list(selected_stages)
+    while stages_to_check:
+        for dependency in dependencies[stages_to_check.pop()]:
+            if dependency not in selected_stages:
+                selected_stages.add(dependency)
+                stages_to_check += [dependency]
+
+    forced_stages = set()
+    if arguments.force is not None:
+        forced_stages = set(arguments.force) or selected_stages
+
+    state = {}
+    if os.path.exists(PIPELINE_STATE_PATH):
+        with open(PIPELINE_STATE_PATH, encoding="utf8") as read_file:
+            state = json.loads(read_file.read())
+
+    # Run stages
+    # A stage is checked when all of its upstream stages are done, so that it sees their new outputs.
+    # Stages whose upstream stages are done run in parallel.
+    done_stages = set()
+    skipped_stages = set()
+    failed_stages = set()
+    would_run_stages = set()           # Stages that a dry run would run
+    running_stages = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=arguments.jobs) as executor:
+        while len(done_stages | failed_stages) < len(selected_stages):
+            n_finished_stages = len(done_stages | failed_stages)
+            for name in sorted(selected_stages - done_stages - failed_stages - set(running_stages.values())):
+                if dependencies[name] & failed_stages:
+                    info_string = f'Skipping {name}: upstream stage failed'
+                    logger.info(info_string)
+                    failed_stages.add(name)
+                    continue
+                if not (dependencies[name] & selected_stages) <= done_stages:
+                    continue
+
+                # In a dry run the outputs of upstream stages that would run don't exist yet or are stale, so their inputs can't be checked
+                upstream_would_run_stages = dependencies[name] & would_run_stages
+                if upstream_would_run_stages:
+                    info_string = f'Would run {name}: upstream stages {sorted(upstream_would_run_stages)} would run'
+                    logger.info(info_string)
+                    would_run_stages.add(name)
+                    done_stages.add(name)
+                    continue
+
+                stage = STAGES[name]
+                missing_inputs = [get_artifact_key(artifact) for artifact in stage["INPUTS"] if not artifact.get("OPTIONAL") and not get_artifact_path(artifact)]
+                if missing_inputs:
+                    # Not a failure: stages downstream can still run if they only use this stage's outputs optionally
+                    info_string = f'Skipping {name}: missing inputs {missing_inputs}'
+                    logger.info(info_string)
+                    skipped_stages.add(name)
+                    done_stages.add(name)
+                    continue
+
+                fingerprint = get_stage_fingerprint(stage)
+                staleness_reason = "forced" if name in forced_stages else get_staleness_reason(name, stage, state, fingerprint)
+                if not staleness_reason:
+                    info_string = f'{name} is up to date'
+                    logger.info(info_string)
+                    done_stages.add(name)
+                    continue
+
+                if arguments.dry_run:
+                    info_string = f'Would run {name}: {staleness_reason}'
+                    logger.info(info_string)
+                    would_run_stages.add(name)
+                    done_stages.add(name)
+                    continue
+
+                info_string = f'Running {name}: {staleness_reason}'
+                logger.info(info_string)
+
+                future = executor.submit(run_stage, name, stage, arguments.profile)
+                future.fingerprint = fingerprint
+                running_stages[future] = name
+
+            if not running_stages:
+                # Stages that are left wait for each other, e.g. because of a dependency cycle in STAGES
+                if len(done_stages | failed_stages) == n_finished_stages:
+                    unscheduled_stages = sorted(selected_stages - done_stages - failed_stages)
+                    raise RuntimeError(f'Stages can not be scheduled, because their upstream stages never finish: {unscheduled_stages}')
+                continue
+
+            finished_futures, _ = concurrent.futures.wait(running_stages, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished_futures:
+                name = running_stages.pop(future)
+                if future.result() != 0:
+                    info_string = f'{name} failed with exit code {future.result()}'
+                    logger.info(info_string)
+                    failed_stages.add(name)
+                    continue
+
+                state[name] = {
+                    "FINGERPRINT": future.fingerprint,
+                    "FINISHED": datetime.datetime.now(datetime.timezone.utc).isoformat()
+                }
+                with open(PIPELINE_STATE_PATH, "w", encoding="utf8") as save_file:
+                    save_file.write(json.dumps(state, indent=2, ensure_ascii=False))
+                done_stages.add(name)
+
+    if arguments.dry_run:
+        info_string = f'Dry run finished. {len(would_run_stages)} stages would run, {len(done_stages - skipped_stages - would_run_stages)} stages are up to date and {len(skipped_stages)} stages would be skipped for missing inputs'
+    else:
+        info_string = f'Pipeline finished. {len(done_stages - skipped_stages)} stages are up to date, {len(skipped_stages)} stages were skipped for missing inputs and {len(failed_stages)} stages failed'
+    logger.info(info_string)
+    if failed_stages:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,319 @@
-
-import datetime
+# standard
 import json
+import logging
 import os
 import random
 import re
+# local
+from columnar_storage import get_latest_file_path
+from common import get_timestamp_string, setup_logger
+
+
+##########
+# Inputs #
+##########
+
+RAW_DATA_DIRECTORY_PATH = "./data/raw/"
+RESULTS_DATA_DIRECTORY_PATH = "./data/results/"
+MANUAL_DATA_DIRECTORY_PATH = "./data/manual/"
+MANUALLY_CHECKED_PUBLICATIONS_PATH = "./data/manual/manually_checked_publications.json"
+
+SAMPLE_SIZE = 20
+RANDOM_SEED = 1913
+STRATIFY_BY = [
+    "AMBIGUITY_CLASS",      # Whether ETIS and Open Access Button agree on the open access status
+    # "PROGRAMME",          # Horizon programme codes of the projects the publication is reported under
+    # "PERIODICAL",         # Journal the publication was published in
+]
+ALLOCATION = "proportional"
+    # proportional - sample size of each stratum is proportional to the stratum size
+    # equal - every stratum gets the same sample size
+EXCLUDE_ALREADY_CHECKED = True      # Don't select publications that have been selected or checked before
 
-def read_latest_file(dir_path: str, file_handle: str = None) -> list[dict]:
+
+#########################
+# Classes and functions #
+#########################
+
+def iterate_json_array(path: str, chunk_size: int = 2**16):
     """
-    Reads file with the latest timestamp in filename from given dir_path.
-    If file_handle is given, checks only filenames with the given file_handle followed by a timestamp.
+    Yields the items of a JSON array file one by one.
+    Reads the file in chunks, so only the current item has to fit into memory.
     """
-    if not file_handle:
-        file_handle = ".+"
-    name_pattern = file_handle + r'_(\d+)'
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf8") as read_file:
+        buffer = ""
+        position = 0
+        is_array_started = False
+        is_end_of_file = False
+        while True:
+            # Skip whitespace and separators between items
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
 
-    files = [file for file in os.listdir(dir_path) if re.match(name_pattern, file)]
-    files_latest = sorted(files, key=lambda x: re.match(name_pattern, x).group(1))[-1]
-    path = f'{dir_path.strip("/")}/{files_latest}'
+            if position >= len(buffer):
+                if is_end_of_file:
+                    return
+                buffer = read_file.read(chunk_size)
+                position = 0
+                is_end_of_file = not buffer
+                continue
 
-    with open(path, encoding="utf8") as read_file:
-        data = json.loads(read_file.read())
-    
-    return data
+            if not is_array_started:
+                if buffer[position] != "[":
+                    raise ValueError(f'{path} is not a JSON array')
+                is_array_started = True
+                position += 1
+                continue
+
+            if buffer[position] == "]":
+                return
+
+            try:
+                item, item_end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                item_end = None
+
+            # An item that reaches the end of the buffer may be incomplete (e.g. a truncated number)
+            if item_end is None or (item_end == len(buffer) and not is_end_of_file):
+                if is_end_of_file:
+                    raise ValueError(f'Could not parse JSON array item at position {position} in {path}')
+                chunk = read_file.read(chunk_size)
+                is_end_of_file = not chunk
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+
+            yield item
+            position = item_end
+
+
+def iterate_open_access_data(dir_path: str):
+    """
+    Yields the items of the latest open access data file.
+    Reads only the columns needed for sampling from the Parquet file when it's up to date. These columns are loaded into memory whole,
+    but they are a small part of the data. Otherwise streams the JSON file one item at a time.
+    """
+    columns = ["GUID", "PROJECT_GUIDS", "PERIODICAL", "IS_OPEN_ACCESS", "OA_BUTTON_URL", "IS_AVAILABLE_MANUALLY_CHECKED"]
+    parquet_path = get_latest_file_path(dir_path, "open_access_data", "parquet")
+    JSON_path = get_latest_file_path(dir_path, "open_access_data", "json")
+
+    if parquet_path and not (JSON_path and JSON_path[:-len(".json")] > parquet_path[:-len(".parquet")]):
+        import polars
+        yield from polars.read_parquet(parquet_path, columns=columns, memory_map=True).iter_rows(named=True)
+        return
+
+    yield from iterate_json_array(JSON_path)
+
+
+def get_ambiguity_class(publication: dict) -> str:
+    """
+    Classifies publication by whether ETIS and Open Access Button agree on its open access status.
+    Uses the same logic as the ambiguous open access data check in get_data.
+    """
+    if publication["IS_AVAILABLE_MANUALLY_CHECKED"] is not None:
+        return "MANUALLY_CHECKED"
+    if publication["IS_OPEN_ACCESS"] and publication["OA_BUTTON_URL"]:
+        return "AGREED_OPEN"
+    if not (publication["IS_OPEN_ACCESS"] or publication["OA_BUTTON_URL"]):
+        return "AGREED_NOT_OPEN"
+    return "AMBIGUOUS"
+
+
+def get_stratum(publication: dict, project_programme_codes: dict[str, set]) -> tuple:
+    """
+    Gives the values of the STRATIFY_BY variables for a publication.
+    """
+    stratum = []
+    for variable in STRATIFY_BY:
+        if variable == "AMBIGUITY_CLASS":
+            stratum += [get_ambiguity_class(publication)]
+        elif variable == "PROGRAMME":
+            programme_codes = set()
+            for project_GUID in publication["PROJECT_GUIDS"]:
+                programme_codes |= project_programme_codes.get(project_GUID, set())
+            stratum += ["+".join(sorted(programme_codes)) or None]
+        elif variable == "PERIODICAL":
+            stratum += [" ".join((publication["PERIODICAL"] or "").lower().split()) or None]
+        else:
+            raise ValueError(f'Unknown stratification variable: {variable}')
+    return tuple(stratum)
+
+
+def allocate_sample(population_sizes: dict[tuple, int], sample_size: int, randomizer: random.Random) -> dict[tuple, int]:
+    """
+    Distributes the sample size between strata.
+    Uses largest remainder rounding with random tie-breaking. Strata never get more than their population size.
+    """
+    # Ties are common when there are fewer samples than strata. Breaking them by stratum order would leave out the same strata every time.
+    tie_breakers = {stratum: randomizer.random() for stratum in population_sizes}
+    allocation = {stratum: 0 for stratum in population_sizes}
+    n_remaining = min(sample_size, sum(population_sizes.values()))
+    while n_remaining > 0:
+        open_strata = [stratum for stratum, size in population_sizes.items() if allocation[stratum] < size]
+        if ALLOCATION == "equal":
+            weights = {stratum: 1 for stratum in open_strata}
+        elif ALLOCATION == "proportional":
+            weights = {stratum: population_sizes[stratum] for stratum in open_strata}
+        else:
+            raise ValueError(f'Unknown allocation method: {ALLOCATION}')
+
+        total_weight = sum(weights.values())
+        quotas = {stratum: n_remaining * weight / total_weight for stratum, weight in weights.items()}
+        shares = {stratum: int(quota) for stratum, quota in quotas.items()}
+        n_leftover = n_remaining - sum(shares.values())
+        by_remainder = sorted(open_strata, key=lambda x: (quotas[x] - shares[x], tie_breakers[x]), reverse=True)
+        for stratum in by_remainder[:n_leftover]:
+            shares[stratum] += 1
+
+        for stratum, share in shares.items():
+            share = min(share, population_sizes[stratum] - allocation[stratum])
+            allocation[stratum] += share
+            n_remaining -= share
+    return allocation
+
+
+#####################
+# Environment setup #
+#####################
+
+logger = logging.getLogger()
 
 
-data = read_latest_file("data/results/", "open_access_data")
+################################################
+# Index publications that were checked already #
+################################################
+
+def get_checked_GUIDs() -> set[str]:
+    """
+    Gives GUIDs of the publications that have been selected or checked before.
+    """
+    checked_GUIDs = set()
+    if not EXCLUDE_ALREADY_CHECKED:
+        return checked_GUIDs
+
+    for file in os.listdir(MANUAL_DATA_DIRECTORY_PATH):
+        if not re.match(r'manual_check_guids_\d+', file):
+            continue
+        with open(f'{MANUAL_DATA_DIRECTORY_PATH.strip("/")}/{file}', encoding="utf8") as read_file:
+            checked_GUIDs |= {line.strip() for line in read_file if line.strip()}
+
+    if os.path.exists(MANUALLY_CHECKED_PUBLICATIONS_PATH):
+        checked_GUIDs |= {item["GUID"] for item in iterate_json_array(MANUALLY_CHECKED_PUBLICATIONS_PATH)}
+    return checked_GUIDs
+
+
+#################################
+# Index project programme codes #
+#################################
+
+def get_project_programme_codes() -> dict[str, set]:
+    """
+    Gives the Horizon programme codes of each ETIS project by project GUID. Only needed when stratifying by programme.
+    """
+    project_programme_codes = {}
+    if "PROGRAMME" in STRATIFY_BY:
+        ETIS_projects_path = get_latest_file_path(RAW_DATA_DIRECTORY_PATH, "etis_projects", "json")
+        for project in iterate_json_array(ETIS_projects_path):
+            project_programme_codes[project["Guid"]] = {programme["ProgrammeCode"] for programme in project["Programmes"]}
+    return project_programme_codes
+
+
+#################################################
+# Reservoir sample publications in each stratum #
+#################################################
+
+def select_publications(checked_GUIDs: set[str], project_programme_codes: dict[str, set]) -> tuple[list[str], list[dict]]:
+    """
+    Gives the GUIDs of a stratified random sample of publications and the sizes and weights of the strata.
+    """
+    # Every stratum keeps a reservoir of SAMPLE_SIZE items, which is the most that any single stratum can be allocated.
+    # This keeps memory use bounded by the number of strata, not by the number of publications.
+    randomizer = random.Random(RANDOM_SEED)
+
+    population_sizes = {}
+    reservoirs = {}
+    n_excluded = 0
+    for publication in iterate_open_access_data(RESULTS_DATA_DIRECTORY_PATH):
+        if publication["GUID"] in checked_GUIDs:
+            n_excluded += 1
+            continue
+
+        stratum = get_stratum(publication, project_programme_codes)
+        population_sizes[stratum] = population_sizes.get(stratum, 0) + 1
+        reservoir = reservoirs.setdefault(stratum, [])
+
+        if len(reservoir) < SAMPLE_SIZE:
+            reservoir += [publication["GUID"]]
+            continue
+
+        i_replace = randomizer.randrange(population_sizes[stratum])
+        if i_replace < SAMPLE_SIZE:
+            reservoir[i_replace] = publication["GUID"]
+
+    allocation = allocate_sample(population_sizes, SAMPLE_SIZE, randomizer)
+    n_unsampled_strata = sum(1 for n_selected in allocation.values() if not n_selected)
+    if n_unsampled_strata:
+        warning_string = f'{n_unsampled_strata} of {len(population_sizes)} strata get no publications in a sample of {SAMPLE_SIZE} and have no WEIGHT. Manual check results do not cover them. Stratify by fewer variables, use equal allocation or increase SAMPLE_SIZE'
+        logger.warning(warning_string)
+
+    GUIDs = []
+    strata = []
+    for stratum, n_selected in sorted(allocation.items(), key=lambda x: str(x[0])):
+        # Reservoir is a uniform random sample of the stratum, so any subset of it is as well
+        GUIDs += randomizer.sample(reservoirs[stratum], n_selected)
+        strata += [{
+            "STRATUM": dict(zip(STRATIFY_BY, stratum)),
+            "POPULATION_SIZE": population_sizes[stratum],
+            "SAMPLE_SIZE": n_selected,
+            "WEIGHT": population_sizes[stratum] / n_selected if n_selected else None
+        }]
+
+    info_string = f'Selected {len(GUIDs)} publications from {sum(population_sizes.values())} candidates in {len(population_sizes)} strata. Excluded {n_excluded} publications that were checked before'
+    logger.info(info_string)
+    return GUIDs, strata
+
+
+################
+# Save results #
+################
+
+def save_selection(GUIDs: list[str], strata: list[dict]) -> None:
+    """
+    Saves the selected GUIDs and the stratum weights to the manual data directory.
+    """
+    timestamp = get_timestamp_string()
+    output_file_path = f'{MANUAL_DATA_DIRECTORY_PATH.strip("/")}/manual_check_guids_{timestamp}.txt'
+
+    # Save the GUIDs to the file
+    with open(output_file_path, "w", encoding="utf8") as output_file:
+        for GUID in GUIDs:
+            output_file.write(f"{GUID}\n")
+
+    # Save stratum sizes so that results of the manual check can be weighted back to the population
+    strata_save_path = f'{MANUAL_DATA_DIRECTORY_PATH.strip("/")}/manual_check_strata_{timestamp}.json'
+    with open(strata_save_path, "w", encoding="utf8") as save_file:
+        save_file.write(json.dumps(strata, indent=2, ensure_ascii=False))
+
+    info_string = f'Saved selected publication GUIDs to {output_file_path} and stratum weights to {strata_save_path}'
+    logger.info(info_string)
+
+
+########
+# Main #
+########
+
+def main() -> None:
+    """
+    Selects a random sample of publications for manually checking their open access status.
+    """
+    setup_logger()
 
-random.seed(1913)
-selected_data = random.sample(data, 20)
-guids = [item["GUID"] for item in selected_data]
+    checked_GUIDs = get_checked_GUIDs()
+    project_programme_codes = get_project_programme_codes()
+    GUIDs, strata = select_publications(checked_GUIDs, project_programme_codes)
+    save_selection(GUIDs, strata)
 
-timestamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%d%H%M%SUTC")
-output_file_path = f'./data/manual/manual_check_guids_{timestamp}.txt'
 
-# Save the GUIDs to the file
-with open(output_file_path, "w", encoding="utf8") as output_file:
-    for guid in guids:
-        output_file.write(f"{guid}\n")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# standard
+import time
+# external
+from thefuzz import fuzz
+# local
+import metrics
+from normalization import get_title_compare_string, get_title_compare_strings
+
+
+#############
+# Constants #
+#############
+
+# Top score has to be this and the runner-up at most EXACT_MATCH_MAX_RUNNER_UP_SCORE for an exact match
+EXACT_MATCH_SCORE = 100
+EXACT_MATCH_MAX_RUNNER_UP_SCORE = 85
+# Top score has to be at least this and the runner-up below APPROXIMATE_MATCH_MAX_RUNNER_UP_SCORE for an approximate match
+APPROXIMATE_MATCH_MIN_SCORE = 85
+APPROXIMATE_MATCH_MAX_RUNNER_UP_SCORE = 70
+
+# Lower the score for matches that are much shorter than input
+MIN_LENGTH_RATIO = 0.7
+
+EXACT_MATCH = "EXACT"
+APPROXIMATE_MATCH = "APPROXIMATE"
+
+
+#########################
+# Classes and functions #
+#########################
+
+def get_fuzz_score(ETIS_compare_string: str, openaire_graph_compare_string: str) -> float:
+    """
+    Gives the similarity score of two compare strings (0-100).
+    Lowers the score of matches that are much shorter than the ETIS title.
+    """
+    length_coefficient = 1
+    length_ratio = len(openaire_graph_compare_string) / len(ETIS_compare_string)
+    if length_ratio < MIN_LENGTH_RATIO:
+        length_coefficient = length_ratio
+    return fuzz.partial_token_sort_ratio(ETIS_compare_string, openaire_graph_compare_string) * length_coefficient
+
+
+def get_fuzz_scores(project: dict, openaire_graph_projects: list[dict], openaire_graph_compare_strings: list[str]) -> list[dict]:
+    """
+    Scores an ETIS project title against all OpenAIRE graph project titles. Gives the scores from best to worst.
+    Takes the compare strings of the OpenAIRE titles in the same order as the projects.
+    """
+    fuzz_scores = []
+    ETIS_compare_string = get_title_compare_string(project["TitleEng"])
+    if not ETIS_compare_string:
+        return fuzz_scores
+
+    for openaire_graph_project, openaire_graph_compare_string in zip(openaire_graph_projects, openaire_graph_compare_strings):
+        if not openaire_graph_project["title"]:
+            continue
+
+        fuzz_score = {
+            "GUID": project["Guid"],
+            "TITLE": project["TitleEng"],
+            "HORIZON_ID": openaire_graph_project["code"],
+            "OPENAIRE_ID": openaire_graph_project["id"],
+            "OPENAIRE_GRAPH_TITLE": openaire_graph_project["title"],
+            "FUZZ_SCORE": get_fuzz_score(ETIS_compare_string, openaire_graph_compare_string),
+        }
+        fuzz_scores += [fuzz_score]
+
+    fuzz_scores_sorted = sorted(fuzz_scores, key=lambda x: x["FUZZ_SCORE"], reverse=True)
+    return fuzz_scores_sorted
+
+
+def get_match_type(fuzz_scores_sorted: list[dict]) -> str:
+    """
+    Decides whether the best scoring title is an exact match, an approximate match or not a match (None).
+    The best title has to be clearly better than the runner-up.
+    """
+    if not fuzz_scores_sorted:
+        return None
+    top_score = fuzz_scores_sorted[0]["FUZZ_SCORE"]
+    runner_up_score = fuzz_scores_sorted[1]["FUZZ_SCORE"] if len(fuzz_scores_sorted) > 1 else 0
+
+    if top_score == EXACT_MATCH_SCORE and runner_up_score <= EXACT_MATCH_MAX_RUNNER_UP_SCORE:
+        return EXACT_MATCH
+    if top_score >= APPROXIMATE_MATCH_MIN_SCORE and runner_up_score < APPROXIMATE_MATCH_MAX_RUNNER_UP_SCORE:
+        return APPROXIMATE_MATCH
+    return None
+
+
+def match_titles(projects, openaire_graph_projects: list[dict]) -> tuple[list[dict], list[dict], list[list[dict]]]:
+    """
+    Matches ETIS project titles to OpenAIRE graph project titles.
+    Projects are matched in the given order. An exactly matched OpenAIRE project is not offered to the projects after it.
+    Gives exact matches, approximate matches and the sorted scores of the projects that didn't match.
+    """
+    # OpenAIRE titles are cleaned once, not again for every ETIS project
+    openaire_graph_projects = list(openaire_graph_projects)
+    openaire_graph_compare_strings = get_title_compare_strings([project["title"] for project in openaire_graph_projects])
+    labels = {"stage": metrics.active_stage_name or ""}
+
+    exact_title_matches = []
+    approximate_title_matches = []
+    title_match_fails = []
+    for project in projects:
+        if not project["TitleEng"]:
+            continue
+        match_start = time.perf_counter()
+
+        fuzz_scores_sorted = get_fuzz_scores(project, openaire_graph_projects, openaire_graph_compare_strings)
+        match_type = get_match_type(fuzz_scores_sorted)
+        if match_type == EXACT_MATCH:
+            exact_match = fuzz_scores_sorted[0]
+            exact_title_matches += [exact_match]
+            i_match = next(i for i, project in enumerate(openaire_graph_projects) if project["id"] == exact_match["OPENAIRE_ID"])
+            del openaire_graph_projects[i_match]
+            del openaire_graph_compare_strings[i_match]
+        elif match_type == APPROXIMATE_MATCH:
+            approximate_title_matches += [fuzz_scores_sorted[0]]
+        else:
+            title_match_fails += [fuzz_scores_sorted]
+
+        metrics.count("title_comparisons_total", labels, len(fuzz_scores_sorted))
+        metrics.observe("title_match_duration_seconds", time.perf_counter() - match_start, labels)
+
+    return exact_title_matches, approximate_title_matches, title_match_fails
@@ -0,0 +1,72 @@
+# standard
+import functools
+import os
+# external
+import requests
+import requests.adapters
+import urllib3.util
+# local
+import metrics
+
+
+#############
+# Constants #
+#############
+
+# Connections kept open to each host. Has to be at least the number of simultaneous requests to a host, otherwise connections are dropped.
+POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", 10))
+POOL_CONNECTIONS = 100              # Number of hosts that have a connection pool. The least recently used pool is dropped beyond that.
+# Seconds to wait for a connection and for the server to send data. Without a timeout a hung connection stalls the run forever.
+CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 10))
+READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", 60))
+
+# Advertises gzip and deflate, and brotli and zstd when their packages are installed (urllib3 decodes them)
+ACCEPT_ENCODING = urllib3.util.make_headers(accept_encoding=True)["accept-encoding"]
+
+# Connections that fail or time out before the server answers are retried. Bad responses are handled by the scripts.
+RETRIES = urllib3.util.Retry(total=3, connect=3, read=2, status=0, other=0, backoff_factor=1, raise_on_status=False)
+
+
+#########################
+# Classes and functions #
+#########################
+
+@functools.lru_cache(maxsize=None)
+def get_adapter(pool_maxsize: int = POOL_MAXSIZE) -> requests.adapters.HTTPAdapter:
+    """
+    Gives the transport adapter for a pool size. Sessions with the same pool size share the adapter,
+    so that sessions to the same host reuse each other's open (TLS) connections. Adapters are thread-safe.
+    """
+    return requests.adapters.HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=pool_maxsize, max_retries=RETRIES)
+
+
+class PooledSession(requests.Session):
+    """
+    Session with a shared keep-alive connection pool, compressed responses and default timeouts.
+    Base class of the API sessions. Records request metrics with response_hook.
+    """
+    def __init__(self, pool_maxsize: int = POOL_MAXSIZE, timeout: tuple[float, float] = (CONNECT_TIMEOUT, READ_TIMEOUT),
+                 response_hook=metrics.record_response) -> None:
+        super().__init__()
+        self.timeout = timeout
+        adapter = get_adapter(pool_maxsize)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+        self.headers.update({
+            "Accept-Encoding": ACCEPT_ENCODING,
+            "Connection": "keep-alive",
+            "User-Agent": "horizon_analyzer"})
+        self.hooks["response"].append(response_hook)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Sends a request with the session timeout unless the request has its own.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, **kwargs)
+
+    def close(self) -> None:
+        """
+        Leaves the shared connection pools open for the other sessions.
+        """
+        pass
@@ -0,0 +1,8 @@
+# standard
+import os
+import sys
+
+
+# Scripts import their sibling modules directly, as when they are run from the project directory
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(REPOSITORY_PATH, "src"), os.path.join(REPOSITORY_PATH, "benchmarks")]
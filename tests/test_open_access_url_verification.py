@@ -0,0 +1,48 @@
+# external
+import pytest
+# local
+from mock_servers import FILES_PATH, MISSING_FILES_PATH, SLOW_FILES_PATH, MockApiServer
+from open_access_url_verification import VERDICT_NOT_FOUND, VERDICT_PDF, VERDICT_UNREACHABLE, verify_URLs
+
+
+EMPTY_CORPUS = {
+    "ETIS_PROJECTS": [],
+    "ETIS_PUBLICATIONS": [],
+    "OPENAIRE_PROJECTS": [],
+    "OPEN_ACCESS_BUTTON_RECORDS": {},
+    "CITATION_COUNTS": {},
+}
+
+
+@pytest.fixture
+def mock_server():
+    with MockApiServer(EMPTY_CORPUS) as server:
+        yield server
+
+
+def test_verdicts(mock_server):
+    URLs = [
+        f'{mock_server.base_URL}{FILES_PATH}/1.pdf',
+        f'{mock_server.base_URL}{MISSING_FILES_PATH}/2.pdf',
+        f'{mock_server.base_URL}{SLOW_FILES_PATH}/3.pdf',
+    ]
+    verifications = verify_URLs(URLs, timeout=0.5)
+
+    assert [verification["URL"] for verification in verifications] == URLs
+    reachable, missing, slow = verifications
+    assert reachable["VERDICT"] == VERDICT_PDF
+    assert reachable["STATUS_CODE"] == 200
+    assert reachable["IS_PDF"]
+    assert missing["VERDICT"] == VERDICT_NOT_FOUND
+    assert missing["STATUS_CODE"] == 404
+    assert slow["VERDICT"] == VERDICT_UNREACHABLE
+    assert slow["STATUS_CODE"] is None
+
+
+def test_requests_per_host_are_limited(mock_server):
+    mock_server.latency = 0.05
+    URLs = [f'{mock_server.base_URL}{FILES_PATH}/{i}.pdf' for i in range(30)]
+    verifications = verify_URLs(URLs, max_workers=16, max_per_host=3)
+
+    assert all(verification["VERDICT"] == VERDICT_PDF for verification in verifications)
+    assert 1 < mock_server.max_active_file_requests <= 3
@@ -0,0 +1,50 @@
+# local
+from publication_clustering import cluster_publications
+
+
+LONG_TITLE = "Open access publishing in Horizon 2020 projects: a case study of Estonian research organisations"
+
+
+def test_near_identical_long_titles_are_merged():
+    cluster_IDs = cluster_publications(
+        GUIDs=["a", "b"],
+        DOIs=[None, "10.1000/1"],
+        titles=[LONG_TITLE, f'{LONG_TITLE.upper()}.'],
+        periodicals=["Journal A", "Journal B"])
+    assert cluster_IDs == ["a", "a"]
+
+
+def test_identical_short_titles_in_same_periodical_are_merged():
+    cluster_IDs = cluster_publications(
+        GUIDs=["a", "b", "c"],
+        DOIs=[None, "10.1000/1", None],
+        titles=["Soil carbon", "Soil Carbon.", "Soil carbon"],
+        periodicals=["Journal A", "journal a", "Journal B"])
+    assert cluster_IDs == ["a", "a", "c"]
+
+
+def test_short_titles_are_not_merged_by_similarity():
+    cluster_IDs = cluster_publications(
+        GUIDs=["a", "b"],
+        DOIs=[None, None],
+        titles=["Soil carbon", "Soil carbons"],
+        periodicals=["Journal A", "Journal A"])
+    assert cluster_IDs == ["a", "b"]
+
+
+def test_short_titles_with_different_DOIs_are_not_merged():
+    cluster_IDs = cluster_publications(
+        GUIDs=["a", "b", "c"],
+        DOIs=["10.1000/1", "10.1000/2", None],
+        titles=["Editorial", "Editorial", "Editorial"],
+        periodicals=["Journal A", "Journal A", "Journal A"])
+    assert cluster_IDs[0] != cluster_IDs[1]
+
+
+def test_short_titles_without_periodical_are_not_merged():
+    cluster_IDs = cluster_publications(
+        GUIDs=["a", "b"],
+        DOIs=[None, None],
+        titles=["Preface", "Preface"],
+        periodicals=[None, None])
+    assert cluster_IDs == ["a", "b"]